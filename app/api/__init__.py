@@ -1,4 +1,7 @@
 __all__ = [
+    "cache",
     "chat",
-    "history"
+    "history",
+    "metrics",
+    "usage"
 ]
\ No newline at end of file
@@ -0,0 +1,19 @@
+from typing import Annotated, Any, Literal, Optional
+from fastapi import APIRouter, Query
+
+from app.core.response_cache import response_cache
+
+router = APIRouter()
+
+@router.get("/cache/responses/stats")
+async def response_cache_stats() -> dict[str, Any]:
+    """Hit, miss and store counts of the response cache since startup."""
+    return response_cache.stats()
+
+@router.delete("/cache/responses")
+async def invalidate_response(
+    q: Annotated[str, Query(min_length=1)],
+    model: Optional[Literal["chat", "reasoning"]] = None,
+) -> dict[str, int]:
+    """Drop today's cached answers to a question, e.g. after a wrong or outdated answer."""
+    return {"removed": await response_cache.invalidate(q, model)}
@@ -1,125 +1,435 @@
-import json
+import asyncio
 import logging
 import os
-from typing import Any, Awaitable, Callable, Optional, Sequence, List
-import json_repair
-from datetime import datetime
+import time
+from contextlib import suppress
+from dataclasses import dataclass
+from typing import Annotated, Any, AsyncGenerator, Awaitable, Callable, Optional, Sequence, List
+from weakref import WeakValueDictionary
 
-import aiofiles
-import yaml
-from autogen_agentchat.agents import AssistantAgent, UserProxyAgent
 from autogen_agentchat.base import TaskResult
-from autogen_agentchat.messages import TextMessage, UserInputRequestedEvent, FunctionExecutionResult,ToolCallExecutionEvent, ToolCallRequestEvent
-from autogen_agentchat.teams import RoundRobinGroupChat, SelectorGroupChat
+from autogen_agentchat.messages import TextMessage, UserInputRequestedEvent, FunctionExecutionResult,ToolCallExecutionEvent, ToolCallRequestEvent, ModelClientStreamingChunkEvent
+from autogen_agentchat.teams import SelectorGroupChat
 from autogen_core import CancellationToken
-from autogen_core.models import ChatCompletionClient
-from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect, APIRouter
-from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
-from fastapi.staticfiles import StaticFiles
+from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect, APIRouter, Query
 
 from app.logger import logger
-from app.api.history import get_history
-from app.core.agents.orchestrator import get_team
-from app.core.tools.web_search import WebPage
-
-model_config_path = os.getenv("MODEL_CONFIG_PATH")
+from app.api.history import SessionId
+from app.api.outbox import Outbox, SlowClient
+from app.api.protocol import negotiate
+from app.core.agents.orchestrator import AGENT_MODELS, add_answered_turn, get_team, save_team_state, teams
+from app.core.agents.router import router as intent_router
+from app.core.metrics import Trace, current_trace, turn_seconds
+from app.core.ratelimit import QuotaExceeded, current_session
+from app.core.response_cache import conversation_context, response_cache
+from app.core.scheduler import ServerBusy, scheduler
+from app.core.store import store
+from app.core.tools.channel import ToolResultChannel, current_channel
 
 router = APIRouter()
 
-history_path = os.getenv("HISTORY_PATH")
-state_path = os.getenv("STATE_PATH")
+# Streamed model chunks are sent as one "delta" frame per window instead of one per token.
+STREAM_FLUSH_INTERVAL = float(os.getenv("STREAM_FLUSH_INTERVAL", "0.05"))
+STREAM_FLUSH_CHARS = int(os.getenv("STREAM_FLUSH_CHARS", "256"))
 
-@router.websocket("/ws/chat")
-async def chat(websocket: WebSocket):
-    await websocket.accept()
+# A session's team can only run one turn at a time, even with several sockets open.
+turn_locks: "WeakValueDictionary[str, asyncio.Lock]" = WeakValueDictionary()
+
+# Client frames for the typed results a tool publishes on the tool result channel.
+TOOL_FRAMES: dict[str, Callable[[Any], list[dict[str, Any]]]] = {
+    "get_relevant_web_pages": lambda webpage: [
+        {"source": webpage.url, "content": webpage.content, "type": "WebPageContent"}
+    ],
+}
+
+class DeltaCoalescer:
+    """Buffers streamed chunks and sends them as delta frames by time and size window.
+
+    A timer armed by the first chunk of each window flushes it on time even
+    if the stream stalls before the next chunk arrives.
+    """
+
+    def __init__(self, outbox: Outbox, interval: float = STREAM_FLUSH_INTERVAL, max_chars: int = STREAM_FLUSH_CHARS):
+        self.outbox = outbox
+        self.interval = interval
+        self.max_chars = max_chars
+        self.source: Optional[str] = None
+        self.parts: List[str] = []
+        self.size = 0
+        self.last_flush = time.monotonic()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._timed_flush: Optional[asyncio.Task] = None
+
+    async def add(self, source: str, content: str) -> None:
+        if source != self.source:
+            await self.flush()
+            self.source = source
+        if not self.parts:
+            delay = max(0.0, self.interval - (time.monotonic() - self.last_flush))
+            self._timer = asyncio.get_running_loop().call_later(delay, self._flush_on_time)
+        self.parts.append(content)
+        self.size += len(content)
+        if self.size >= self.max_chars or time.monotonic() - self.last_flush >= self.interval:
+            await self.flush()
+
+    def _flush_on_time(self) -> None:
+        self._timer = None
+        self._timed_flush = asyncio.ensure_future(self.flush())
+        # Raised to the turn by the next flush; don't also report it as unretrieved.
+        self._timed_flush.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+    async def flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        timed_flush = self._timed_flush
+        if timed_flush is not None and timed_flush is not asyncio.current_task():
+            # Let a timed flush still sending finish first, so frames stay in order.
+            self._timed_flush = None
+            await timed_flush
+        self.last_flush = time.monotonic()
+        if not self.parts:
+            return
+        content = "".join(self.parts)
+        self.parts.clear()
+        self.size = 0
+        await self.outbox.send_json({"type": "delta", "source": self.source, "content": content})
+
+    def close(self) -> None:
+        """Drop what is still buffered, e.g. when the turn ends early."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._timed_flush is not None:
+            self._timed_flush.cancel()
+            self._timed_flush = None
+        self.parts.clear()
+        self.size = 0
+
+class ToolResultForwarder:
+    """Sends what tools publish on the turn's channel to the client while they run."""
+
+    def __init__(self, outbox: Outbox, channel: ToolResultChannel):
+        self.outbox = outbox
+        self.channel = channel
+        self._task = asyncio.create_task(self._forward())
 
-    # User input function used by the team.
-    async def _user_input(prompt: str, cancellation_token: CancellationToken | None) -> str:
-        data = await websocket.receive_json()
-        message = TextMessage.model_validate(data)
-        return message.content
+    async def _forward(self) -> None:
+        while True:
+            tool_name, value = await self.channel.get()
+            try:
+                for frame in TOOL_FRAMES[tool_name](value) if tool_name in TOOL_FRAMES else []:
+                    await self.outbox.send_json(frame)
+            finally:
+                self.channel.done()
+
+    async def flush(self) -> None:
+        """Wait until everything published so far has been sent."""
+        joined = asyncio.ensure_future(self.channel.join())
+        try:
+            await asyncio.wait([joined, self._task], return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            joined.cancel()
+        if self._task.done():
+            # Sending failed, e.g. the client is too slow; raise why.
+            self._task.result()
+
+    def close(self) -> None:
+        if self._task.done() and not self._task.cancelled():
+            # Already raised to the turn by `flush`, or moot once the turn has ended.
+            self._task.exception()
+        self._task.cancel()
+
+@dataclass
+class TurnOutcome:
+    answer: Optional[TextMessage] = None
+    used_web: bool = False
 
+async def run_turn(
+    outbox: Outbox, session_id: str, request: TextMessage, cancellation_token: CancellationToken
+) -> None:
+    """Run one user turn through the session's team and stream it to the client.
+
+    Cancelling `cancellation_token` stops the team's model calls and tools
+    and raises CancelledError; nothing of the turn is checkpointed.
+    """
+    # Get the team and respond to the message.
+    team = await get_team(session_id)
+    cached, context = None, ""
+    if response_cache.enabled:
+        # Follow-ups ("yes", "what about yesterday?") only hit after the same earlier turns.
+        context = conversation_context(await store.get_messages(session_id))
+        decision = intent_router.route(request.content, lookahead=True)
+        cached = await response_cache.get(request.content, decision.model if decision else None, context)
+    if cached is not None:
+        answer = TextMessage(source=cached["source"], content=cached["content"])
+        await _send_cached_turn(outbox, session_id, request, answer)
+        await add_answered_turn(session_id, request, answer)
+    else:
+        channel = ToolResultChannel()
+        channel_token = current_channel.set(channel)
+        try:
+            outcome = await _stream_turn(outbox, session_id, team, request, channel, cancellation_token)
+        finally:
+            current_channel.reset(channel_token)
+        if cancellation_token.is_cancelled():
+            raise asyncio.CancelledError()
+        if outcome.answer is not None:
+            await response_cache.set(
+                request.content,
+                AGENT_MODELS[outcome.answer.source],
+                {"source": outcome.answer.source, "content": outcome.answer.content},
+                used_web=outcome.used_web,
+                context=context,
+            )
+
+    state = await team.save_state()
+    # The turn is over; let the client send the next message.
+    await outbox.send_json({
+        "type": "UserInputRequestedEvent",
+        "content": "",
+        "source": "user"
+    })
+    # Checkpoint team state once per turn.
+    await save_team_state(session_id, state)
+
+async def _send_cached_turn(outbox: Outbox, session_id: str, request: TextMessage, answer: TextMessage) -> None:
+    for message in (request, answer):
+        payload = message.model_dump()
+        payload["id"] = await store.append_message(session_id, payload)
+        await outbox.send_json(payload)
+
+async def _stream_turn(
+    outbox: Outbox,
+    session_id: str,
+    team: SelectorGroupChat,
+    request: TextMessage,
+    channel: ToolResultChannel,
+    cancellation_token: CancellationToken,
+) -> TurnOutcome:
+    outcome = TurnOutcome()
+    tool_results = ToolResultForwarder(outbox, channel)
+    stream = team.run_stream(task=request, cancellation_token=cancellation_token)
+    deltas = DeltaCoalescer(outbox)
+    try:
+        await _forward_stream(outbox, session_id, stream, tool_results, deltas, cancellation_token, outcome)
+    except BaseException:
+        # Stop the team's remaining work before leaving the stream.
+        cancellation_token.cancel()
+        with suppress(Exception):
+            await stream.aclose()
+        raise
+    finally:
+        tool_results.close()
+        deltas.close()
+    return outcome
+
+async def _forward_stream(
+    outbox: Outbox,
+    session_id: str,
+    stream: AsyncGenerator,
+    tool_results: ToolResultForwarder,
+    deltas: DeltaCoalescer,
+    cancellation_token: CancellationToken,
+    outcome: TurnOutcome,
+) -> None:
+    async for message in stream:
+        if cancellation_token.is_cancelled():
+            # Nothing produced after a stop is shown or saved.
+            raise asyncio.CancelledError()
+        if isinstance(message, ModelClientStreamingChunkEvent):
+            if message.content:
+                await deltas.add(message.source, message.content)
+            continue
+        # Anything else ends the current run of chunks; the final message replaces them.
+        await deltas.flush()
+        if isinstance(message, TaskResult):
+            continue
+        if isinstance(message, ToolCallRequestEvent):
+            message = TextMessage(
+                source="WebSearchTool",
+                content="Conducting web search..."
+            )
+        if isinstance(message, ToolCallExecutionEvent):
+            logger.debug("tool results session=%s calls=%d", session_id, len(message.content))
+            function_results = message.content
+            for result in function_results:
+                if isinstance(result, FunctionExecutionResult) and result.name == "get_relevant_web_pages":
+                    outcome.used_web = True
+            # Results published while the tools ran go out before the answer written from them.
+            await tool_results.flush()
+            continue
+        if isinstance(message, TextMessage) and message.source in AGENT_MODELS:
+            outcome.answer = message
+        logger.debug("message session=%s source=%s type=%s", session_id, message.source, message.type)
+        payload = message.model_dump()
+        if not isinstance(message, UserInputRequestedEvent):
+            # Don't save user input events to history. Saved messages carry
+            # their history id, which clients resume from.
+            payload["id"] = await store.append_message(session_id, payload)
+        await outbox.send_json(payload)
+
+@dataclass
+class ClientInbox:
+    """Messages from one websocket, read while a turn runs so they can cancel it."""
+    requests: asyncio.Queue
+    turn: Optional[CancellationToken] = None
+    disconnected: bool = False
+
+    def cancel_turn(self) -> None:
+        if self.turn is not None:
+            self.turn.cancel()
+
+async def _read_client(websocket: WebSocket, inbox: ClientInbox) -> None:
     try:
         while True:
-            # Get user message.
             data = await websocket.receive_json()
+            if data.get("type") == "stop":
+                # "Stop generating": drop the rest of the current turn.
+                inbox.cancel_turn()
+                continue
             request = TextMessage.model_validate(data)
-            print(request)
+            # A new message supersedes the turn still running.
+            inbox.cancel_turn()
+            await inbox.requests.put(request)
+    except WebSocketDisconnect:
+        inbox.disconnected = True
+        inbox.cancel_turn()
+        raise
+    finally:
+        inbox.requests.put_nowait(None)
 
+def _finish_trace(trace: Trace, outcome: str) -> None:
+    seconds = time.perf_counter() - trace.started
+    turn_seconds.observe(seconds, outcome=outcome)
+    logger.info("turn session=%s outcome=%s seconds=%.3f spans=%s", trace.name, outcome, seconds, trace.breakdown())
+    if logger.isEnabledFor(logging.DEBUG):
+        for name, start, duration, attributes in trace.spans:
+            logger.debug("span session=%s name=%s start=%.3f seconds=%.3f %s", trace.name, name, start, duration, attributes)
+
+def _turn_pool(request: TextMessage) -> str:
+    # The router's guess; turns it can't place start as chat, by far the common case,
+    # and move to the reasoning pool if the IntentAgent routes them there.
+    decision = intent_router.route(request.content, lookahead=True)
+    return decision.model if decision else "chat"
+
+@router.websocket("/ws/chat")
+async def chat(
+    websocket: WebSocket,
+    session_id: SessionId = "default",
+    resume: Annotated[Optional[int], Query(ge=0)] = None,
+):
+    wire = negotiate(websocket)
+    await websocket.accept(subprotocol=wire.subprotocol)
+    turn_lock = turn_locks.setdefault(session_id, asyncio.Lock())
+    outbox = Outbox(websocket, wire)
+    inbox = ClientInbox(requests=asyncio.Queue())
+    reader = asyncio.create_task(_read_client(websocket, inbox))
+
+    try:
+        if resume is not None:
+            # The client has everything up to `resume`; send only what it missed.
+            for message in await store.get_messages(session_id, after=resume):
+                await outbox.send_json(message)
+        while True:
+            # Get user message.
+            request = await inbox.requests.get()
+            if request is None:
+                # Raises why the client went away.
+                await reader
+                break
+            inbox.turn = CancellationToken()
+            trace = Trace(session_id)
+            trace_token = current_trace.set(trace)
+            session_token = current_session.set(session_id)
+            outcome = "error"
             try:
-                print("Getting team")
-                # Get the team and respond to the message.
-                team = await get_team(_user_input)
-                history = await get_history()
-                stream = team.run_stream(task=request)
-                async for message in stream:
-                    if isinstance(message, TaskResult):
-                        continue
-                    if isinstance(message, ToolCallRequestEvent):
-                        message = TextMessage(
-                            source="WebSearchTool",
-                            content="Conducting web search..."
-                        )
-                    if isinstance(message, ToolCallExecutionEvent):
-                        print("tool output -------- ", message)
-                        
-                        function_results = message.content
-                        for result in function_results:
-                            if isinstance(result, FunctionExecutionResult) and not result.is_error and result.name == "get_relevant_web_pages":
-                                webpages = eval(result.content)  # This assumes result.content is a string representation of a list
-                                for webpage in webpages:
-                                    print("inside web page -----", webpage.url)
-                                    await websocket.send_json({
-                                        "source": webpage.url,
-                                        "content": webpage.content,
-                                        "type": "WebPageContent"
-                                    })
-                        continue
-                    print(message)
-                    await websocket.send_json(message.model_dump())
-                    if not isinstance(message, UserInputRequestedEvent):
-                        # Don't save user input events to history.
-                        history.append(message.model_dump())
-                        print(message.model_dump())
-
-                    # Save team state to file.
-                    print("before Saving state")
-                    async with aiofiles.open(state_path, "w") as file:
-                        print("saving state")
-                        state = await team.save_state()
-                        await file.write(json.dumps(state))
-
-                    # Save chat history to file.
-                    print("before Saving history")
-                    async with aiofiles.open(history_path, "w") as file:
-                        print("saving history")
-                        await file.write(json.dumps(history))
-                    
+                async with turn_lock, scheduler.admit(_turn_pool(request)):
+                    await run_turn(outbox, session_id, request, inbox.turn)
+                outcome = "ok"
+            except ServerBusy:
+                outcome = "busy"
+                await outbox.send_json({
+                    "type": "busy",
+                    "content": "The server is busy. Please try again in a moment.",
+                    "source": "system"
+                })
+                await outbox.send_json({
+                    "type": "UserInputRequestedEvent",
+                    "content": "",
+                    "source": "user"
+                })
+            except QuotaExceeded:
+                outcome = "throttled"
+                # The team may have stopped mid-run; rebuild it from saved state next turn.
+                teams.evict(session_id)
+                if inbox.disconnected:
+                    break
+                await outbox.send_json({
+                    "type": "busy",
+                    "content": "You have reached your usage limit for now. Please try again in a minute.",
+                    "source": "system"
+                })
+                await outbox.send_json({
+                    "type": "UserInputRequestedEvent",
+                    "content": "",
+                    "source": "user"
+                })
+            except asyncio.CancelledError:
+                if not inbox.turn.is_cancelled():
+                    raise
+                outcome = "cancelled"
+                # The team stopped mid-run; rebuild it from the last checkpoint next turn.
+                teams.evict(session_id)
+                if inbox.disconnected:
+                    break
+                await outbox.send_json({"type": "cancelled", "content": "", "source": "system"})
+                await outbox.send_json({
+                    "type": "UserInputRequestedEvent",
+                    "content": "",
+                    "source": "user"
+                })
+            except SlowClient as e:
+                # Nothing more can be sent to this client in good time.
+                logger.warning(f"Dropping slow client of session {session_id}: {e}")
+                teams.evict(session_id)
+                break
             except Exception as e:
+                # The team may have stopped mid-run; rebuild it from saved state next turn.
+                teams.evict(session_id)
+                if inbox.disconnected:
+                    break
                 # Send error message to client
                 error_message = {
                     "type": "error",
                     "content": f"Error: {str(e)}",
                     "source": "system"
                 }
-                await websocket.send_json(error_message)
+                await outbox.send_json(error_message)
                 # Re-enable input after error
-                await websocket.send_json({
+                await outbox.send_json({
                     "type": "UserInputRequestedEvent",
                     "content": "An error occurred. Please try again.",
                     "source": "system"
                 })
+            finally:
+                inbox.turn = None
+                current_session.reset(session_token)
+                current_trace.reset(trace_token)
+                _finish_trace(trace, outcome)
                 
     except WebSocketDisconnect:
         logger.info("Client disconnected")
     except Exception as e:
         logger.error(f"Unexpected error: {str(e)}")
         try:
-            await websocket.send_json({
+            await outbox.send_json({
                 "type": "error",
                 "content": f"Unexpected error: {str(e)}",
                 "source": "system"
             })
         except:
-            pass
\ No newline at end of file
+            pass
+    finally:
+        reader.cancel()
+        await outbox.close()
@@ -1,36 +1,57 @@
-import os
-import aiofiles
-import json
-from typing import Any
-from fastapi import HTTPException, APIRouter
+from typing import Annotated, Any, Optional
+from fastapi import HTTPException, APIRouter, Query
+from pydantic import BaseModel
 
 from app.logger import logger
-
-history_path = os.getenv("HISTORY_PATH")
-state_path = os.getenv("STATE_PATH")
+from app.core.agents.orchestrator import teams
+from app.core.store import store
 
 router = APIRouter()
 
-async def get_history() -> list[dict[str, Any]]:
-    """Get chat history from file."""
-    if not os.path.exists(history_path):
-        return []
-    async with aiofiles.open(history_path, "r") as file:
-        return json.loads(await file.read())
+# Conversations are scoped by a client-chosen session id.
+SessionId = Annotated[str, Query(pattern=r"^[A-Za-z0-9_-]{1,64}$")]
+
+class HistoryPage(BaseModel):
+    messages: list[dict[str, Any]]
+    # Pass as `before` to fetch the previous page; None once the start is reached.
+    next_cursor: Optional[int]
+
+async def get_history(
+    session_id: str, before: Optional[int] = None, limit: Optional[int] = None
+) -> list[dict[str, Any]]:
+    """Get a session's chat history, optionally only the page before a cursor."""
+    return await store.get_messages(session_id, before=before, limit=limit)
 
 
 @router.get("/history")
-async def history() -> list[dict[str, Any]]:
+async def history(
+    session_id: SessionId = "default",
+    before: Annotated[Optional[int], Query(ge=1)] = None,
+    limit: Annotated[int, Query(ge=1, le=500)] = 50,
+) -> HistoryPage:
+    try:
+        messages = await get_history(session_id, before=before, limit=limit)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e)) from e
+    next_cursor = messages[0]["id"] if len(messages) == limit else None
+    return HistoryPage(messages=messages, next_cursor=next_cursor)
+
+@router.get("/history/search")
+async def search_history(
+    q: Annotated[str, Query(min_length=1, max_length=500)],
+    session_id: SessionId = "default",
+    limit: Annotated[int, Query(ge=1, le=100)] = 20,
+) -> list[dict[str, Any]]:
     try:
-        return await get_history()
+        return await store.search_messages(session_id, q, limit=limit)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e)) from e
     
 @router.get("/history/clear")
-async def clear_history() -> None:
+async def clear_history(session_id: SessionId = "default") -> None:
     try:
-        async with aiofiles.open(history_path, "w") as file:
-            await file.write(json.dumps([]))
-        os.remove(state_path)
+        await store.clear(session_id)
+        # Drop the warm team so nobody keeps talking to the cleared context.
+        teams.evict(session_id)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e)) from e
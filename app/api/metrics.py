@@ -0,0 +1,28 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from app.core.agents.clients import speculation_counters
+from app.core.agents.registry import model_clients
+from app.core.agents.router import router as intent_router
+from app.core.metrics import metrics
+from app.core.ratelimit import quotas
+from app.core.response_cache import response_cache
+from app.core.scheduler import scheduler
+from app.core.tools.cache import content_cache
+from app.core.tools.search import searcher
+
+router = APIRouter()
+
+metrics.collect("kijang_content_cache", "Page and summary cache hits, misses and evictions by tier.", content_cache.stats)
+metrics.collect("kijang_response_cache", "Response cache hits, misses, stores and hit rate.", response_cache.stats)
+metrics.collect("kijang_search_cache", "Search result cache hits, misses and shared in-flight searches.", lambda: searcher.counters)
+metrics.collect("kijang_router", "Turns routed locally by tier, and fallbacks to the IntentAgent.", lambda: intent_router.counters)
+metrics.collect("kijang_speculation", "Speculative chat calls started, hit, missed, cancelled and tokens wasted.", lambda: speculation_counters)
+metrics.collect("kijang_model_backends", "Circuit breaker state and p95 latencies per model backend.", model_clients.backend_stats)
+metrics.collect("kijang_quota", "Model calls throttled and rejected by session and model token quotas.", quotas.stats)
+metrics.collect("kijang_scheduler", "Turns admitted, shed, running and waiting by pool.", scheduler.stats)
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics() -> PlainTextResponse:
+    """Metrics in the Prometheus text exposition format."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,108 @@
+import asyncio
+import os
+import time
+from collections import deque
+from typing import Any, Optional
+
+from fastapi import WebSocket
+
+from app.api.protocol import WireFormat, send
+from app.core.metrics import metrics
+
+# Frames queued per connection before senders have to wait for the client.
+OUTBOX_FRAMES = int(os.getenv("OUTBOX_FRAMES", "256"))
+# Seconds a sender waits for queue space before the client is given up on.
+OUTBOX_SEND_TIMEOUT = float(os.getenv("OUTBOX_SEND_TIMEOUT", "10"))
+
+send_seconds = metrics.histogram("kijang_ws_send_seconds", "Time to write one frame to a websocket.")
+queue_wait_seconds = metrics.histogram("kijang_ws_queue_wait_seconds", "Time senders waited for space in a full outbound queue.")
+
+
+class SlowClient(Exception):
+    """Raised when a client reads too slowly to keep its outbound queue bounded."""
+
+
+class Outbox:
+    """Bounded outbound queue for one websocket, written by a single task.
+
+    While a slow client falls behind, queued `delta` frames from the same
+    source are merged, so streaming costs one frame per catch-up rather
+    than one per window. Senders wait when the queue is full, and fail with
+    SlowClient once that takes longer than `send_timeout`. Frames are encoded
+    in the connection's negotiated `wire` format, which may gather the frames
+    queued within a short window into one websocket message.
+    """
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        wire: Optional[WireFormat] = None,
+        max_frames: int = OUTBOX_FRAMES,
+        send_timeout: float = OUTBOX_SEND_TIMEOUT,
+    ):
+        self.websocket = websocket
+        self.wire = wire or WireFormat()
+        self.max_frames = max_frames
+        self.send_timeout = send_timeout
+        self._frames: deque[dict[str, Any]] = deque()
+        self._queued = asyncio.Event()
+        self._space = asyncio.Event()
+        self._drained = asyncio.Event()
+        self._drained.set()
+        self._error: Optional[BaseException] = None
+        self._writer = asyncio.create_task(self._write())
+
+    async def send_json(self, frame: dict[str, Any]) -> None:
+        if self._error is not None:
+            raise self._error
+        last = self._frames[-1] if self._frames else None
+        if (
+            last is not None
+            and frame.get("type") == "delta"
+            and last.get("type") == "delta"
+            and last.get("source") == frame.get("source")
+        ):
+            last["content"] += frame["content"]
+            return
+        waited = time.perf_counter()
+        while len(self._frames) >= self.max_frames:
+            self._space.clear()
+            try:
+                await asyncio.wait_for(self._space.wait(), self.send_timeout)
+            except asyncio.TimeoutError:
+                raise SlowClient(f"Client fell {len(self._frames)} frames behind")
+            if self._error is not None:
+                raise self._error
+            queue_wait_seconds.observe(time.perf_counter() - waited)
+        self._frames.append(frame)
+        self._drained.clear()
+        self._queued.set()
+
+    async def _write(self) -> None:
+        try:
+            while True:
+                while not self._frames:
+                    self._queued.clear()
+                    await self._queued.wait()
+                if self.wire.batch_window > 0:
+                    await asyncio.sleep(self.wire.batch_window)
+                # Taken off the queue before sending, so they are no longer merged into.
+                frames = [self._frames.popleft() for _ in range(min(len(self._frames), self.wire.batch_frames))]
+                self._space.set()
+                started = time.perf_counter()
+                await send(self.websocket, self.wire, frames)
+                send_seconds.observe(time.perf_counter() - started)
+                if not self._frames:
+                    self._drained.set()
+        except Exception as e:
+            self._error = e
+            self._space.set()
+            self._drained.set()
+
+    async def close(self, timeout: float = 1.0) -> None:
+        """Give queued frames a moment to go out, then stop the writer."""
+        try:
+            await asyncio.wait_for(self._drained.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self._writer.cancel()
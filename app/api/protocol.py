@@ -0,0 +1,130 @@
+import json
+import os
+from functools import lru_cache
+from typing import Any, Optional, Sequence, Union
+
+from fastapi import WebSocket
+
+from app.core.metrics import metrics
+from app.logger import logger
+
+# Seconds the outbox waits to gather small frames into one websocket message (compact protocols only).
+WS_BATCH_WINDOW = float(os.getenv("WS_BATCH_WINDOW", "0.02"))
+# Most frames sent in one websocket message.
+WS_BATCH_FRAMES = int(os.getenv("WS_BATCH_FRAMES", "32"))
+
+sent_bytes = metrics.counter("kijang_ws_sent_bytes_total", "Bytes written to websockets before compression, by protocol.")
+
+# Frame types and their one-letter compact codes.
+TYPE_CODES = {
+    "delta": "d",
+    "TextMessage": "m",
+    "WebPageContent": "w",
+    "UserInputRequestedEvent": "i",
+    "cancelled": "x",
+    "busy": "b",
+    "error": "e",
+}
+
+
+@lru_cache(maxsize=1)
+def _msgpack() -> Optional[Any]:
+    try:
+        import msgpack
+    except ImportError:
+        logger.info("msgpack not installed; the kijang.v2.msgpack protocol is disabled")
+        return None
+    return msgpack
+
+
+class WireFormat:
+    """The original protocol: every frame is its own JSON text message, sent in full."""
+
+    subprotocol: Optional[str] = None
+    batch_window = 0.0
+    batch_frames = 1
+
+    def encode(self, frames: Sequence[dict[str, Any]]) -> Union[str, bytes]:
+        (frame,) = frames
+        return json.dumps(frame, separators=(",", ":"), ensure_ascii=False)
+
+
+class CompactWireFormat(WireFormat):
+    """Frames as short-keyed objects, batched into an array per websocket message.
+
+    A frame is `{"t": <type code>, "s": <source>, "c": <content>, "n": <seq>}`,
+    leaving out empty fields and message metadata; `n` is the history id of a
+    saved message, which clients pass back as `resume` when they reconnect. A
+    final message that directly follows the deltas it was streamed as, from
+    the same source and with the same text, is sent as `"d": 1` instead of
+    repeating the content.
+
+    One instance encodes one connection's frames, in order.
+    """
+
+    def __init__(self, binary: bool):
+        self.binary = binary
+        self.subprotocol = "kijang.v2.msgpack" if binary else "kijang.v2.json"
+        self.batch_window = WS_BATCH_WINDOW
+        self.batch_frames = WS_BATCH_FRAMES
+        # Source and text of the deltas sent since the last other frame.
+        self._run_source: Optional[str] = None
+        self._run: list[str] = []
+
+    def compact(self, frame: dict[str, Any]) -> dict[str, Any]:
+        type = frame.get("type", "TextMessage")
+        source = frame.get("source")
+        content = frame.get("content")
+        compact: dict[str, Any] = {"t": TYPE_CODES.get(type, type)}
+        if source:
+            compact["s"] = source
+        if type == "delta":
+            if source != self._run_source:
+                self._run_source, self._run = source, []
+            self._run.append(content)
+        else:
+            if type == "TextMessage" and content and source == self._run_source and "".join(self._run) == content:
+                compact["d"] = 1
+                content = None
+            self._run_source, self._run = None, []
+        if content:
+            compact["c"] = content
+        if frame.get("id") is not None:
+            compact["n"] = frame["id"]
+        return compact
+
+    def encode(self, frames: Sequence[dict[str, Any]]) -> Union[str, bytes]:
+        batch: list[dict[str, Any]] = []
+        for frame in frames:
+            frame = self.compact(frame)
+            last = batch[-1] if batch else None
+            if last is not None and frame["t"] == last["t"] == "d" and frame.get("s") == last.get("s"):
+                last["c"] = last.get("c", "") + frame.get("c", "")
+            else:
+                batch.append(frame)
+        if self.binary:
+            return _msgpack().packb(batch)
+        return json.dumps(batch, separators=(",", ":"), ensure_ascii=False)
+
+
+def negotiate(websocket: WebSocket) -> WireFormat:
+    """Pick the first compact protocol the client offers that this worker supports.
+
+    Clients that offer none get the original protocol.
+    """
+    for subprotocol in websocket.scope.get("subprotocols", []):
+        if subprotocol == "kijang.v2.json":
+            return CompactWireFormat(binary=False)
+        if subprotocol == "kijang.v2.msgpack" and _msgpack() is not None:
+            return CompactWireFormat(binary=True)
+    return WireFormat()
+
+
+async def send(websocket: WebSocket, wire: WireFormat, frames: Sequence[dict[str, Any]]) -> None:
+    """Encode `frames` as one websocket message and send it."""
+    data = wire.encode(frames)
+    sent_bytes.inc(len(data) if isinstance(data, bytes) else len(data.encode()), protocol=wire.subprotocol or "kijang.v1")
+    if isinstance(data, bytes):
+        await websocket.send_bytes(data)
+    else:
+        await websocket.send_text(data)
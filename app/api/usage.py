@@ -0,0 +1,17 @@
+from typing import Any
+from fastapi import APIRouter
+
+from app.api.history import SessionId
+from app.core.ratelimit import quotas
+
+router = APIRouter()
+
+@router.get("/usage")
+async def session_usage(session_id: SessionId = "default") -> dict[str, Any]:
+    """Model tokens a session has used on this worker, and what its quota has left."""
+    return {"session_id": session_id, **quotas.session_usage(session_id)}
+
+@router.get("/usage/models")
+async def model_usage() -> dict[str, dict[str, Any]]:
+    """Model tokens used per model on this worker, and what each model's quota has left."""
+    return quotas.model_usage()
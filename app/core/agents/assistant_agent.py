@@ -1,40 +1,55 @@
-import os
-import aiofiles
-import yaml
-from dotenv import load_dotenv
-from typing import Any
+from typing import Any, Iterable, Optional
 
 from autogen_agentchat.agents import AssistantAgent
-from autogen_core.models import ChatCompletionClient
+from autogen_core.models import SystemMessage, UserMessage
+from autogen_core.tools import FunctionTool
 
+from app.core.agents.clients import PooledChatCompletionClient, SpeculativeChatCompletionClient
+from app.core.agents.context import RoutedChatCompletionContext, context_budget
+from app.core.agents.registry import model_clients
 from app.core.tools.web_search import get_relevant_web_pages
 
-model_config_path = os.getenv("MODEL_CONFIG_PATH")
-            
 class KijangAgent:
-    def __init__(self, name: str, model: str, system_message: str):
+    def __init__(
+        self,
+        name: str,
+        model: str,
+        system_message: str,
+        ignored_sources: Iterable[str] = (),
+        speculative: bool = False,
+        pool: Optional[str] = None,
+    ):
         self.name = name
         self.model = model
         self.system_message = system_message
+        self.speculative = speculative
+        # The scheduler pool its turns run in, once it is picked to answer.
+        self.pool = pool
+        self.model_context = RoutedChatCompletionContext(ignored_sources, token_budget=context_budget(model))
+        self.tools = [FunctionTool(get_relevant_web_pages, description="")]
         self.model_client = None
         self.agent = None
 
     @classmethod
-    async def create(cls, name: str, model: str, system_message: str) -> "KijangAgent":  # Fix return type
-        instance = cls(name, model, system_message)
+    async def create(
+        cls,
+        name: str,
+        model: str,
+        system_message: str,
+        ignored_sources: Iterable[str] = (),
+        speculative: bool = False,
+        pool: Optional[str] = None,
+    ) -> "KijangAgent":
+        instance = cls(name, model, system_message, ignored_sources, speculative, pool)
         instance.model_client = await instance.get_model_client()
         instance.agent = instance.initialize_agent()
-        return instance.agent
+        return instance
 
     async def get_model_client(self):
-        try:
-            async with aiofiles.open(model_config_path, "r") as file:  # Add error handling
-                configs = yaml.safe_load(await file.read())
-                model_config = configs['models'][self.model]
-                print("init model config", model_config)
-            return ChatCompletionClient.load_component(model_config)
-        except (FileNotFoundError, yaml.YAMLError) as e:
-            raise RuntimeError(f"Failed to load model config: {e}")
+        client = model_clients.get(self.model)
+        if self.pool is not None:
+            client = PooledChatCompletionClient(client, self.pool)
+        return SpeculativeChatCompletionClient(client) if self.speculative else client
 
     def initialize_agent(self):
         if not self.model_client:
@@ -43,7 +58,28 @@ class KijangAgent:
             name=self.name,
             model_client=self.model_client,
             system_message=self.system_message,
-            tools=[get_relevant_web_pages],
+            tools=self.tools,
+            model_context=self.model_context,
+            model_client_stream=True,
             reflect_on_tool_use=True,
             tool_call_summary_format=True
-        )
\ No newline at end of file
+        )
+
+    def speculate(self, task: str) -> None:
+        """Start answering `task` before routing has picked this agent."""
+        if not self.speculative:
+            return
+
+        async def prepare():
+            # Mirrors the prompt AssistantAgent builds when it is given the task.
+            return [
+                SystemMessage(content=self.system_message),
+                *await self.model_context.get_messages(),
+                UserMessage(content=task, source="user"),
+            ]
+
+        self.model_client.speculate(prepare, self.tools)
+
+    def cancel_speculation(self) -> None:
+        if self.speculative:
+            self.model_client.cancel()
@@ -0,0 +1,478 @@
+import asyncio
+import json
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any, AsyncGenerator, Awaitable, Callable, Mapping, Optional, Sequence, Union
+
+from autogen_core import CancellationToken
+from autogen_core.models import (
+    ChatCompletionClient,
+    CreateResult,
+    LLMMessage,
+    ModelCapabilities,
+    ModelInfo,
+    RequestUsage,
+)
+from autogen_core.tools import Tool, ToolSchema
+
+from app.core.metrics import model_tokens, span
+from app.core.ratelimit import quotas
+from app.core.scheduler import scheduler
+from app.core.tokens import CHARS_PER_TOKEN, count_tokens
+from app.logger import logger
+
+
+class DelegatingChatCompletionClient(ChatCompletionClient):
+    """Base for clients that wrap another client and forward everything to it.
+
+    Wrapped clients come from the shared registry, so closing a wrapper does
+    not close them.
+    """
+
+    def __init__(self, client: ChatCompletionClient):
+        self._client = client
+
+    async def create(
+        self,
+        messages: Sequence[LLMMessage],
+        *,
+        tools: Sequence[Tool | ToolSchema] = [],
+        json_output: Optional[bool] = None,
+        extra_create_args: Mapping[str, Any] = {},
+        cancellation_token: Optional[CancellationToken] = None,
+    ) -> CreateResult:
+        return await self._client.create(
+            messages,
+            tools=tools,
+            json_output=json_output,
+            extra_create_args=extra_create_args,
+            cancellation_token=cancellation_token,
+        )
+
+    def create_stream(
+        self,
+        messages: Sequence[LLMMessage],
+        *,
+        tools: Sequence[Tool | ToolSchema] = [],
+        json_output: Optional[bool] = None,
+        extra_create_args: Mapping[str, Any] = {},
+        cancellation_token: Optional[CancellationToken] = None,
+    ) -> AsyncGenerator[Union[str, CreateResult], None]:
+        return self._client.create_stream(
+            messages,
+            tools=tools,
+            json_output=json_output,
+            extra_create_args=extra_create_args,
+            cancellation_token=cancellation_token,
+        )
+
+    async def close(self) -> None:
+        pass
+
+    def actual_usage(self) -> RequestUsage:
+        return self._client.actual_usage()
+
+    def total_usage(self) -> RequestUsage:
+        return self._client.total_usage()
+
+    def count_tokens(self, messages: Sequence[LLMMessage], *, tools: Sequence[Tool | ToolSchema] = []) -> int:
+        return self._client.count_tokens(messages, tools=tools)
+
+    def remaining_tokens(self, messages: Sequence[LLMMessage], *, tools: Sequence[Tool | ToolSchema] = []) -> int:
+        return self._client.remaining_tokens(messages, tools=tools)
+
+    @property
+    def capabilities(self) -> ModelCapabilities:  # type: ignore
+        return self._client.capabilities
+
+    @property
+    def model_info(self) -> ModelInfo:
+        return self._client.model_info
+
+
+class InstrumentedChatCompletionClient(DelegatingChatCompletionClient):
+    """Traces every call to the wrapped client and counts its tokens under `name`.
+
+    The registry builds one per shared client and owns the wrapped client, so
+    closing it closes the wrapped client too.
+    """
+
+    def __init__(self, client: ChatCompletionClient, name: str):
+        super().__init__(client)
+        self.name = name
+
+    def _record(self, result: CreateResult, attributes: dict[str, Any]) -> None:
+        attributes["prompt_tokens"] = result.usage.prompt_tokens
+        attributes["completion_tokens"] = result.usage.completion_tokens
+        model_tokens.inc(result.usage.prompt_tokens, client=self.name, kind="prompt")
+        model_tokens.inc(result.usage.completion_tokens, client=self.name, kind="completion")
+
+    async def create(
+        self,
+        messages: Sequence[LLMMessage],
+        *,
+        tools: Sequence[Tool | ToolSchema] = [],
+        json_output: Optional[bool] = None,
+        extra_create_args: Mapping[str, Any] = {},
+        cancellation_token: Optional[CancellationToken] = None,
+    ) -> CreateResult:
+        with span(f"model:{self.name}") as attributes:
+            result = await super().create(
+                messages,
+                tools=tools,
+                json_output=json_output,
+                extra_create_args=extra_create_args,
+                cancellation_token=cancellation_token,
+            )
+            self._record(result, attributes)
+        return result
+
+    async def create_stream(
+        self,
+        messages: Sequence[LLMMessage],
+        *,
+        tools: Sequence[Tool | ToolSchema] = [],
+        json_output: Optional[bool] = None,
+        extra_create_args: Mapping[str, Any] = {},
+        cancellation_token: Optional[CancellationToken] = None,
+    ) -> AsyncGenerator[Union[str, CreateResult], None]:
+        with span(f"model:{self.name}") as attributes:
+            started = time.perf_counter()
+            async for item in super().create_stream(
+                messages,
+                tools=tools,
+                json_output=json_output,
+                extra_create_args=extra_create_args,
+                cancellation_token=cancellation_token,
+            ):
+                if isinstance(item, CreateResult):
+                    self._record(item, attributes)
+                elif "first_chunk_seconds" not in attributes:
+                    attributes["first_chunk_seconds"] = round(time.perf_counter() - started, 4)
+                yield item
+
+    async def close(self) -> None:
+        await self._client.close()
+
+
+class QuotaChatCompletionClient(DelegatingChatCompletionClient):
+    """Charges every call to the token quotas of `model` and the current session.
+
+    A call first reserves its estimated prompt tokens, waiting while either
+    quota is short, and settles against its reported usage when it finishes.
+    The registry builds one per model backend and owns the wrapped client,
+    so closing it closes the wrapped client too.
+    """
+
+    def __init__(self, client: ChatCompletionClient, model: str):
+        super().__init__(client)
+        self.model = model
+
+    @staticmethod
+    def _estimate(messages: Sequence[LLMMessage]) -> int:
+        # Settled against the real count afterwards, so a cheap estimate will do.
+        return sum(len(str(message.content)) for message in messages) // CHARS_PER_TOKEN + 1
+
+    async def create(
+        self,
+        messages: Sequence[LLMMessage],
+        *,
+        tools: Sequence[Tool | ToolSchema] = [],
+        json_output: Optional[bool] = None,
+        extra_create_args: Mapping[str, Any] = {},
+        cancellation_token: Optional[CancellationToken] = None,
+    ) -> CreateResult:
+        reserved = await quotas.acquire(self.model, self._estimate(messages))
+        usage = None
+        try:
+            result = await super().create(
+                messages,
+                tools=tools,
+                json_output=json_output,
+                extra_create_args=extra_create_args,
+                cancellation_token=cancellation_token,
+            )
+            usage = result.usage
+            return result
+        finally:
+            self._settle(reserved, usage)
+
+    async def create_stream(
+        self,
+        messages: Sequence[LLMMessage],
+        *,
+        tools: Sequence[Tool | ToolSchema] = [],
+        json_output: Optional[bool] = None,
+        extra_create_args: Mapping[str, Any] = {},
+        cancellation_token: Optional[CancellationToken] = None,
+    ) -> AsyncGenerator[Union[str, CreateResult], None]:
+        reserved = await quotas.acquire(self.model, self._estimate(messages))
+        usage = None
+        try:
+            async for item in super().create_stream(
+                messages,
+                tools=tools,
+                json_output=json_output,
+                extra_create_args=extra_create_args,
+                cancellation_token=cancellation_token,
+            ):
+                if isinstance(item, CreateResult):
+                    usage = item.usage
+                yield item
+        finally:
+            self._settle(reserved, usage)
+
+    def _settle(self, reserved: dict[str, float], usage: Optional[RequestUsage]) -> None:
+        if usage is None:
+            quotas.record(self.model, reserved)
+        else:
+            quotas.record(self.model, reserved, usage.prompt_tokens, usage.completion_tokens)
+
+    async def close(self) -> None:
+        await self._client.close()
+
+
+class PooledChatCompletionClient(DelegatingChatCompletionClient):
+    """Moves the running turn to `pool` before each call, so it holds that pool's slot.
+
+    Turns are admitted to a pool before they are routed; the agent that ends
+    up answering is what decides which pool the turn really belongs to.
+    """
+
+    def __init__(self, client: ChatCompletionClient, pool: str):
+        super().__init__(client)
+        self.pool = pool
+
+    async def create(
+        self,
+        messages: Sequence[LLMMessage],
+        *,
+        tools: Sequence[Tool | ToolSchema] = [],
+        json_output: Optional[bool] = None,
+        extra_create_args: Mapping[str, Any] = {},
+        cancellation_token: Optional[CancellationToken] = None,
+    ) -> CreateResult:
+        await scheduler.enter(self.pool)
+        return await super().create(
+            messages,
+            tools=tools,
+            json_output=json_output,
+            extra_create_args=extra_create_args,
+            cancellation_token=cancellation_token,
+        )
+
+    async def create_stream(
+        self,
+        messages: Sequence[LLMMessage],
+        *,
+        tools: Sequence[Tool | ToolSchema] = [],
+        json_output: Optional[bool] = None,
+        extra_create_args: Mapping[str, Any] = {},
+        cancellation_token: Optional[CancellationToken] = None,
+    ) -> AsyncGenerator[Union[str, CreateResult], None]:
+        await scheduler.enter(self.pool)
+        async for item in super().create_stream(
+            messages,
+            tools=tools,
+            json_output=json_output,
+            extra_create_args=extra_create_args,
+            cancellation_token=cancellation_token,
+        ):
+            yield item
+
+
+# Process-wide speculation outcomes: started, hits, misses, cancelled and
+# wasted_prompt_tokens / wasted_completion_tokens.
+speculation_counters: Counter = Counter()
+
+
+def _fingerprint(messages: Sequence[LLMMessage]) -> str:
+    return json.dumps([message.model_dump() for message in messages], sort_keys=True, default=str)
+
+
+@dataclass
+class _Speculation:
+    fingerprint: asyncio.Future
+    task: asyncio.Task
+    token: CancellationToken
+    prompt_tokens: int = 0
+    # Chunks streamed so far; `arrived` is set whenever one is added.
+    chunks: list = field(default_factory=list)
+    arrived: asyncio.Event = field(default_factory=asyncio.Event)
+
+
+class SpeculativeChatCompletionClient(DelegatingChatCompletionClient):
+    """Serves a call from a streaming request started ahead of time for the same prompt.
+
+    `speculate` starts streaming a request before the agent knows it will be
+    asked to answer, buffering the chunks. If the agent's next call has
+    exactly the speculated prompt, it gets the buffered chunks followed by the
+    rest of the live stream (committed); otherwise, or after `cancel`, the
+    speculative request is cancelled and its tokens are counted as wasted.
+    """
+
+    def __init__(self, client: ChatCompletionClient):
+        super().__init__(client)
+        self._speculation: Optional[_Speculation] = None
+
+    def speculate(
+        self,
+        prepare: Callable[[], Awaitable[Sequence[LLMMessage]]],
+        tools: Sequence[Tool | ToolSchema] = [],
+    ) -> None:
+        """Start a request for the prompt `prepare` builds, replacing any earlier one."""
+        self.cancel()
+        fingerprint: asyncio.Future = asyncio.get_running_loop().create_future()
+        token = CancellationToken()
+
+        async def _run() -> CreateResult:
+            try:
+                messages = await prepare()
+            except BaseException as e:
+                fingerprint.set_exception(e)
+                raise
+            fingerprint.set_result(_fingerprint(messages))
+            speculation.prompt_tokens = count_tokens(fingerprint.result())
+            stream = self._client.create_stream(messages, tools=tools, cancellation_token=token)
+            try:
+                async for chunk in stream:
+                    speculation.chunks.append(chunk)
+                    speculation.arrived.set()
+            finally:
+                await stream.aclose()
+            return speculation.chunks[-1]
+
+        task = asyncio.create_task(_run())
+        # The outcome is consumed by the committed call or discarded; never leave it unretrieved.
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        fingerprint.add_done_callback(lambda f: f.cancelled() or f.exception())
+        speculation = _Speculation(fingerprint=fingerprint, task=task, token=token)
+        self._speculation = speculation
+        speculation_counters["started"] += 1
+
+    def cancel(self) -> None:
+        """Discard the pending speculation, if any."""
+        speculation, self._speculation = self._speculation, None
+        if speculation is None:
+            return
+        speculation_counters["cancelled"] += 1
+        self._discard(speculation)
+
+    def _discard(self, speculation: _Speculation) -> None:
+        task = speculation.task
+        if task.done() and not task.cancelled() and task.exception() is None:
+            usage = task.result().usage
+            speculation_counters["wasted_prompt_tokens"] += usage.prompt_tokens
+            speculation_counters["wasted_completion_tokens"] += usage.completion_tokens
+        else:
+            speculation.token.cancel()
+            task.cancel()
+            speculation_counters["wasted_prompt_tokens"] += speculation.prompt_tokens
+            speculation_counters["wasted_completion_tokens"] += count_tokens(
+                "".join(chunk for chunk in speculation.chunks if isinstance(chunk, str))
+            )
+
+    async def _take(self, messages: Sequence[LLMMessage]) -> Optional[_Speculation]:
+        speculation, self._speculation = self._speculation, None
+        if speculation is None:
+            return None
+        await asyncio.wait({speculation.fingerprint, speculation.task}, return_when=asyncio.FIRST_COMPLETED)
+        if (
+            not speculation.fingerprint.done()
+            or speculation.fingerprint.exception() is not None
+            or speculation.fingerprint.result() != _fingerprint(messages)
+        ):
+            speculation_counters["misses"] += 1
+            self._discard(speculation)
+            return None
+        speculation_counters["hits"] += 1
+        return speculation
+
+    @staticmethod
+    async def _replay(
+        speculation: _Speculation, cancellation_token: Optional[CancellationToken]
+    ) -> AsyncGenerator[Union[str, CreateResult], None]:
+        """Yield the buffered chunks, then the rest of the stream as it arrives."""
+        task = speculation.task
+        if cancellation_token is not None:
+            cancellation_token.link_future(task)
+        seen = 0
+        try:
+            while True:
+                while seen < len(speculation.chunks):
+                    seen += 1
+                    yield speculation.chunks[seen - 1]
+                if task.done():
+                    task.result()
+                    return
+                speculation.arrived.clear()
+                arrived = asyncio.ensure_future(speculation.arrived.wait())
+                try:
+                    await asyncio.wait({arrived, task}, return_when=asyncio.FIRST_COMPLETED)
+                finally:
+                    arrived.cancel()
+        finally:
+            if not task.done():
+                speculation.token.cancel()
+                task.cancel()
+
+    async def create(
+        self,
+        messages: Sequence[LLMMessage],
+        *,
+        tools: Sequence[Tool | ToolSchema] = [],
+        json_output: Optional[bool] = None,
+        extra_create_args: Mapping[str, Any] = {},
+        cancellation_token: Optional[CancellationToken] = None,
+    ) -> CreateResult:
+        speculation = await self._take(messages)
+        if speculation is not None:
+            try:
+                async for chunk in self._replay(speculation, cancellation_token):
+                    result = chunk
+                return result
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Speculative request failed, retrying: {e}")
+        return await super().create(
+            messages,
+            tools=tools,
+            json_output=json_output,
+            extra_create_args=extra_create_args,
+            cancellation_token=cancellation_token,
+        )
+
+    async def create_stream(
+        self,
+        messages: Sequence[LLMMessage],
+        *,
+        tools: Sequence[Tool | ToolSchema] = [],
+        json_output: Optional[bool] = None,
+        extra_create_args: Mapping[str, Any] = {},
+        cancellation_token: Optional[CancellationToken] = None,
+    ) -> AsyncGenerator[Union[str, CreateResult], None]:
+        speculation = await self._take(messages)
+        if speculation is not None:
+            replayed = False
+            try:
+                async for chunk in self._replay(speculation, cancellation_token):
+                    replayed = True
+                    yield chunk
+                return
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Once chunks have been passed on, a retry would repeat them.
+                if replayed:
+                    raise
+                logger.warning(f"Speculative request failed, retrying: {e}")
+        async for chunk in super().create_stream(
+            messages,
+            tools=tools,
+            json_output=json_output,
+            extra_create_args=extra_create_args,
+            cancellation_token=cancellation_token,
+        ):
+            yield chunk
@@ -0,0 +1,185 @@
+import asyncio
+import os
+from typing import Any, Iterable, List, Mapping, Optional
+
+from autogen_core.model_context import ChatCompletionContextState, UnboundedChatCompletionContext
+from autogen_core.models import AssistantMessage, FunctionExecutionResultMessage, LLMMessage, UserMessage
+from pydantic import Field
+
+from app.core.tokens import count_tokens
+from app.core.tools.summarize import summarizer
+from app.logger import logger
+
+# Tokens of conversation history each model is sent per call, on top of its system prompt.
+CONTEXT_TOKEN_BUDGETS = {
+    "gpt-4o-mini": int(os.getenv("CONTEXT_TOKENS_GPT_4O_MINI", "8000")),
+    "o3-mini": int(os.getenv("CONTEXT_TOKENS_O3_MINI", "16000")),
+}
+DEFAULT_CONTEXT_TOKENS = int(os.getenv("CONTEXT_TOKENS_DEFAULT", "8000"))
+
+# Per-message framing the tokenizer doesn't see (role, name, separators).
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def context_budget(model: str) -> int:
+    return CONTEXT_TOKEN_BUDGETS.get(model, DEFAULT_CONTEXT_TOKENS)
+
+
+class RoutedContextState(ChatCompletionContextState):
+    summary: str = ""
+    unsummarized: List[LLMMessage] = Field(default_factory=list)
+
+
+def _text(message: LLMMessage) -> str:
+    content = message.content
+    if isinstance(content, str):
+        return content
+    parts = []
+    for part in content:
+        if isinstance(part, str):
+            parts.append(part)
+        else:
+            # Function calls carry arguments, function results carry content; images count as nothing.
+            parts.append(getattr(part, "arguments", None) or getattr(part, "content", None) or "")
+    return "\n".join(parts)
+
+
+def _tokens(message: LLMMessage) -> int:
+    return count_tokens(_text(message)) + MESSAGE_OVERHEAD_TOKENS
+
+
+def _is_tool_message(message: LLMMessage) -> bool:
+    if isinstance(message, FunctionExecutionResultMessage):
+        return True
+    return isinstance(message, AssistantMessage) and not isinstance(message.content, str)
+
+
+def _drop_stale_tool_outputs(messages: List[LLMMessage]) -> List[LLMMessage]:
+    """Drop tool calls and their results once an answer has been written from them."""
+    kept, tool_round = [], []
+    for message in messages:
+        if _is_tool_message(message):
+            tool_round.append(message)
+            continue
+        if not (isinstance(message, AssistantMessage) and tool_round):
+            kept.extend(tool_round)
+        tool_round = []
+        kept.append(message)
+    # A round still in progress is kept.
+    return kept + tool_round
+
+
+def _turns(messages: List[LLMMessage]) -> List[List[LLMMessage]]:
+    turns: List[List[LLMMessage]] = []
+    for message in messages:
+        if not turns or (isinstance(message, UserMessage) and message.source == "user"):
+            turns.append([])
+        turns[-1].append(message)
+    return turns
+
+
+def _transcript(messages: List[LLMMessage]) -> str:
+    return "\n".join(
+        f"{getattr(message, 'source', 'assistant')}: {_text(message)}"
+        for message in messages
+        if not _is_tool_message(message)
+    )
+
+
+class RoutedChatCompletionContext(UnboundedChatCompletionContext):
+    """Model context for the team's agents, bounded to a token budget.
+
+    The IntentAgent's JSON decisions are broadcast to every agent in the team
+    but mean nothing to the agents answering the user, so messages from
+    `ignored_sources` are left out. That also makes an agent's next prompt
+    predictable before routing has finished, which speculative execution
+    relies on.
+
+    Tool calls and their results are dropped once the agent has answered from
+    them. When the history outgrows `token_budget`, the oldest whole turns are
+    trimmed and, with `summarize`, folded into a running summary in the
+    background. The summary is sent ahead of the remaining turns and saved
+    with the context's state, so it is only ever extended, never rebuilt.
+    The full transcript stays in the history store.
+    """
+
+    def __init__(
+        self,
+        ignored_sources: Iterable[str] = (),
+        token_budget: int = DEFAULT_CONTEXT_TOKENS,
+        summarize: bool = True,
+        initial_messages: Optional[List[LLMMessage]] = None,
+    ):
+        super().__init__(initial_messages)
+        self._ignored_sources = set(ignored_sources)
+        self._token_budget = token_budget
+        self._summarize = summarize
+        self._summary = ""
+        self._unsummarized: List[LLMMessage] = []
+        self._fold_task: Optional[asyncio.Task] = None
+
+    async def add_message(self, message: LLMMessage) -> None:
+        if getattr(message, "source", None) in self._ignored_sources:
+            return
+        await super().add_message(message)
+        # Only compact between tool rounds, so calls and their results stay paired.
+        if not _is_tool_message(message):
+            self._compact()
+
+    async def get_messages(self) -> List[LLMMessage]:
+        messages = list(self._messages)
+        if self._summary:
+            messages.insert(0, UserMessage(content=f"Summary of the earlier conversation:\n{self._summary}", source="summary"))
+        return messages
+
+    async def clear(self) -> None:
+        await super().clear()
+        self._summary = ""
+        self._unsummarized = []
+
+    async def save_state(self) -> Mapping[str, Any]:
+        return RoutedContextState(
+            messages=self._messages, summary=self._summary, unsummarized=self._unsummarized
+        ).model_dump()
+
+    async def load_state(self, state: Mapping[str, Any]) -> None:
+        state = RoutedContextState.model_validate(state)
+        self._messages = state.messages
+        self._summary = state.summary
+        self._unsummarized = state.unsummarized
+        self._compact()
+        if self._unsummarized:
+            self._schedule_fold()
+
+    def _compact(self) -> None:
+        self._messages = _drop_stale_tool_outputs(self._messages)
+        turns = _turns(self._messages)
+        sizes = [sum(_tokens(message) for message in turn) for turn in turns]
+        total = sum(sizes) + count_tokens(self._summary)
+        trimmed: List[LLMMessage] = []
+        # The current turn is always kept whole.
+        while len(turns) > 1 and total > self._token_budget:
+            trimmed.extend(turns.pop(0))
+            total -= sizes.pop(0)
+        if not trimmed:
+            return
+        self._messages = [message for turn in turns for message in turn]
+        if self._summarize:
+            self._unsummarized.extend(trimmed)
+            self._schedule_fold()
+
+    def _schedule_fold(self) -> None:
+        if self._fold_task is None or self._fold_task.done():
+            self._fold_task = asyncio.create_task(self._fold())
+
+    async def _fold(self) -> None:
+        while self._unsummarized:
+            # Folded messages stay pending until the new summary is in, so a
+            # checkpoint taken meanwhile loses nothing.
+            batch = list(self._unsummarized)
+            try:
+                self._summary = await summarizer.fold_history(self._summary, _transcript(batch))
+            except Exception as e:
+                logger.warning(f"Error summarizing conversation history: {e}")
+                return
+            del self._unsummarized[: len(batch)]
@@ -0,0 +1,339 @@
+import asyncio
+import os
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, AsyncGenerator, Callable, Mapping, Optional, Sequence, Union
+
+from autogen_core import CancellationToken
+from autogen_core.models import ChatCompletionClient, CreateResult, LLMMessage, RequestUsage
+from autogen_core.tools import Tool, ToolSchema
+
+from app.core.agents.clients import DelegatingChatCompletionClient
+from app.core.metrics import metrics
+from app.core.ratelimit import QuotaExceeded
+from app.logger import logger
+
+backend_seconds = metrics.histogram(
+    "kijang_model_backend_seconds", "Time to first token (stream) or response (create) per model backend."
+)
+backend_calls = metrics.counter("kijang_model_backend_calls_total", "Model backend calls, by backend and outcome.")
+failover_events = metrics.counter(
+    "kijang_model_failover_total", "Hedged requests, hedges that won and failovers, by client."
+)
+
+
+class CircuitBreaker:
+    """Stops sending requests to a backend after `failures` failures in a row.
+
+    The circuit stays open for `cooldown` seconds, then lets one probe request
+    through; its outcome closes the circuit or opens it again.
+    """
+
+    def __init__(
+        self,
+        failures: int = int(os.getenv("MODEL_CIRCUIT_FAILURES", "5")),
+        cooldown: float = float(os.getenv("MODEL_CIRCUIT_COOLDOWN", "30")),
+    ):
+        self.failures = failures
+        self.cooldown = cooldown
+        self._consecutive = 0
+        self._opened_at: Optional[float] = None
+        self._probing = False
+
+    @property
+    def closed(self) -> bool:
+        return self._opened_at is None
+
+    def allow(self) -> bool:
+        if self._opened_at is None:
+            return True
+        if self._probing or time.monotonic() - self._opened_at < self.cooldown:
+            return False
+        self._probing = True
+        return True
+
+    def record_success(self) -> None:
+        self._consecutive = 0
+        self._opened_at = None
+        self._probing = False
+
+    def record_failure(self) -> None:
+        self._consecutive += 1
+        if self._probing or self._consecutive >= self.failures:
+            self._opened_at = time.monotonic()
+        self._probing = False
+
+    def release(self) -> None:
+        """Forget a request that was abandoned before it succeeded or failed."""
+        self._probing = False
+
+
+@dataclass
+class Backend:
+    """One configured model client with its circuit breaker and recent latencies."""
+
+    name: str
+    client: ChatCompletionClient
+    breaker: CircuitBreaker = field(default_factory=CircuitBreaker)
+    first_token: deque = field(default_factory=lambda: deque(maxlen=200))
+    complete: deque = field(default_factory=lambda: deque(maxlen=200))
+
+    def observe(self, phase: str, seconds: float) -> None:
+        getattr(self, phase).append(seconds)
+        backend_seconds.observe(seconds, backend=self.name, phase=phase)
+
+    def p95(self, phase: str, min_samples: int = 0) -> Optional[float]:
+        samples = sorted(getattr(self, phase))
+        if not samples or len(samples) < min_samples:
+            return None
+        return samples[int(0.95 * (len(samples) - 1))]
+
+    def stats(self) -> dict[str, float]:
+        stats = {f"{self.name}:circuit_open": float(not self.breaker.closed)}
+        for phase in ("first_token", "complete"):
+            p95 = self.p95(phase)
+            if p95 is not None:
+                stats[f"{self.name}:{phase}_p95"] = round(p95, 4)
+        return stats
+
+
+def _retryable(e: BaseException) -> bool:
+    if isinstance(e, QuotaExceeded):
+        # Another model has its own quota; the session's is the same everywhere.
+        return e.scope == "model"
+    # Bad requests fail the same way on every backend; don't fail over or trip the circuit.
+    status = getattr(e, "status_code", None)
+    return not isinstance(status, int) or status in (408, 409, 429) or status >= 500
+
+
+@dataclass
+class _Attempt:
+    backend: Backend
+    token: CancellationToken
+    task: asyncio.Task
+    stream: Optional[AsyncGenerator] = None
+    started: float = field(default_factory=time.perf_counter)
+
+
+class FailoverChatCompletionClient(DelegatingChatCompletionClient):
+    """Sends each call to the first healthy backend, hedging and failing over.
+
+    If a call hasn't produced its first token (or, for `create`, its result)
+    within the backend's observed p95, a second request is sent to the next
+    backend, or to the same one when it is the only one, and the first to
+    respond wins. Hedges are capped at `hedge_budget` of calls. A backend that
+    errors or takes longer than `timeout` is given up on and the call moves to
+    the next one; once a stream has started, errors are raised as they are.
+    """
+
+    def __init__(
+        self,
+        backends: Sequence[Backend],
+        name: str,
+        timeout: float = float(os.getenv("MODEL_TIMEOUT", "60")),
+        hedge_budget: float = float(os.getenv("MODEL_HEDGE_BUDGET", "0.1")),
+        hedge_min_samples: int = int(os.getenv("MODEL_HEDGE_MIN_SAMPLES", "20")),
+    ):
+        super().__init__(backends[0].client)
+        self.backends = list(backends)
+        self.name = name
+        self.timeout = timeout
+        self.hedge_budget = hedge_budget
+        self.hedge_min_samples = hedge_min_samples
+        self._calls = 0
+        self._hedges = 0
+        self._last = backends[0]
+
+    def _next_backend(self, tried: list[Backend]) -> Optional[Backend]:
+        for backend in self.backends:
+            if backend not in tried and backend.breaker.allow():
+                return backend
+        return None
+
+    def _hedge_backend(self, tried: list[Backend]) -> Optional[Backend]:
+        backend = self._next_backend(tried)
+        if backend is None and len(self.backends) == 1 and self.backends[0].breaker.closed:
+            backend = self.backends[0]
+        return backend
+
+    def _hedge_delay(self, backend: Backend, phase: str) -> Optional[float]:
+        if self.hedge_budget <= 0 or self._hedges >= self.hedge_budget * self._calls:
+            return None
+        return backend.p95(phase, self.hedge_min_samples)
+
+    async def _race(
+        self,
+        start: Callable[[Backend, CancellationToken], tuple],
+        phase: str,
+        cancellation_token: Optional[CancellationToken],
+    ) -> tuple[_Attempt, Any]:
+        """Run `start(backend, token)` attempts until one succeeds; returns it and its result.
+
+        The losing attempts are cancelled; the caller owns the winner.
+        """
+        self._calls += 1
+        tried: list[Backend] = []
+        attempts: list[_Attempt] = []
+        winner: Optional[_Attempt] = None
+        hedge: Optional[_Attempt] = None
+        error: Optional[BaseException] = None
+        hedge_at: Optional[float] = None
+
+        def launch(backend: Backend) -> _Attempt:
+            token = CancellationToken()
+            if cancellation_token is not None:
+                cancellation_token.add_callback(token.cancel)
+            tried.append(backend)
+            attempts.append(_Attempt(backend, token, *start(backend, token)))
+            return attempts[-1]
+
+        def fail(attempt: _Attempt, e: BaseException, outcome: str) -> None:
+            attempts.remove(attempt)
+            backend_calls.inc(backend=attempt.backend.name, outcome=outcome)
+            if _retryable(e) and not isinstance(e, QuotaExceeded):
+                attempt.backend.breaker.record_failure()
+            else:
+                attempt.backend.breaker.release()
+            logger.warning(f"Model backend {attempt.backend.name} failed for {self.name}: {e!r}")
+
+        first = self._next_backend(tried)
+        if first is None:
+            raise RuntimeError(f"All backends for {self.name} are unavailable (circuit open)")
+        launch(first)
+        delay = self._hedge_delay(first, phase)
+        if delay is not None:
+            hedge_at = time.perf_counter() + delay
+
+        try:
+            while True:
+                now = time.perf_counter()
+                deadline = min(attempt.started + self.timeout for attempt in attempts)
+                wake = deadline if hedge_at is None else min(deadline, hedge_at)
+                done, _ = await asyncio.wait(
+                    [attempt.task for attempt in attempts],
+                    timeout=max(0.0, wake - now),
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                if cancellation_token is not None and cancellation_token.is_cancelled():
+                    raise asyncio.CancelledError()
+                for attempt in [attempt for attempt in attempts if attempt.task in done]:
+                    task = attempt.task
+                    e = RuntimeError(f"{attempt.backend.name} request was cancelled") if task.cancelled() else task.exception()
+                    if e is None:
+                        winner = attempt
+                        break
+                    fail(attempt, e, "error")
+                    if not _retryable(e):
+                        raise e
+                    error = e
+                if winner is not None:
+                    break
+                now = time.perf_counter()
+                for attempt in [attempt for attempt in attempts if now >= attempt.started + self.timeout]:
+                    error = TimeoutError(f"{attempt.backend.name} did not respond within {self.timeout}s")
+                    fail(attempt, error, "timeout")
+                    self._abandon(attempt)
+                if hedge_at is not None and now >= hedge_at and attempts:
+                    hedge_at = None
+                    backend = self._hedge_backend(tried)
+                    if backend is not None:
+                        self._hedges += 1
+                        failover_events.inc(client=self.name, event="hedged")
+                        hedge = launch(backend)
+                if not attempts:
+                    backend = self._next_backend(tried)
+                    if backend is None:
+                        assert error is not None
+                        raise error
+                    failover_events.inc(client=self.name, event="failover")
+                    logger.warning(f"Failing over {self.name} to {backend.name}")
+                    launch(backend)
+        finally:
+            for attempt in attempts:
+                if attempt is not winner:
+                    self._abandon(attempt)
+
+        elapsed = time.perf_counter() - winner.started
+        winner.backend.observe(phase, elapsed)
+        winner.backend.breaker.record_success()
+        backend_calls.inc(backend=winner.backend.name, outcome="ok")
+        if winner is hedge:
+            failover_events.inc(client=self.name, event="hedge_won")
+        self._last = winner.backend
+        return winner, winner.task.result()
+
+    @staticmethod
+    def _abandon(attempt: _Attempt) -> None:
+        attempt.backend.breaker.release()
+        attempt.token.cancel()
+        attempt.task.cancel()
+        attempt.task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        if attempt.stream is not None:
+            stream = attempt.stream
+            # The stream can only be closed once the pending `__anext__` has unwound.
+            attempt.task.add_done_callback(lambda _: asyncio.ensure_future(stream.aclose()))
+
+    async def create(
+        self,
+        messages: Sequence[LLMMessage],
+        *,
+        tools: Sequence[Tool | ToolSchema] = [],
+        json_output: Optional[bool] = None,
+        extra_create_args: Mapping[str, Any] = {},
+        cancellation_token: Optional[CancellationToken] = None,
+    ) -> CreateResult:
+        def start(backend: Backend, token: CancellationToken) -> tuple[asyncio.Task]:
+            return (
+                asyncio.create_task(
+                    backend.client.create(
+                        messages,
+                        tools=tools,
+                        json_output=json_output,
+                        extra_create_args=extra_create_args,
+                        cancellation_token=token,
+                    )
+                ),
+            )
+
+        _, result = await self._race(start, "complete", cancellation_token)
+        return result
+
+    async def create_stream(
+        self,
+        messages: Sequence[LLMMessage],
+        *,
+        tools: Sequence[Tool | ToolSchema] = [],
+        json_output: Optional[bool] = None,
+        extra_create_args: Mapping[str, Any] = {},
+        cancellation_token: Optional[CancellationToken] = None,
+    ) -> AsyncGenerator[Union[str, CreateResult], None]:
+        def start(backend: Backend, token: CancellationToken) -> tuple[asyncio.Task, AsyncGenerator]:
+            stream = backend.client.create_stream(
+                messages,
+                tools=tools,
+                json_output=json_output,
+                extra_create_args=extra_create_args,
+                cancellation_token=token,
+            )
+            return asyncio.create_task(anext(stream)), stream
+
+        winner, item = await self._race(start, "first_token", cancellation_token)
+        stream = winner.stream
+        try:
+            yield item
+            async for item in stream:
+                yield item
+            winner.backend.observe("complete", time.perf_counter() - winner.started)
+        finally:
+            await stream.aclose()
+
+    def actual_usage(self) -> RequestUsage:
+        return self._last.client.actual_usage()
+
+    def total_usage(self) -> RequestUsage:
+        usages = [backend.client.total_usage() for backend in self.backends]
+        return RequestUsage(
+            prompt_tokens=sum(usage.prompt_tokens for usage in usages),
+            completion_tokens=sum(usage.completion_tokens for usage in usages),
+        )
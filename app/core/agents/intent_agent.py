@@ -1,18 +1,16 @@
 import os
-import aiofiles
-import yaml
-from dotenv import load_dotenv
 from typing import Any, List, Literal
 from pydantic import BaseModel
 from enum import Enum
 
 from autogen_agentchat.agents import AssistantAgent
-from autogen_core.models import ChatCompletionClient
-from autogen_ext.models.openai import OpenAIChatCompletionClient
 
+from app.core.agents.context import RoutedChatCompletionContext
 from app.core.agents.prompts import intent_prompt
+from app.core.agents.registry import model_clients
 
-model_config_path = os.getenv("MODEL_CONFIG_PATH")
+# Routing only needs the last few turns; older ones are dropped, not summarized.
+INTENT_CONTEXT_TOKENS = int(os.getenv("CONTEXT_TOKENS_INTENT", "1000"))
 
 class IntentType(str, Enum):
     QUESTION_ANSWERING = "question_answering"
@@ -29,34 +27,19 @@ class IntentAgent:
         self.name = name
         self.model = model
         self.system_message = intent_prompt
+        self.model_context = RoutedChatCompletionContext(token_budget=INTENT_CONTEXT_TOKENS, summarize=False)
         self.model_client = None
         self.agent = None
 
     @classmethod
-    async def create(cls, name: str, model: str) -> "IntentAgent":  # Fix return type
+    async def create(cls, name: str, model: str) -> "IntentAgent":
         instance = cls(name, model)
         instance.model_client = await instance.get_model_client()
         instance.agent = instance.initialize_agent()
-        return instance.agent
+        return instance
 
     async def get_model_client(self):
-        try:
-            async with aiofiles.open(model_config_path, "r") as file:  # Add error handling
-                configs = yaml.safe_load(await file.read())
-                model_config = configs['models'][self.model]
-                model_config['config']['response_format'] = IntentOutput
-
-                print(IntentOutput.model_json_schema())
-                print(model_config)
-                print('here???')
-            # return ChatCompletionClient.load_component(model_config)
-            return OpenAIChatCompletionClient(
-                model=model_config['config']['model'],
-                api_key=model_config['config']['api_key'],
-                response_format=IntentOutput
-            )
-        except (FileNotFoundError, yaml.YAMLError) as e:
-            raise RuntimeError(f"Failed to load model config: {e}")
+        return model_clients.get(self.model, response_format=IntentOutput)
 
     def initialize_agent(self):
         if not self.model_client:
@@ -65,4 +48,5 @@ class IntentAgent:
             name=self.name,
             model_client=self.model_client,
             system_message=self.system_message,
+            model_context=self.model_context,
         )
\ No newline at end of file
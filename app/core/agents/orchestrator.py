@@ -1,84 +1,157 @@
-import json
-import logging
 import os
-from typing import Any, Awaitable, Callable, Optional, Sequence
+from typing import Sequence
 import json_repair
 from datetime import datetime
 
-import aiofiles
-import yaml
-from autogen_agentchat.agents import AssistantAgent, UserProxyAgent
-from autogen_agentchat.base import TaskResult
-from autogen_agentchat.messages import TextMessage, UserInputRequestedEvent, AgentEvent, ChatMessage, ToolCallExecutionEvent, ToolCallRequestEvent
-from autogen_agentchat.teams import RoundRobinGroupChat, SelectorGroupChat
-from autogen_core import CancellationToken
-from autogen_core.models import ChatCompletionClient
+from autogen_agentchat.conditions import SourceMatchTermination
+from autogen_agentchat.messages import AgentEvent, ChatMessage, TextMessage
+from autogen_agentchat.teams import SelectorGroupChat
+from autogen_core.models import AssistantMessage, UserMessage
 
 from app.logger import logger
-from app.api.history import get_history
-from app.core.agents.intent_agent import IntentAgent
+from app.core.agents.intent_agent import IntentAgent, IntentOutput
 from app.core.agents.assistant_agent import KijangAgent
 from app.core.agents.prompts import kijang_prompt
+from app.core.agents.registry import TeamRegistry, model_clients
+from app.core.agents.router import router
+from app.core.metrics import span
+from app.core.store import store
 
-model_config_path = os.getenv("MODEL_CONFIG_PATH")
+# Start the chat agent while the IntentAgent is still routing (opt-in).
+SPECULATIVE_CHAT = os.getenv("SPECULATIVE_CHAT", "0") == "1"
 
-history_path = os.getenv("HISTORY_PATH")
-state_path = os.getenv("STATE_PATH")
+# Messages of the group chat manager's thread kept in checkpoints. Speakers are
+# picked from the last couple of messages; agents keep their own context.
+MANAGER_THREAD_MESSAGES = int(os.getenv("MANAGER_THREAD_MESSAGES", "20"))
 
-async def get_team(
-    user_input_func: Callable[[str, Optional[CancellationToken]], Awaitable[str]],
-) -> RoundRobinGroupChat:
-    # Get model client from config.
-    async with aiofiles.open(model_config_path, "r") as file:
-        configs = yaml.safe_load(await file.read())
-        model_config = configs["models"]["gpt-4o-mini"]
-    model_client = ChatCompletionClient.load_component(model_config)
+# Models behind the team's agents; the IntentAgent and chat agent share one.
+CHAT_MODEL = "gpt-4o-mini"
+REASONING_MODEL = "o3-mini"
+
+# Answering agents and the model the IntentAgent picks them with.
+AGENT_MODELS = {"AssistantAgent": "chat", "ReasoningAgent": "reasoning"}
+
+# Version of the checkpoint each warm team was loaded from or last saved as.
+state_versions: dict[str, int] = {}
+
+# Agents of each warm team, for work on the team outside a run.
+team_agents: dict[str, list[IntentAgent | KijangAgent]] = {}
+
+async def build_team(session_id: str) -> SelectorGroupChat:
+    """Build a team and restore the session's saved state. Only called for cold teams."""
+    model_client = model_clients.get(CHAT_MODEL)
 
     intent_agent = await IntentAgent.create(
         name="IntentAgent",
-        model="gpt-4o-mini",
+        model=CHAT_MODEL,
     )
 
     kijang_agent = await KijangAgent.create(
         name="AssistantAgent",
-        model="gpt-4o-mini",
-        system_message=kijang_prompt.format(current_datetime=datetime.now().strftime('%Y-%m-%d'))
+        model=CHAT_MODEL,
+        system_message=kijang_prompt.format(current_datetime=datetime.now().strftime('%Y-%m-%d')),
+        ignored_sources=[intent_agent.name],
+        speculative=SPECULATIVE_CHAT,
+        pool=AGENT_MODELS["AssistantAgent"],
     )
 
     kijang_reasoning_agent = await KijangAgent.create(
         name="ReasoningAgent",
-        model="o3-mini",
+        model=REASONING_MODEL,
         system_message="You are a helpful assistant. You excel in complex reasoning tasks.",
+        ignored_sources=[intent_agent.name],
+        pool=AGENT_MODELS["ReasoningAgent"],
     )
 
-    user_proxy = UserProxyAgent(
-        name="user",
-        input_func=user_input_func,  # Use the user input function.
-    )
+    agents_by_model = {model: name for name, model in AGENT_MODELS.items()}
+    team_agents[session_id] = [intent_agent, kijang_agent, kijang_reasoning_agent]
 
-    def selector_func_with_user_proxy(messages: Sequence[AgentEvent | ChatMessage]) -> str | None:
-        if messages[-1].source == user_proxy.name:
+    def selector_func(messages: Sequence[AgentEvent | ChatMessage]) -> str | None:
+        if messages[-1].source == "user":
+            # Skip the IntentAgent round-trip when the local router is confident.
+            decision = router.route(messages[-1].content)
+            if decision is not None:
+                return agents_by_model[decision.model]
+            # Most turns route to chat, so start on it while routing runs.
+            kijang_agent.speculate(messages[-1].content)
             return intent_agent.name
         if messages[-1].source == intent_agent.name:
             agent_router = json_repair.loads(messages[-1].content)
-
-            if agent_router["model"] == "chat":
-                return kijang_agent.name
-            elif agent_router["model"] == "reasoning":
-                return kijang_reasoning_agent.name
-        if messages[-1].source in [kijang_agent.name, kijang_reasoning_agent.name]:
-            return user_proxy.name
+            model = agent_router.get("model") if isinstance(agent_router, dict) else None
+            if model != "chat":
+                kijang_agent.cancel_speculation()
+            if model in agents_by_model:
+                if messages[-2].source == "user":
+                    router.record(messages[-2].content, agent_router.get("intent"), model)
+                return agents_by_model[model]
         return None
-    
+
+    # A run covers a single turn: it ends as soon as an assistant has answered,
+    # and the team is kept in memory for the next one.
     team = SelectorGroupChat(
-        [intent_agent, kijang_agent, kijang_reasoning_agent, user_proxy],
+        [intent_agent.agent, kijang_agent.agent, kijang_reasoning_agent.agent],
         model_client=model_client,
-        selector_func=selector_func_with_user_proxy
+        selector_func=selector_func,
+        termination_condition=SourceMatchTermination([kijang_agent.name, kijang_reasoning_agent.name]),
     )
-    # Load state from file.
-    if not os.path.exists(state_path):
-        return team
-    async with aiofiles.open(state_path, "r") as file:
-        state = json.loads(await file.read())
-    await team.load_state(state)
-    return team
\ No newline at end of file
+    # Restore the last checkpoint, if any.
+    with span("state_load"):
+        state, state_versions[session_id] = await store.load_state(session_id)
+        if state is not None:
+            await team.load_state(state)
+    return team
+
+def _forget(session_id: str) -> None:
+    state_versions.pop(session_id, None)
+    for agent in team_agents.pop(session_id, []):
+        # A turn cancelled while routing may leave a speculative call running.
+        if isinstance(agent, KijangAgent):
+            agent.cancel_speculation()
+
+teams = TeamRegistry(build_team, on_evict=_forget)
+
+def warm_up_clients() -> None:
+    """Create the shared model clients every team uses, ahead of the first team."""
+    model_clients.get(CHAT_MODEL)
+    model_clients.get(CHAT_MODEL, response_format=IntentOutput)
+    model_clients.get(REASONING_MODEL)
+
+async def get_team(session_id: str) -> SelectorGroupChat:
+    """Get the session's team, reusing it across turns while it stays warm.
+
+    A warm team is dropped if another worker has checkpointed the session
+    since, so turns always continue from the latest state.
+    """
+    if session_id in teams and state_versions.get(session_id) != await store.state_version(session_id):
+        teams.evict(session_id)
+    if session_id in teams:
+        return await teams.get(session_id)
+    with span("team_build"):
+        return await teams.get(session_id)
+
+async def add_answered_turn(session_id: str, request: TextMessage, answer: TextMessage) -> None:
+    """Add a turn answered without running the team, e.g. from the response cache, to its agents' contexts."""
+    await get_team(session_id)
+    for agent in team_agents[session_id]:
+        await agent.model_context.add_message(UserMessage(content=request.content, source=request.source))
+        if agent.name == answer.source:
+            await agent.model_context.add_message(AssistantMessage(content=answer.content, source=answer.source))
+        else:
+            await agent.model_context.add_message(UserMessage(content=answer.content, source=answer.source))
+
+async def save_team_state(session_id: str, state: dict) -> None:
+    """Checkpoint a team's state and remember the version it now matches.
+
+    If another worker checkpointed the session while this turn ran, its state
+    is kept and this team is dropped, so the next turn reloads from it.
+    """
+    for agent_state in state.get("agent_states", {}).values():
+        if isinstance(agent_state, dict) and "message_thread" in agent_state:
+            agent_state["message_thread"] = agent_state["message_thread"][-MANAGER_THREAD_MESSAGES:]
+    with span("state_save"):
+        version = await store.save_state(session_id, state, state_versions.get(session_id, 0))
+    if version is None:
+        logger.warning(f"Session {session_id} was checkpointed elsewhere during the turn; reloading its team")
+        teams.evict(session_id)
+    elif session_id in teams:
+        state_versions[session_id] = version
@@ -31,4 +31,27 @@ You have access to the following tools:
        - User is asking about some term you are totally unfamiliar with (it might be new)
        - User explicitly asks you to browse or provide links to references
        
-    Always provide inline citations, in markdown formatting, for the information you provide from the web search."""
\ No newline at end of file
+    Always provide inline citations, in markdown formatting, for the information you provide from the web search."""
+
+summary_prompt = """Summarize each of the following web pages in at most 300 words, keeping only information related to the query: '{query}'.
+If a page has nothing relevant, say so in one sentence.
+
+{pages}
+
+The output should be in the following JSON format:
+{{
+  "summaries": [{{"id": int, "summary": str}}]
+}}
+
+Return one entry per page, using the page ids above."""
+
+history_prompt = """You keep a running summary of a conversation between a user and an assistant.
+Extend the summary with the new messages below, in at most {words} words. Keep facts, decisions, names, numbers and open questions; drop small talk.
+
+Current summary:
+{summary}
+
+New messages:
+{transcript}
+
+Return only the updated summary."""
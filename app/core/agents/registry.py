@@ -0,0 +1,181 @@
+import asyncio
+import os
+import time
+from collections import Counter, OrderedDict
+from typing import Any, Awaitable, Callable, Optional
+
+from autogen_agentchat.teams import SelectorGroupChat
+from autogen_core.models import ChatCompletionClient
+
+from app.core.agents.clients import InstrumentedChatCompletionClient, QuotaChatCompletionClient
+from app.core.agents.failover import Backend, FailoverChatCompletionClient
+from app.core.config import get_model_config
+from app.core.ratelimit import quotas
+from app.logger import logger
+
+
+class ModelClientRegistry:
+    """Process-wide model clients, shared by every agent and team.
+
+    Each client owns an HTTP connection pool, so building one per agent per
+    turn throws away keep-alive connections to the provider. Clients are keyed
+    on the model name and the structured output format they were built with.
+
+    A model's config may list `fallbacks`: other configured models its calls
+    are hedged to and fail over to (see `FailoverChatCompletionClient`). Each
+    model is one backend with its own circuit breaker and latency stats, shared
+    by every client that uses it. Its calls are charged to the model's token
+    quota, `tokens_per_minute` in its config, and to the current session's.
+    """
+
+    def __init__(self):
+        self._clients: dict[tuple[str, Any], ChatCompletionClient] = {}
+        self._backends: dict[tuple[str, Any], Backend] = {}
+
+    def get(self, model: str, response_format: Optional[type] = None) -> ChatCompletionClient:
+        key = (model, response_format)
+        client = self._clients.get(key)
+        if client is None:
+            fallbacks = get_model_config(model).get("fallbacks", [])
+            backends = [self._backend(name, response_format) for name in [model, *fallbacks]]
+            client = self._wrap(model, backends, response_format)
+            self._clients[key] = client
+        return client
+
+    def set(self, model: str, client: ChatCompletionClient, response_format: Optional[type] = None) -> None:
+        """Use `client` for `model` instead of building one from the model config, e.g. a stub for benchmarks."""
+        backend = Backend(_name(model, response_format), QuotaChatCompletionClient(client, model))
+        self._backends[(model, response_format)] = backend
+        self._clients[(model, response_format)] = self._wrap(model, [backend], response_format)
+
+    def backend_stats(self) -> dict[str, float]:
+        """Circuit state and p95 latencies of every backend."""
+        stats: dict[str, float] = {}
+        for backend in self._backends.values():
+            stats.update(backend.stats())
+        return stats
+
+    def _backend(self, model: str, response_format: Optional[type]) -> Backend:
+        key = (model, response_format)
+        backend = self._backends.get(key)
+        if backend is None:
+            tokens_per_minute = get_model_config(model).get("tokens_per_minute")
+            if tokens_per_minute:
+                quotas.set_model_limit(model, int(tokens_per_minute))
+            client = QuotaChatCompletionClient(_build(model, response_format), model)
+            backend = self._backends[key] = Backend(_name(model, response_format), client)
+        return backend
+
+    @staticmethod
+    def _wrap(model: str, backends: list[Backend], response_format: Optional[type]) -> ChatCompletionClient:
+        name = _name(model, response_format)
+        return InstrumentedChatCompletionClient(FailoverChatCompletionClient(backends, name), name)
+
+    async def close(self) -> None:
+        backends, self._backends, self._clients = list(self._backends.values()), {}, {}
+        for backend in backends:
+            await backend.client.close()
+
+
+def _name(model: str, response_format: Optional[type]) -> str:
+    return model if response_format is None else f"{model}/{response_format.__name__}"
+
+
+def _build(model: str, response_format: Optional[type]) -> ChatCompletionClient:
+    model_config = get_model_config(model)
+    model_config.pop("fallbacks", None)
+    model_config.pop("tokens_per_minute", None)
+    if response_format is None:
+        return ChatCompletionClient.load_component(model_config)
+    # Imported on first use; the OpenAI SDK is slow to import.
+    from autogen_ext.models.openai import OpenAIChatCompletionClient
+
+    return OpenAIChatCompletionClient(
+        model=model_config["config"]["model"],
+        api_key=model_config["config"]["api_key"],
+        response_format=response_format,
+    )
+
+
+class TeamRegistry:
+    """Keeps built teams in memory between turns, bounded by LRU and idle eviction.
+
+    `factory` builds a team for a key and restores its saved state; it is only
+    called when the team is cold or has been evicted. `on_evict` is called with
+    the key of every team that leaves the registry.
+    """
+
+    def __init__(
+        self,
+        factory: Callable[[str], Awaitable[SelectorGroupChat]],
+        max_teams: int = int(os.getenv("TEAM_CACHE_SIZE", "128")),
+        idle_timeout: float = float(os.getenv("TEAM_IDLE_TIMEOUT", "1800")),
+        on_evict: Optional[Callable[[str], None]] = None,
+    ):
+        self._factory = factory
+        self._on_evict = on_evict
+        self._max_teams = max_teams
+        self._idle_timeout = idle_timeout
+        self._teams: OrderedDict[str, tuple[SelectorGroupChat, float]] = OrderedDict()
+        self._locks: dict[str, asyncio.Lock] = {}
+        # Calls to `get` holding or waiting for each key's lock.
+        self._users: Counter = Counter()
+
+    async def get(self, key: str) -> SelectorGroupChat:
+        self._evict_idle()
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        self._users[key] += 1
+        try:
+            async with lock:
+                entry = self._teams.get(key)
+                if entry is not None:
+                    self._teams[key] = (entry[0], time.monotonic())
+                    self._teams.move_to_end(key)
+                    return entry[0]
+                team = await self._factory(key)
+                self._teams[key] = (team, time.monotonic())
+                while len(self._teams) > self._max_teams:
+                    evicted = next(iter(self._teams))
+                    self.evict(evicted)
+                    logger.info(f"Evicted team {evicted} (capacity)")
+                return team
+        finally:
+            self._users[key] -= 1
+            if not self._users[key]:
+                del self._users[key]
+                if key not in self._teams:
+                    # Evicted while in use, or the factory failed.
+                    self._locks.pop(key, None)
+
+    def evict(self, key: str) -> None:
+        if self._teams.pop(key, None) is not None and self._on_evict is not None:
+            self._on_evict(key)
+        self._drop_lock(key)
+
+    def _drop_lock(self, key: str) -> None:
+        # A lock still in use must outlive the eviction, or the next `get`
+        # would make a new one and build a second team alongside.
+        if not self._users[key]:
+            self._locks.pop(key, None)
+
+    def clear(self) -> None:
+        for key in list(self._teams):
+            self.evict(key)
+
+    def _evict_idle(self) -> None:
+        cutoff = time.monotonic() - self._idle_timeout
+        while self._teams:
+            key, (_, last_used) = next(iter(self._teams.items()))
+            if last_used >= cutoff:
+                break
+            self.evict(key)
+            logger.info(f"Evicted team {key} (idle)")
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._teams
+
+    def __len__(self) -> int:
+        return len(self._teams)
+
+
+model_clients = ModelClientRegistry()
@@ -0,0 +1,207 @@
+import asyncio
+import json
+import os
+import re
+import threading
+from collections import Counter
+from dataclasses import dataclass
+from typing import Any, Optional
+
+from cachetools import LRUCache
+
+from app.core.tools.search import normalize_query
+from app.core.metrics import span
+from app.logger import logger
+
+
+@dataclass(frozen=True)
+class RouteDecision:
+    intent: str
+    model: str
+    confidence: float
+    # Which tier decided: "rules", "classifier", "memo" or "llm".
+    source: str
+
+
+# High precision rules: (pattern, intent, model). The first match wins.
+RULES: list[tuple[re.Pattern, Optional[str], str]] = [
+    (re.compile(r"\b(use|switch( back)? to)\s+(the\s+)?reasoning\s+(mode|model)\b", re.I), None, "reasoning"),
+    (re.compile(r"\b(use|switch( back)? to)\s+(the\s+)?chat\s+(mode|model)\b", re.I), None, "chat"),
+    # Code-shaped and case-sensitive, so prose that starts with "Import" or "select" isn't code.
+    (
+        re.compile(
+            r"```|Traceback \(most recent call last\)"
+            r"|^\s*(async )?def \w+\(|^\s*class \w+\s*[:(]|^\s*function\s*\w*\s*\("
+            r"|^\s*(import [\w.]+|from [\w.]+ import [\w., ]+)\s*$|^\s*SELECT\s.+\sFROM\s",
+            re.M,
+        ),
+        "question_answering",
+        "reasoning",
+    ),
+    (re.compile(r"^\W*(hi|hello|hey|thanks|thank you|ok|okay|good (morning|afternoon|evening))\b[\w\s!.,]{0,20}$", re.I), "text_generation", "chat"),
+    (re.compile(r"^\W*(please\s+)?translate\b", re.I), "translation", "chat"),
+    (re.compile(r"^\W*(please\s+)?(summari[sz]e|tl;?dr)\b", re.I), "summarization", "chat"),
+]
+
+# Turns that lean on the previous one ("yes", "what about yesterday?"). Their
+# routing depends on the conversation, so they are never memoized.
+ANAPHORIC = re.compile(
+    r"^\W*(yes|yeah|yep|no|nope|sure|ok|okay|and|also|so|then|why|how so|what about|how about"
+    r"|go on|continue|more|explain|elaborate|same|that|this|it|those|these|they)\b",
+    re.I,
+)
+
+
+class IntentRouter:
+    """Local fast path for routing a user turn to the chat or reasoning agent.
+
+    Tiers, cheapest first: memoized decisions for repeated prompts, regex
+    rules, then a TF-IDF + logistic regression classifier trained on logged
+    IntentAgent decisions (when scikit-learn is installed). `route` returns
+    None when no tier is confident, and the caller falls back to the LLM
+    IntentAgent, whose decision is then recorded here. Short or anaphoric
+    turns are never memoized, since the same words route differently
+    depending on what came before.
+    """
+
+    def __init__(
+        self,
+        log_path: str = os.getenv("INTENT_LOG_PATH", "app/local/intent_log.jsonl"),
+        threshold: float = float(os.getenv("ROUTER_THRESHOLD", "0.85")),
+        min_examples: int = int(os.getenv("ROUTER_MIN_EXAMPLES", "50")),
+        retrain_every: int = int(os.getenv("ROUTER_RETRAIN_EVERY", "50")),
+        memo_min_words: int = int(os.getenv("ROUTER_MEMO_MIN_WORDS", "4")),
+        memo_size: int = 4096,
+    ):
+        self.log_path = log_path
+        self.threshold = threshold
+        self.min_examples = min_examples
+        self.retrain_every = retrain_every
+        self.memo_min_words = memo_min_words
+        self._memo: LRUCache = LRUCache(maxsize=memo_size)
+        self._model: Optional[Any] = None
+        self._training: Optional[asyncio.Task] = None
+        # Decisions logged since the classifier was last trained.
+        self._untrained = 0
+        self._write_lock = threading.Lock()
+        self._background: set[asyncio.Task] = set()
+        # Decisions by tier (memo, rules, classifier), and fallbacks to the IntentAgent.
+        self.counters: Counter = Counter()
+
+    def route(self, text: str, lookahead: bool = False) -> Optional[RouteDecision]:
+        """Route `text` locally, or return None to defer to the IntentAgent.
+
+        Lookahead guesses, made before the turn is routed for real, are
+        neither memoized nor counted.
+        """
+        key = self._memo_key(text)
+        decision = self._memo.get(key) if key else None
+        if decision is not None:
+            if not lookahead:
+                self.counters["memo"] += 1
+            return RouteDecision(decision.intent, decision.model, decision.confidence, "memo")
+
+        with span("route"):
+            decision = self._apply_rules(text) or self._classify(text)
+        if lookahead:
+            return decision
+        if decision is not None and key:
+            self._memo[key] = decision
+        self.counters[decision.source if decision else "fallback"] += 1
+        return decision
+
+    def _memo_key(self, text: str) -> Optional[str]:
+        """Key `text` is memoized under, or None if it must not be memoized."""
+        key = normalize_query(text)
+        if len(key.split()) < self.memo_min_words or ANAPHORIC.match(text):
+            return None
+        return key
+
+    async def warm_up(self) -> None:
+        """Train the classifier now rather than on the first turn it could route."""
+        self._maybe_train()
+        await self._training
+
+    def _apply_rules(self, text: str) -> Optional[RouteDecision]:
+        for pattern, intent, model in RULES:
+            if pattern.search(text):
+                return RouteDecision(intent or "question_answering", model, 1.0, "rules")
+        return None
+
+    def _classify(self, text: str) -> Optional[RouteDecision]:
+        # Train off the event loop; until it finishes, defer to the IntentAgent.
+        self._maybe_train()
+        if self._model is None:
+            return None
+        probabilities = self._model.predict_proba([text])[0]
+        best = probabilities.argmax()
+        if probabilities[best] < self.threshold:
+            return None
+        intent, model = self._model.classes_[best].split("/")
+        return RouteDecision(intent, model, float(probabilities[best]), "classifier")
+
+    def _maybe_train(self) -> None:
+        """Start training once, then again after every `retrain_every` newly logged decisions."""
+        if self._training is not None and (not self._training.done() or self._untrained < self.retrain_every):
+            return
+        self._untrained = 0
+        self._training = asyncio.get_running_loop().create_task(self.train())
+        self._training.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+    async def train(self) -> None:
+        """(Re)train the classifier from the decision log."""
+        self._model = await asyncio.to_thread(self._train)
+
+    def _train(self) -> Optional[Any]:
+        if not os.path.exists(self.log_path):
+            return None
+        try:
+            from sklearn.feature_extraction.text import TfidfVectorizer
+            from sklearn.linear_model import LogisticRegression
+            from sklearn.pipeline import make_pipeline
+        except ImportError:
+            logger.info("scikit-learn not installed; intent classifier disabled")
+            return None
+        texts, labels = [], []
+        with open(self.log_path, "r") as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                    texts.append(record["text"])
+                    labels.append(f"{record['intent']}/{record['model']}")
+                except (ValueError, KeyError):
+                    continue
+        if len(texts) < self.min_examples or len(set(labels)) < 2:
+            return None
+        model = make_pipeline(
+            TfidfVectorizer(ngram_range=(1, 2), sublinear_tf=True, min_df=2),
+            LogisticRegression(max_iter=1000, class_weight="balanced"),
+        )
+        model.fit(texts, labels)
+        logger.info(f"Trained intent classifier on {len(texts)} logged decisions")
+        return model
+
+    def record(self, text: str, intent: str, model: str) -> None:
+        """Remember an IntentAgent decision and log it as training data."""
+        key = self._memo_key(text)
+        if key:
+            self._memo[key] = RouteDecision(intent, model, 1.0, "llm")
+        line = json.dumps({"text": text, "intent": intent, "model": model}) + "\n"
+        task = asyncio.get_running_loop().create_task(asyncio.to_thread(self._append, line))
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+        self._untrained += 1
+        if self._untrained >= self.retrain_every:
+            # Retrain after the decision is on disk, so it is part of the training data.
+            task.add_done_callback(lambda _: self._maybe_train())
+
+    def _append(self, line: str) -> None:
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.log_path)), exist_ok=True)
+            with self._write_lock, open(self.log_path, "a") as file:
+                file.write(line)
+        except OSError as e:
+            logger.warning(f"Failed to log intent decision: {e}")
+
+
+router = IntentRouter()
@@ -0,0 +1,24 @@
+import copy
+import os
+from functools import lru_cache
+from typing import Any
+
+import yaml
+
+
+@lru_cache(maxsize=1)
+def load_model_configs() -> dict[str, Any]:
+    """Read and parse the model config file once per process."""
+    try:
+        with open(os.getenv("MODEL_CONFIG_PATH"), "r") as file:
+            return yaml.safe_load(file)["models"]
+    except (FileNotFoundError, KeyError, yaml.YAMLError) as e:
+        raise RuntimeError(f"Failed to load model config: {e}")
+
+
+def get_model_config(model: str) -> dict[str, Any]:
+    """Return a copy of the config for `model` that callers are free to mutate."""
+    try:
+        return copy.deepcopy(load_model_configs()[model])
+    except KeyError:
+        raise RuntimeError(f"Model '{model}' is not configured")
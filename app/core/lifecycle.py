@@ -0,0 +1,92 @@
+import asyncio
+import time
+from dataclasses import dataclass, field
+from importlib import import_module
+from typing import Awaitable, Callable, Optional
+
+from app.core.agents.orchestrator import warm_up_clients
+from app.core.agents.registry import model_clients
+from app.core.agents.router import router
+from app.core.metrics import span
+from app.core.response_cache import response_cache
+from app.core.store import store
+from app.core.tokens import count_tokens
+from app.core.tools.cache import content_cache
+from app.core.tools.extract import extractor
+from app.core.tools.fetcher import fetcher
+from app.core.tools.summarize import summarizer
+from app.logger import logger
+
+
+@dataclass
+class WarmUpStatus:
+    """Progress of the worker's warm-up, reported by the health check."""
+
+    ready: bool = False
+    started: float = field(default_factory=time.perf_counter)
+    seconds: Optional[float] = None
+    failed: list[str] = field(default_factory=list)
+
+
+warm_up_status = WarmUpStatus()
+
+
+async def _warm_model_clients() -> None:
+    # The OpenAI SDK takes most of a second to import; keep that off the event loop.
+    await asyncio.to_thread(import_module, "autogen_ext.models.openai")
+    warm_up_clients()
+    if summarizer.mode == "batch":
+        model_clients.get(summarizer.model)
+
+
+async def _warm_databases() -> None:
+    await asyncio.gather(store.open(), content_cache.open())
+
+
+async def _warm_tokenizer() -> None:
+    # Loads the encoding, which may be read from disk or downloaded.
+    await asyncio.to_thread(count_tokens, "warm up")
+
+
+WARM_UP_STEPS: dict[str, Callable[[], Awaitable[None]]] = {
+    "model_clients": _warm_model_clients,
+    "databases": _warm_databases,
+    "fetcher": fetcher.open,
+    "extractor": extractor.warm_up,
+    "tokenizer": _warm_tokenizer,
+    "router": router.warm_up,
+    "response_cache": response_cache.warm_up,
+}
+
+
+async def _step(name: str, step: Callable[[], Awaitable[None]], status: WarmUpStatus) -> None:
+    try:
+        with span(f"warm_up:{name}"):
+            await step()
+    except Exception as e:
+        logger.error(f"Warm-up step {name} failed: {e}")
+        status.failed.append(name)
+
+
+async def warm_up(status: WarmUpStatus = warm_up_status) -> None:
+    """Create model clients, connection pools, the extraction pool and other
+    lazily built state ahead of the first turn, so it doesn't pay for them.
+
+    The worker reports ready once every step has succeeded.
+    """
+    await asyncio.gather(*(_step(name, step, status) for name, step in WARM_UP_STEPS.items()))
+    status.seconds = round(time.perf_counter() - status.started, 3)
+    status.ready = not status.failed
+    if status.ready:
+        logger.info(f"Warm-up finished in {status.seconds}s")
+    else:
+        logger.error(f"Warm-up failed after {status.seconds}s: {', '.join(status.failed)}")
+
+
+async def shut_down() -> None:
+    """Release the clients, pools and database connections warm-up created."""
+    await model_clients.close()
+    await fetcher.close()
+    extractor.shutdown()
+    store.close()
+    content_cache.close()
@@ -0,0 +1,158 @@
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Callable, Iterator, Mapping, Optional
+
+# Latency buckets in seconds, from local cache lookups up to long reasoning turns.
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+Labels = tuple[tuple[str, str], ...]
+
+
+def _labels(labels: Labels, extra: str = "") -> str:
+    parts = [f'{key}="{value}"' for key, value in labels]
+    if extra:
+        parts.append(extra)
+    if not parts:
+        return ""
+    return "{" + ",".join(parts) + "}"
+
+
+def _key(labels: Mapping[str, Any]) -> Labels:
+    return tuple(sorted((key, str(value).replace("\\", "\\\\").replace('"', '\\"')) for key, value in labels.items()))
+
+
+class Counter:
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._values: dict[Labels, float] = defaultdict(float)
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        self._values[_key(labels)] += amount
+
+    def total(self) -> float:
+        """Sum over every label set."""
+        return sum(self._values.values())
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        lines += [f"{self.name}{_labels(labels)} {value}" for labels, value in self._values.items()]
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets: tuple[float, ...] = BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        # labels -> (bucket counts, sum, count)
+        self._values: dict[Labels, list[Any]] = {}
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = _key(labels)
+        entry = self._values.get(key)
+        if entry is None:
+            entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                entry[0][i] += 1
+        entry[1] += value
+        entry[2] += 1
+
+    def totals(self) -> dict[Labels, tuple[int, float]]:
+        """(count, sum) of the observations so far, per label set."""
+        return {labels: (count, total) for labels, (_, total, count) in self._values.items()}
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total, count) in self._values.items():
+            for bound, bucket_count in zip(self.buckets, counts):
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_labels(labels, le)} {bucket_count}")
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_labels(labels, le)} {count}")
+            lines.append(f"{self.name}_sum{_labels(labels)} {total}")
+            lines.append(f"{self.name}_count{_labels(labels)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """Process-wide metrics, rendered in the Prometheus text format.
+
+    Besides counters and histograms, components that already keep their own
+    stats dict register it with `collect` and are read at scrape time.
+    """
+
+    def __init__(self):
+        self._metrics: list[Counter | Histogram] = []
+        self._collectors: list[tuple[str, str, Callable[[], Mapping[str, float]]]] = []
+
+    def counter(self, name: str, help: str) -> Counter:
+        metric = Counter(name, help)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help: str, buckets: tuple[float, ...] = BUCKETS) -> Histogram:
+        metric = Histogram(name, help, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def collect(self, name: str, help: str, stats: Callable[[], Mapping[str, float]]) -> None:
+        """Expose a stats dict as `name{stat="<key>"} <value>`."""
+        self._collectors.append((name, help, stats))
+
+    def render(self) -> str:
+        lines: list[str] = []
+        for metric in self._metrics:
+            lines += metric.render()
+        for name, help, stats in self._collectors:
+            lines += [f"# HELP {name} {help}", f"# TYPE {name} gauge"]
+            lines += [f'{name}{{stat="{key}"}} {float(value)}' for key, value in stats().items()]
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+span_seconds = metrics.histogram("kijang_span_seconds", "Duration of each traced step of a turn, by span.")
+turn_seconds = metrics.histogram("kijang_turn_seconds", "Duration of whole turns, by outcome.")
+model_tokens = metrics.counter("kijang_model_tokens_total", "Tokens used by model calls, by client and kind.")
+
+
+@dataclass
+class Trace:
+    """Spans recorded during one turn."""
+
+    name: str
+    started: float = field(default_factory=time.perf_counter)
+    # (span, start offset, duration, attributes)
+    spans: list[tuple[str, float, float, dict[str, Any]]] = field(default_factory=list)
+
+    def breakdown(self) -> dict[str, float]:
+        """Total seconds per span name."""
+        totals: dict[str, float] = defaultdict(float)
+        for name, _, duration, _ in self.spans:
+            totals[name] += duration
+        return {name: round(total, 4) for name, total in totals.items()}
+
+
+current_trace: ContextVar[Optional[Trace]] = ContextVar("current_trace", default=None)
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[dict[str, Any]]:
+    """Time a step, record it in the span histogram and the current turn's trace.
+
+    Yields the attribute dict so the step can add to it, e.g. token counts.
+    """
+    start = time.perf_counter()
+    try:
+        yield attributes
+    finally:
+        duration = time.perf_counter() - start
+        span_seconds.observe(duration, span=name)
+        trace = current_trace.get()
+        if trace is not None:
+            trace.spans.append((name, start - trace.started, duration, attributes))
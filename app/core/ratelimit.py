@@ -0,0 +1,206 @@
+import asyncio
+import os
+import time
+from collections import Counter, OrderedDict
+from contextlib import nullcontext
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Optional
+
+from app.core.metrics import span
+from app.logger import logger
+
+
+class TokenBucket:
+    """Asyncio token bucket: `rate` tokens per second, bursting up to `capacity`.
+
+    Waiters are served in FIFO order and sleep on the event loop instead of
+    blocking the thread. `debit` takes tokens without waiting and may leave
+    the bucket in debt, which later waiters pay off.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    @property
+    def available(self) -> float:
+        self._refill()
+        return self._tokens
+
+    async def acquire(self, tokens: float = 1.0, timeout: Optional[float] = None) -> float:
+        """Wait for `tokens` and return how many were taken. With `timeout`, raise
+        asyncio.TimeoutError as soon as it is clear they won't be available in
+        time, rather than wait that long.
+        """
+        # More than the capacity could never be granted; wait for a full bucket instead.
+        tokens = min(tokens, self.capacity)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        async with self._lock:
+            while True:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return tokens
+                wait = (tokens - self._tokens) / self.rate
+                if deadline is not None and time.monotonic() + wait > deadline:
+                    raise asyncio.TimeoutError()
+                await asyncio.sleep(wait)
+
+    def debit(self, tokens: float) -> None:
+        """Take `tokens` now, or give them back if negative."""
+        self._refill()
+        self._tokens = min(self.capacity, self._tokens - tokens)
+
+
+class QuotaExceeded(Exception):
+    """Raised when model tokens aren't available within the quota's wait limit."""
+
+    def __init__(self, scope: str, name: str):
+        super().__init__(f"Model token quota for {scope} {name} exhausted")
+        self.scope = scope
+        self.name = name
+
+
+# The session whose turn is running; model calls made for it are charged to it.
+current_session: ContextVar[Optional[str]] = ContextVar("current_session", default=None)
+
+
+@dataclass
+class _Account:
+    bucket: Optional[TokenBucket]
+    usage: Counter = field(default_factory=Counter)
+
+
+class TokenQuotas:
+    """Model tokens per minute, per session and per model.
+
+    A call reserves its estimated prompt tokens from the current session's
+    bucket and its model's bucket, waiting while either is short, and settles
+    the difference once its actual usage is known. Throttling is soft: calls
+    queue for up to `max_wait` seconds and only then fail with QuotaExceeded.
+    A limit of 0 means unlimited; tokens are still counted. Usage is counted
+    per worker since it started.
+    """
+
+    def __init__(
+        self,
+        session_tpm: int = int(os.getenv("QUOTA_SESSION_TPM", "0")),
+        model_tpm: int = int(os.getenv("QUOTA_MODEL_TPM", "0")),
+        max_wait: float = float(os.getenv("QUOTA_MAX_WAIT", "10")),
+        max_sessions: int = int(os.getenv("QUOTA_SESSIONS", "10000")),
+    ):
+        self.session_tpm = session_tpm
+        self.model_tpm = model_tpm
+        self.max_wait = max_wait
+        self.max_sessions = max_sessions
+        self._sessions: OrderedDict[str, _Account] = OrderedDict()
+        self._models: dict[str, _Account] = {}
+        self.counters: Counter = Counter()
+
+    @staticmethod
+    def _bucket(tokens_per_minute: int) -> Optional[TokenBucket]:
+        return TokenBucket(tokens_per_minute / 60, tokens_per_minute) if tokens_per_minute > 0 else None
+
+    def set_model_limit(self, model: str, tokens_per_minute: int) -> None:
+        """Limit `model` to `tokens_per_minute`, e.g. the provider's limit for it."""
+        self._model(model).bucket = self._bucket(tokens_per_minute)
+
+    def _model(self, model: str) -> _Account:
+        account = self._models.get(model)
+        if account is None:
+            account = self._models[model] = _Account(self._bucket(self.model_tpm))
+        return account
+
+    def _session(self, session_id: str) -> _Account:
+        account = self._sessions.get(session_id)
+        if account is None:
+            account = self._sessions[session_id] = _Account(self._bucket(self.session_tpm))
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        else:
+            self._sessions.move_to_end(session_id)
+        return account
+
+    def _accounts(self, model: str) -> list[tuple[str, str, _Account]]:
+        accounts = [("model", model, self._model(model))]
+        session_id = current_session.get()
+        if session_id is not None:
+            accounts.insert(0, ("session", session_id, self._session(session_id)))
+        return accounts
+
+    async def acquire(self, model: str, tokens: int) -> dict[str, float]:
+        """Reserve `tokens` for a call to `model` on behalf of the current session.
+
+        Returns the tokens taken from each scope's bucket, which is less than
+        `tokens` where the bucket is smaller; settle the call against them.
+        """
+        started = time.monotonic()
+        reserved: dict[str, float] = {}
+        held: list[tuple[TokenBucket, float]] = []
+        for scope, name, account in self._accounts(model):
+            bucket = account.bucket
+            if bucket is None:
+                continue
+            throttled = bucket.available < tokens
+            if throttled:
+                self.counters[f"{scope}_throttled"] += 1
+            try:
+                with span("quota_wait", scope=scope) if throttled else nullcontext():
+                    taken = await bucket.acquire(tokens, max(0.0, self.max_wait - (time.monotonic() - started)))
+            except asyncio.TimeoutError:
+                for earlier, earlier_taken in held:
+                    earlier.debit(-earlier_taken)
+                self.counters[f"{scope}_rejected"] += 1
+                logger.warning(f"Quota for {scope} {name} exhausted; call to {model} rejected")
+                raise QuotaExceeded(scope, name)
+            reserved[scope] = taken
+            held.append((bucket, taken))
+        return reserved
+
+    def record(
+        self, model: str, reserved: dict[str, float], prompt_tokens: int = 0, completion_tokens: int = 0
+    ) -> None:
+        """Settle a call against what it used, given what `acquire` reserved for it.
+
+        A call that failed records no usage, which refunds its reservation.
+        """
+        used = prompt_tokens + completion_tokens
+        for scope, _, account in self._accounts(model):
+            if account.bucket is not None:
+                account.bucket.debit(used - reserved.get(scope, 0))
+            if used:
+                account.usage["calls"] += 1
+                account.usage["prompt_tokens"] += prompt_tokens
+                account.usage["completion_tokens"] += completion_tokens
+                if scope == "session":
+                    account.usage[f"{model}_tokens"] += used
+
+    @staticmethod
+    def _report(account: Optional[_Account], tokens_per_minute: int) -> dict[str, Any]:
+        bucket = account.bucket if account is not None else None
+        return {
+            "usage": dict(account.usage) if account is not None else {},
+            "tokens_per_minute": round(bucket.capacity) if bucket is not None else tokens_per_minute,
+            "available_tokens": round(bucket.available) if bucket is not None else None,
+        }
+
+    def session_usage(self, session_id: str) -> dict[str, Any]:
+        return self._report(self._sessions.get(session_id), self.session_tpm)
+
+    def model_usage(self) -> dict[str, dict[str, Any]]:
+        return {model: self._report(account, self.model_tpm) for model, account in self._models.items()}
+
+    def stats(self) -> dict[str, int]:
+        return {**self.counters, "sessions": len(self._sessions)}
+
+
+quotas = TokenQuotas()
@@ -0,0 +1,174 @@
+import asyncio
+import hashlib
+import json
+import os
+from collections import Counter, OrderedDict
+from datetime import datetime
+from typing import Any, Mapping, Optional, Sequence
+
+from app.core.tools.cache import content_cache
+from app.core.tools.search import normalize_query
+from app.logger import logger
+
+# Answers are cached per question, routed model, day and conversation so far,
+# so date-sensitive answers ("today", "latest") never outlive the date in the
+# system prompt and follow-ups are never answered from another conversation.
+KIND = "response"
+
+
+def _bucket() -> str:
+    return datetime.now().strftime("%Y-%m-%d")
+
+
+def conversation_context(history: Sequence[Mapping[str, Any]]) -> str:
+    """Digest of a session's earlier messages, or "" for its first turn."""
+    turns = [
+        [message.get("source"), message["content"]]
+        for message in history
+        if isinstance(message.get("content"), str)
+    ]
+    if not turns:
+        return ""
+    return hashlib.sha256(json.dumps(turns).encode()).hexdigest()
+
+
+class ResponseCache:
+    """Opt-in cache of final answers in front of the team.
+
+    Lookups are exact on the normalized question within the same
+    conversation context (see `conversation_context`), so first turns are
+    shared across sessions but a follow-up only hits after the same earlier
+    turns. With `similarity` set, a miss falls back to the nearest cached
+    question of the same model, day and context in a local embedding index
+    (requires `sentence-transformers`), served if its cosine similarity
+    reaches `similarity`. Answers that used web search expire after `web_ttl`
+    instead of `ttl`.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = os.getenv("RESPONSE_CACHE", "0") == "1",
+        ttl: float = float(os.getenv("RESPONSE_CACHE_TTL", "86400")),
+        web_ttl: float = float(os.getenv("RESPONSE_CACHE_WEB_TTL", "600")),
+        similarity: float = float(os.getenv("RESPONSE_CACHE_SIMILARITY", "0")),
+        embedding_model: str = os.getenv("RESPONSE_CACHE_EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2"),
+        index_size: int = int(os.getenv("RESPONSE_CACHE_INDEX_SIZE", "5000")),
+    ):
+        self.enabled = enabled
+        self.ttl = ttl
+        self.web_ttl = web_ttl
+        self.similarity = similarity
+        self.embedding_model = embedding_model
+        self.index_size = index_size
+        # (model, bucket, context, normalized question) -> unit vector, oldest first.
+        self._index: OrderedDict[tuple[str, str, str, str], Any] = OrderedDict()
+        self._encoder: Optional[Any] = None
+        self._encoder_failed = False
+        self.counters: Counter = Counter()
+
+    @staticmethod
+    def _key(model: str, bucket: str, context: str, normalized: str) -> str:
+        return hashlib.sha256(f"{model}\n{bucket}\n{context}\n{normalized}".encode()).hexdigest()
+
+    async def get(self, question: str, model: Optional[str], context: str = "") -> Optional[dict[str, Any]]:
+        """Return the cached answer for `question` routed to `model` after `context`, if any.
+
+        `model` is None when the question could not be routed without the
+        IntentAgent, which counts as a miss.
+        """
+        if not self.enabled:
+            return None
+        if model is None:
+            self.counters["misses"] += 1
+            return None
+        normalized, bucket = normalize_query(question), _bucket()
+        value = await content_cache.get(KIND, self._key(model, bucket, context, normalized))
+        if value is not None:
+            self.counters["exact_hits"] += 1
+            return value
+        if self.similarity > 0:
+            nearest = await self._nearest(model, bucket, context, normalized)
+            if nearest is not None:
+                value = await content_cache.get(KIND, self._key(model, bucket, context, nearest))
+                if value is not None:
+                    self.counters["similar_hits"] += 1
+                    return value
+        self.counters["misses"] += 1
+        return None
+
+    async def set(
+        self, question: str, model: str, value: dict[str, Any], used_web: bool = False, context: str = ""
+    ) -> None:
+        if not self.enabled:
+            return
+        normalized, bucket = normalize_query(question), _bucket()
+        await content_cache.set(
+            KIND, self._key(model, bucket, context, normalized), value, self.web_ttl if used_web else self.ttl
+        )
+        self.counters["stores"] += 1
+        if self.similarity > 0:
+            vector = await self._embed(normalized)
+            if vector is not None:
+                self._index[(model, bucket, context, normalized)] = vector
+                self._index.move_to_end((model, bucket, context, normalized))
+                while len(self._index) > self.index_size:
+                    self._index.popitem(last=False)
+
+    async def invalidate(self, question: str, model: Optional[str] = None) -> int:
+        """Drop today's cached answers to `question` asked as a first turn, for one model or all.
+
+        Returns how many were removed. Answers to the same words as a
+        follow-up are keyed on their conversation and left to expire.
+        """
+        normalized, bucket = normalize_query(question), _bucket()
+        removed = 0
+        for routed in [model] if model else ["chat", "reasoning"]:
+            self._index.pop((routed, bucket, "", normalized), None)
+            removed += await content_cache.delete(KIND, self._key(routed, bucket, "", normalized))
+        self.counters["invalidations"] += removed
+        return removed
+
+    async def warm_up(self) -> None:
+        """Load the embedding model now rather than on the first lookup."""
+        if self.enabled and self.similarity > 0:
+            await self._embed("warm up")
+
+    def stats(self) -> dict[str, Any]:
+        lookups = self.counters["exact_hits"] + self.counters["similar_hits"] + self.counters["misses"]
+        hits = self.counters["exact_hits"] + self.counters["similar_hits"]
+        return {
+            **self.counters,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "indexed": len(self._index),
+        }
+
+    async def _embed(self, text: str) -> Optional[Any]:
+        if self._encoder is None and not self._encoder_failed:
+            try:
+                from sentence_transformers import SentenceTransformer
+
+                self._encoder = await asyncio.to_thread(SentenceTransformer, self.embedding_model)
+            except Exception as e:
+                logger.warning(f"Embedding model unavailable, near-duplicate lookup disabled: {e}")
+                self._encoder_failed = True
+        if self._encoder is None:
+            return None
+        return await asyncio.to_thread(self._encoder.encode, text, normalize_embeddings=True)
+
+    async def _nearest(self, model: str, bucket: str, context: str, normalized: str) -> Optional[str]:
+        candidates = [key for key in self._index if key[:3] == (model, bucket, context)]
+        if not candidates:
+            return None
+        vector = await self._embed(normalized)
+        if vector is None:
+            return None
+        import numpy as np
+
+        scores = np.stack([self._index[key] for key in candidates]) @ vector
+        best = int(np.argmax(scores))
+        if scores[best] < self.similarity:
+            return None
+        return candidates[best][3]
+
+
+response_cache = ResponseCache()
@@ -0,0 +1,124 @@
+import asyncio
+import os
+from collections import Counter
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import AsyncIterator, Optional
+
+from app.core.metrics import span
+from app.logger import logger
+
+
+class ServerBusy(Exception):
+    """Raised when a turn can't be admitted soon enough and is shed instead."""
+
+
+@dataclass
+class _Admission:
+    # The pool whose slot the turn holds; None while it waits to move pools.
+    pool: Optional[str]
+
+
+# The admission of the turn running in this context.
+_admission: ContextVar[Optional[_Admission]] = ContextVar("turn_admission", default=None)
+
+
+class TurnScheduler:
+    """Admission control for turns.
+
+    Turns run in a pool for their routed model, so slow `reasoning` turns
+    can't take every slot from cheap `chat` turns, and under a global cap.
+    A turn that can't get both slots within `admit_timeout`, or that would
+    join more than `max_waiting` queued turns, is shed with ServerBusy
+    rather than left to time out.
+
+    The pool a turn is admitted to is a guess made before the turn is routed;
+    `enter` moves the turn to the pool of the model that actually answers it.
+    """
+
+    def __init__(
+        self,
+        max_turns: int = int(os.getenv("TURN_MAX_CONCURRENCY", "32")),
+        pool_sizes: dict[str, int] = {
+            "chat": int(os.getenv("TURN_CHAT_CONCURRENCY", "24")),
+            "reasoning": int(os.getenv("TURN_REASONING_CONCURRENCY", "8")),
+        },
+        max_waiting: int = int(os.getenv("TURN_MAX_WAITING", "64")),
+        admit_timeout: float = float(os.getenv("TURN_ADMIT_TIMEOUT", "2")),
+    ):
+        self.max_turns = max_turns
+        self.pool_sizes = dict(pool_sizes)
+        self.max_waiting = max_waiting
+        self.admit_timeout = admit_timeout
+        self._global = asyncio.Semaphore(max_turns)
+        self._pools = {pool: asyncio.Semaphore(size) for pool, size in self.pool_sizes.items()}
+        self._waiting = 0
+        self.active: Counter = Counter()
+        self.counters: Counter = Counter()
+
+    @asynccontextmanager
+    async def admit(self, pool: str) -> AsyncIterator[None]:
+        """Hold a slot in `pool` and a global slot for the duration of a turn."""
+        if self._waiting >= self.max_waiting:
+            self.counters[f"{pool}_shed"] += 1
+            raise ServerBusy()
+        self._waiting += 1
+        try:
+            with span("admit", pool=pool):
+                await asyncio.wait_for(self._acquire(pool), self.admit_timeout)
+        except asyncio.TimeoutError:
+            self.counters[f"{pool}_shed"] += 1
+            logger.warning(f"Shedding {pool} turn: no slot within {self.admit_timeout}s")
+            raise ServerBusy()
+        finally:
+            self._waiting -= 1
+        self.counters[f"{pool}_admitted"] += 1
+        self.active[pool] += 1
+        admission = _Admission(pool)
+        reset = _admission.set(admission)
+        try:
+            yield
+        finally:
+            _admission.reset(reset)
+            if admission.pool is not None:
+                self.active[admission.pool] -= 1
+                self._pools[admission.pool].release()
+            self._global.release()
+
+    async def enter(self, pool: str) -> None:
+        """Move the current turn to `pool`, if it was admitted to another one.
+
+        The turn gives up its old pool slot and keeps its global slot while it
+        waits for one in `pool`. Outside a turn this does nothing.
+        """
+        admission = _admission.get()
+        if admission is None or admission.pool in (pool, None) or pool not in self._pools:
+            return
+        self.active[admission.pool] -= 1
+        self._pools[admission.pool].release()
+        self.counters[f"{admission.pool}_moved"] += 1
+        admission.pool = None
+        with span("admit", pool=pool):
+            await self._pools[pool].acquire()
+        admission.pool = pool
+        self.active[pool] += 1
+
+    async def _acquire(self, pool: str) -> None:
+        # Pool first, so a turn queued behind its own pool holds no global slot.
+        await self._pools[pool].acquire()
+        try:
+            await self._global.acquire()
+        except BaseException:
+            self._pools[pool].release()
+            raise
+
+    def stats(self) -> dict[str, int]:
+        return {
+            **self.counters,
+            **{f"{pool}_active": count for pool, count in self.active.items()},
+            "waiting": self._waiting,
+        }
+
+
+scheduler = TurnScheduler()
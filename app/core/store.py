@@ -0,0 +1,248 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Mapping, Optional, TypeVar
+
+from app.logger import logger
+
+T = TypeVar("T")
+
+# Fold the WAL back into the main database every this many writes.
+COMPACT_EVERY = 500
+
+# Schema migrations, applied in order and tracked with PRAGMA user_version.
+MIGRATIONS: list[list[str]] = [
+    [
+        """CREATE TABLE IF NOT EXISTS messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_id TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            source TEXT,
+            type TEXT,
+            data TEXT NOT NULL
+        )""",
+        "CREATE INDEX IF NOT EXISTS messages_session ON messages (session_id, id)",
+        """CREATE TABLE IF NOT EXISTS team_state (
+            session_id TEXT PRIMARY KEY,
+            version INTEGER NOT NULL,
+            updated_at REAL NOT NULL,
+            data TEXT NOT NULL
+        )""",
+    ],
+    # Full-text index over message text.
+    [
+        "ALTER TABLE messages ADD COLUMN content TEXT",
+        "CREATE VIRTUAL TABLE messages_fts USING fts5(content, content='messages', content_rowid='id')",
+        """CREATE TRIGGER messages_fts_insert AFTER INSERT ON messages BEGIN
+            INSERT INTO messages_fts (rowid, content) VALUES (new.id, new.content);
+        END""",
+        """CREATE TRIGGER messages_fts_delete AFTER DELETE ON messages BEGIN
+            INSERT INTO messages_fts (messages_fts, rowid, content) VALUES ('delete', old.id, old.content);
+        END""",
+        "UPDATE messages SET content = json_extract(data, '$.content') WHERE json_type(data, '$.content') = 'text'",
+        "INSERT INTO messages_fts (messages_fts) VALUES ('rebuild')",
+    ],
+]
+
+
+def _migrate(conn: sqlite3.Connection) -> None:
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        (version,) = conn.execute("PRAGMA user_version").fetchone()
+        for statements in MIGRATIONS[version:]:
+            for statement in statements:
+                conn.execute(statement)
+        conn.execute(f"PRAGMA user_version = {len(MIGRATIONS)}")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+
+def _fts_query(query: str) -> str:
+    """Quote every term so user input can't be parsed as FTS5 query syntax."""
+    return " ".join('"' + term.replace('"', '""') + '"' for term in query.split())
+
+
+class ChatStore:
+    """Append-only chat history and team state checkpoints in SQLite.
+
+    History is written one row per message, so persisting a turn costs the
+    size of that turn rather than the size of the whole conversation. Both
+    tables are scoped by session id. The database runs in WAL mode, so any
+    number of uvicorn workers can read and write it concurrently, and all I/O
+    happens off the event loop.
+    """
+
+    def __init__(self, path: str):
+        self._path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._writes = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self._path)), exist_ok=True)
+            conn = sqlite3.connect(self._path, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=5000")
+            _migrate(conn)
+            self._conn = conn
+        return self._conn
+
+    async def _run(self, fn: Callable[[sqlite3.Connection], T]) -> T:
+        def _locked() -> T:
+            with self._lock:
+                return fn(self._connect())
+        return await asyncio.to_thread(_locked)
+
+    def _wrote(self, conn: sqlite3.Connection) -> None:
+        self._writes += 1
+        if self._writes % COMPACT_EVERY == 0:
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            logger.debug("Compacted chat store WAL")
+
+    async def append_message(self, session_id: str, message: Mapping[str, Any]) -> int:
+        """Append one message to the session's history log and return its id."""
+        data = json.dumps(message)
+
+        content = message.get("content")
+        content = content if isinstance(content, str) else None
+
+        def _append(conn: sqlite3.Connection) -> int:
+            cursor = conn.execute(
+                "INSERT INTO messages (session_id, created_at, source, type, content, data) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (session_id, time.time(), message.get("source"), message.get("type"), content, data),
+            )
+            self._wrote(conn)
+            return cursor.lastrowid
+
+        return await self._run(_append)
+
+    async def get_messages(
+        self,
+        session_id: str,
+        before: Optional[int] = None,
+        limit: Optional[int] = None,
+        after: Optional[int] = None,
+    ) -> list[dict[str, Any]]:
+        """Return the session's messages in order, each with its `id`.
+
+        With `limit`, only the newest `limit` messages older than the `before`
+        id are returned, so clients can page backwards from the tail. With
+        `after`, only messages newer than that id are returned, so a client
+        that reconnects gets just what it missed.
+        """
+        def _select(conn: sqlite3.Connection) -> list[dict[str, Any]]:
+            rows = conn.execute(
+                "SELECT id, data FROM messages WHERE session_id = ? AND id < ? AND id > ? ORDER BY id DESC LIMIT ?",
+                (
+                    session_id,
+                    before if before is not None else 2**63 - 1,
+                    after if after is not None else 0,
+                    limit if limit is not None else -1,
+                ),
+            ).fetchall()
+            return [{"id": id, **json.loads(data)} for id, data in reversed(rows)]
+
+        return await self._run(_select)
+
+    async def search_messages(self, session_id: str, query: str, limit: int = 20) -> list[dict[str, Any]]:
+        """Full-text search over the session's messages, best matches first."""
+        def _search(conn: sqlite3.Connection) -> list[dict[str, Any]]:
+            rows = conn.execute(
+                "SELECT m.id, m.data, snippet(messages_fts, 0, '**', '**', '...', 16) "
+                "FROM messages_fts JOIN messages m ON m.id = messages_fts.rowid "
+                "WHERE messages_fts MATCH ? AND m.session_id = ? ORDER BY rank LIMIT ?",
+                (_fts_query(query), session_id, limit),
+            ).fetchall()
+            return [{"id": id, **json.loads(data), "snippet": snippet} for id, data, snippet in rows]
+
+        if not query.strip():
+            return []
+        return await self._run(_search)
+
+    async def save_state(self, session_id: str, state: Mapping[str, Any], version: int) -> Optional[int]:
+        """Checkpoint the session's team state and return the new state version.
+
+        `version` is the version the team was loaded at. If another worker has
+        checkpointed the session since, nothing is written and None is returned,
+        rather than overwrite the turn that worker saved.
+        """
+        data = json.dumps(state)
+
+        def _save(conn: sqlite3.Connection) -> Optional[int]:
+            if version == 0:
+                row = conn.execute(
+                    "INSERT INTO team_state (session_id, version, updated_at, data) VALUES (?, 1, ?, ?) "
+                    "ON CONFLICT(session_id) DO NOTHING RETURNING version",
+                    (session_id, time.time(), data),
+                ).fetchone()
+            else:
+                row = conn.execute(
+                    "UPDATE team_state SET version = version + 1, updated_at = ?, data = ? "
+                    "WHERE session_id = ? AND version = ? RETURNING version",
+                    (time.time(), data, session_id, version),
+                ).fetchone()
+            self._wrote(conn)
+            return row[0] if row else None
+
+        return await self._run(_save)
+
+    async def load_state(self, session_id: str) -> tuple[Optional[dict[str, Any]], int]:
+        """Return the session's last checkpoint and its version (0 if there is none)."""
+        def _load(conn: sqlite3.Connection) -> tuple[Optional[dict[str, Any]], int]:
+            row = conn.execute(
+                "SELECT data, version FROM team_state WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            return (json.loads(row[0]), row[1]) if row else (None, 0)
+
+        return await self._run(_load)
+
+    async def state_version(self, session_id: str) -> int:
+        """Cheap check for checkpoints written by other workers."""
+        def _version(conn: sqlite3.Connection) -> int:
+            row = conn.execute(
+                "SELECT version FROM team_state WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            return row[0] if row else 0
+
+        return await self._run(_version)
+
+    async def clear(self, session_id: str) -> None:
+        """Delete the session's history and team state."""
+        def _clear(conn: sqlite3.Connection) -> None:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+                # Keep the row so the version keeps increasing and warm teams in
+                # other workers notice the reset.
+                conn.execute(
+                    "UPDATE team_state SET version = version + 1, updated_at = ?, data = 'null' "
+                    "WHERE session_id = ?",
+                    (time.time(), session_id),
+                )
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+        await self._run(_clear)
+
+    async def open(self) -> None:
+        """Open the database now rather than on first use."""
+        await self._run(lambda conn: None)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+store = ChatStore(os.getenv("DB_PATH", "app/local/chat.db"))
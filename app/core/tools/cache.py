@@ -0,0 +1,190 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+from typing import Any, Callable, Optional, TypeVar
+
+from cachetools import LRUCache
+
+from app.logger import logger
+
+T = TypeVar("T")
+
+# Enforce the on-disk size limit every this many writes.
+EVICT_EVERY = 100
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    kind TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    expires_at REAL NOT NULL,
+    accessed_at REAL NOT NULL,
+    PRIMARY KEY (kind, key)
+);
+CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed_at);
+"""
+
+
+class ContentCache:
+    """Two-tier cache for web content: an in-memory LRU over a SQLite file.
+
+    Both tiers are bounded by total size and evict least recently used
+    entries first; the on-disk tier is shared by every worker. Hits served
+    from memory still count as uses of the on-disk entry, so the disk tier
+    doesn't evict the hottest pages. Entries are namespaced by `kind`, e.g.
+    raw pages by URL and summaries by URL and query.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        memory_bytes: int = int(os.getenv("CACHE_MEMORY_BYTES", str(32 * 1024 * 1024))),
+        max_bytes: int = int(os.getenv("CACHE_MAX_BYTES", str(256 * 1024 * 1024))),
+    ):
+        self._path = path
+        self.max_bytes = max_bytes
+        # (kind, key) -> (expires_at, value, size in bytes of its JSON).
+        self._memory: LRUCache = LRUCache(maxsize=memory_bytes, getsizeof=lambda entry: entry[2])
+        # Memory hits not yet recorded as accesses of the on-disk entry.
+        self._touched: dict[tuple[str, str], float] = {}
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.counters: Counter = Counter()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self._path)), exist_ok=True)
+            conn = sqlite3.connect(self._path, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=5000")
+            conn.executescript(SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    async def _run(self, fn: Callable[[sqlite3.Connection], T]) -> T:
+        def _locked() -> T:
+            with self._lock:
+                return fn(self._connect())
+        return await asyncio.to_thread(_locked)
+
+    async def get(self, kind: str, key: str) -> Optional[dict[str, Any]]:
+        now = time.time()
+        entry = self._memory.get((kind, key))
+        if entry is not None and entry[0] > now:
+            self.counters[f"{kind}_memory_hits"] += 1
+            self._touched[(kind, key)] = now
+            return entry[1]
+
+        def _get(conn: sqlite3.Connection) -> Optional[tuple[str, float]]:
+            self._record_touches(conn)
+            row = conn.execute(
+                "SELECT value, expires_at FROM entries WHERE kind = ? AND key = ? AND expires_at > ?",
+                (kind, key, now),
+            ).fetchone()
+            if row is not None:
+                conn.execute(
+                    "UPDATE entries SET accessed_at = ? WHERE kind = ? AND key = ?", (now, kind, key)
+                )
+            return row
+
+        try:
+            row = await self._run(_get)
+        except sqlite3.Error as e:
+            logger.warning(f"Content cache read failed: {e}")
+            row = None
+        if row is None:
+            self.counters[f"{kind}_misses"] += 1
+            return None
+        value = json.loads(row[0])
+        self._remember(kind, key, row[1], value, len(row[0]))
+        self.counters[f"{kind}_disk_hits"] += 1
+        return value
+
+    async def set(self, kind: str, key: str, value: dict[str, Any], ttl: float) -> None:
+        now = time.time()
+        data = json.dumps(value)
+        self._remember(kind, key, now + ttl, value, len(data))
+
+        def _set(conn: sqlite3.Connection) -> None:
+            self._record_touches(conn)
+            conn.execute(
+                "INSERT OR REPLACE INTO entries (kind, key, value, size, expires_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (kind, key, data, len(data), now + ttl, now),
+            )
+            self._writes += 1
+            if self._writes % EVICT_EVERY == 0:
+                self._evict(conn, now)
+
+        try:
+            await self._run(_set)
+        except sqlite3.Error as e:
+            logger.warning(f"Content cache write failed: {e}")
+
+    def _remember(self, kind: str, key: str, expires_at: float, value: dict[str, Any], size: int) -> None:
+        if size > self._memory.maxsize:
+            # Too big to keep in memory at all; the disk tier still has it.
+            self._memory.pop((kind, key), None)
+            return
+        self._memory[(kind, key)] = (expires_at, value, size)
+
+    def _record_touches(self, conn: sqlite3.Connection) -> None:
+        touched, self._touched = self._touched, {}
+        if touched:
+            conn.executemany(
+                "UPDATE entries SET accessed_at = MAX(accessed_at, ?) WHERE kind = ? AND key = ?",
+                [(accessed_at, kind, key) for (kind, key), accessed_at in touched.items()],
+            )
+
+    async def delete(self, kind: str, key: str) -> bool:
+        self._memory.pop((kind, key), None)
+
+        def _delete(conn: sqlite3.Connection) -> bool:
+            return conn.execute("DELETE FROM entries WHERE kind = ? AND key = ?", (kind, key)).rowcount > 0
+
+        try:
+            return await self._run(_delete)
+        except sqlite3.Error as e:
+            logger.warning(f"Content cache delete failed: {e}")
+            return False
+
+    def _evict(self, conn: sqlite3.Connection, now: float) -> None:
+        conn.execute("DELETE FROM entries WHERE expires_at <= ?", (now,))
+        (total,) = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()
+        if total <= self.max_bytes:
+            return
+        # Drop least recently used entries until we are back under the limit.
+        excess = total - self.max_bytes
+        conn.execute(
+            "DELETE FROM entries WHERE rowid IN ("
+            "  SELECT rowid FROM ("
+            "    SELECT rowid, SUM(size) OVER (ORDER BY accessed_at ROWS UNBOUNDED PRECEDING) - size AS preceding"
+            "    FROM entries"
+            "  ) WHERE preceding < ?"
+            ")",
+            (excess,),
+        )
+        self.counters["evictions"] += 1
+
+    def stats(self) -> dict[str, int]:
+        return dict(self.counters)
+
+    async def open(self) -> None:
+        """Open the database now rather than on first use."""
+        await self._run(lambda conn: None)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+content_cache = ContentCache(os.getenv("CACHE_PATH", "app/local/cache.db"))
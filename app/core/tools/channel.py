@@ -0,0 +1,43 @@
+import asyncio
+from contextvars import ContextVar
+from typing import Any, Optional
+
+
+class ToolResultChannel:
+    """Typed side channel from tools to the websocket handler, scoped to one turn.
+
+    Agents only see a tool's stringified return value. Tools publish the
+    original objects here so the handler can forward them to the client
+    without parsing that string back, as soon as they are published rather
+    than when the tool returns.
+    """
+
+    def __init__(self):
+        self._results: asyncio.Queue[tuple[str, Any]] = asyncio.Queue()
+
+    def publish(self, tool_name: str, value: Any) -> None:
+        self._results.put_nowait((tool_name, value))
+
+    async def get(self) -> tuple[str, Any]:
+        """Wait for the next published (tool name, value)."""
+        return await self._results.get()
+
+    def done(self) -> None:
+        """Mark the value last returned by `get` as handled."""
+        self._results.task_done()
+
+    async def join(self) -> None:
+        """Wait until every value published so far has been handled."""
+        await self._results.join()
+
+
+# Set by the handler around a team run; tool calls inherit it through the
+# tasks the team's runtime spawns.
+current_channel: ContextVar[Optional[ToolResultChannel]] = ContextVar("current_channel", default=None)
+
+
+def publish(tool_name: str, value: Any) -> None:
+    """Publish a tool result to the current turn's channel, if there is one."""
+    channel = current_channel.get()
+    if channel is not None:
+        channel.publish(tool_name, value)
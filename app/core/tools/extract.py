@@ -0,0 +1,167 @@
+import asyncio
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+
+from app.core.tokens import truncate_to_tokens
+from app.core.metrics import span
+from app.logger import logger
+
+BOILERPLATE_TAGS = [
+    "script", "style", "noscript", "template", "iframe", "svg", "canvas",
+    "nav", "footer", "header", "aside", "form", "button",
+]
+BOILERPLATE_PATTERN = re.compile(
+    r"(?<![a-z])(comment|sidebar|footer|masthead|nav|menu|share|social|advert|ads?|promo|"
+    r"related|recommend|cookie|banner|subscribe|newsletter|popup|modal|breadcrumbs?)(?![a-z])",
+    re.IGNORECASE,
+)
+POSITIVE_PATTERN = re.compile(
+    r"(?<![a-z])(article|body|content|entry|main|page|post|text|blog|story)(?![a-z])", re.IGNORECASE
+)
+# Containers never removed by the class/id heuristics.
+PROTECTED_TAGS = {"html", "body", "main", "article"}
+
+
+def _names(tag) -> str:
+    return " ".join(tag.get("class") or []) + " " + (tag.get("id") or "")
+
+
+def _paragraph_text(tag) -> int:
+    return sum(len(p.get_text(strip=True)) for p in tag.find_all("p"))
+
+
+def _link_density(tag) -> float:
+    text = len(tag.get_text(strip=True))
+    links = sum(len(a.get_text(strip=True)) for a in tag.find_all("a"))
+    return links / text if text else 0.0
+
+
+def _best_candidate(root):
+    """Pick the block that scores highest for the paragraphs it holds, like readability does.
+
+    Each paragraph scores its parent in full and its grandparent by half; a
+    block's class and id add or take away points, and its link density
+    scales the total down.
+    """
+    candidates: dict[int, list] = {}
+    for paragraph in root.find_all(["p", "pre", "td"]):
+        text = paragraph.get_text(" ", strip=True)
+        if len(text) < 25:
+            continue
+        score = 1 + text.count(",") + min(len(text) // 100, 3)
+        for ancestor, share in ((paragraph.parent, 1.0), (paragraph.parent and paragraph.parent.parent, 0.5)):
+            if ancestor is None or ancestor.name in (None, "[document]"):
+                continue
+            candidate = candidates.setdefault(id(ancestor), [ancestor, _class_weight(ancestor)])
+            candidate[1] += score * share
+    best, best_score = root, 0.0
+    for tag, score in candidates.values():
+        score *= 1 - _link_density(tag)
+        if score > best_score:
+            best, best_score = tag, score
+    return best
+
+
+def _class_weight(tag) -> int:
+    names = _names(tag)
+    return 25 * (bool(POSITIVE_PATTERN.search(names)) - bool(BOILERPLATE_PATTERN.search(names)))
+
+
+def _remove_boilerplate(root) -> None:
+    """Remove blocks inside `root` whose class or id looks like page chrome.
+
+    Blocks that wrap an article or main element, or hold at least half of the
+    paragraph text, are layout wrappers rather than chrome and are kept.
+    """
+    total = _paragraph_text(root)
+
+    def is_boilerplate(tag) -> bool:
+        if tag.name in PROTECTED_TAGS or not BOILERPLATE_PATTERN.search(_names(tag)):
+            return False
+        return not tag.find(["article", "main"]) and _paragraph_text(tag) * 2 < max(total, 1)
+
+    for tag in root.find_all(is_boilerplate):
+        if not tag.decomposed:
+            tag.decompose()
+
+
+def extract_main_content(html: str, max_tokens: int) -> str:
+    """Return the main content of a page as markdown, cut to `max_tokens`.
+
+    CPU heavy; runs in the extraction process pool.
+    """
+    import markdownify
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html, "lxml")
+    for tag in soup.find_all(BOILERPLATE_TAGS):
+        tag.decompose()
+
+    root = soup.find("article") or soup.find("main") or _best_candidate(soup.body or soup)
+    _remove_boilerplate(root)
+    markdown = markdownify.markdownify(str(root), heading_style="ATX")
+    markdown = re.sub(r"\n\s*\n+", "\n\n", markdown).strip()
+    return truncate_to_tokens(markdown, max_tokens)
+
+
+class Extractor:
+    """Runs page extraction in a bounded process pool, off the event loop."""
+
+    def __init__(
+        self,
+        max_workers: int = int(os.getenv("EXTRACT_WORKERS", str(min(4, os.cpu_count() or 1)))),
+        max_tokens: int = int(os.getenv("EXTRACT_MAX_TOKENS", "3000")),
+    ):
+        self.max_workers = max_workers
+        self.max_tokens = max_tokens
+        self._pool: Optional[ProcessPoolExecutor] = None
+        # Bounds pages queued for the pool, so bursts don't pile up pickled HTML.
+        self._slots = asyncio.Semaphore(max_workers * 2)
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # Spawned, not forked: forked workers would inherit the sockets of
+            # every open client connection and keep them from ever closing.
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.max_workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._pool
+
+    async def extract(self, html: str) -> Optional[str]:
+        with span("extract", bytes=len(html)):
+            return await self._extract(html)
+
+    async def _extract(self, html: str) -> Optional[str]:
+        async with self._slots:
+            loop = asyncio.get_running_loop()
+            try:
+                return await loop.run_in_executor(
+                    self._get_pool(), extract_main_content, html, self.max_tokens
+                )
+            except BrokenProcessPool:
+                logger.error("Extraction process pool died; restarting it")
+                self._pool = None
+            except Exception as e:
+                logger.warning(f"Error extracting content: {e}")
+        return None
+
+    async def warm_up(self) -> None:
+        """Start the pool's workers, and their parsing imports, ahead of the first page."""
+        loop = asyncio.get_running_loop()
+        pool = self._get_pool()
+        await asyncio.gather(*(
+            loop.run_in_executor(pool, extract_main_content, "<html><body><p>warm up</p></body></html>", 10)
+            for _ in range(self.max_workers)
+        ))
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+extractor = Extractor()
@@ -0,0 +1,157 @@
+import asyncio
+import os
+import ssl
+from collections import Counter
+from dataclasses import dataclass
+from typing import Optional
+from urllib.parse import urlsplit
+
+from aiohttp import ClientError, ClientSession, ClientTimeout, TCPConnector
+from cachetools import LRUCache
+
+from app.core.ratelimit import TokenBucket
+from app.core.metrics import span
+from app.logger import logger
+
+ssl_context = ssl.create_default_context()
+ssl_context.check_hostname = False
+ssl_context.verify_mode = ssl.CERT_NONE
+
+CHUNK_SIZE = 64 * 1024
+
+
+@dataclass
+class FetchedPage:
+    url: str
+    body: str
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    # True when the server answered 304 to a conditional request; `body` is empty.
+    not_modified: bool = False
+
+
+class Fetcher:
+    """Long-lived web page fetcher shared by every tool call.
+
+    All requests go through one pooled `ClientSession`. Each host gets its own
+    concurrency limit and token-bucket rate limit, bodies are capped at
+    `max_bytes`, and concurrent fetches of the same URL share one request.
+    """
+
+    def __init__(
+        self,
+        max_connections: int = int(os.getenv("FETCH_MAX_CONNECTIONS", "50")),
+        per_host_concurrency: int = int(os.getenv("FETCH_PER_HOST_CONCURRENCY", "4")),
+        per_host_rate: float = float(os.getenv("FETCH_PER_HOST_RATE", "10")),
+        max_bytes: int = int(os.getenv("FETCH_MAX_BYTES", str(2 * 1024 * 1024))),
+        timeout: float = float(os.getenv("FETCH_TIMEOUT", "5")),
+        max_redirects: int = int(os.getenv("FETCH_MAX_REDIRECTS", "5")),
+    ):
+        self.max_connections = max_connections
+        self.per_host_concurrency = per_host_concurrency
+        self.per_host_rate = per_host_rate
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.max_redirects = max_redirects
+        self._session: Optional[ClientSession] = None
+        self._hosts: LRUCache = LRUCache(maxsize=1024)
+        self._inflight: dict[str, asyncio.Task] = {}
+        self._waiters: Counter = Counter()
+
+    def _get_session(self) -> ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = ClientSession(
+                connector=TCPConnector(
+                    limit=self.max_connections,
+                    limit_per_host=self.per_host_concurrency,
+                    ssl=ssl_context,
+                    ttl_dns_cache=300,
+                ),
+                timeout=ClientTimeout(total=self.timeout),
+            )
+        return self._session
+
+    def _host_limits(self, url: str) -> tuple[asyncio.Semaphore, TokenBucket]:
+        host = urlsplit(url).hostname or ""
+        limits = self._hosts.get(host)
+        if limits is None:
+            limits = (asyncio.Semaphore(self.per_host_concurrency), TokenBucket(self.per_host_rate))
+            self._hosts[host] = limits
+        return limits
+
+    async def fetch(
+        self, url: str, etag: Optional[str] = None, last_modified: Optional[str] = None
+    ) -> Optional[FetchedPage]:
+        """Fetch `url`, or return None if it could not be fetched.
+
+        Passing the validators of a cached copy makes the request conditional.
+        """
+        task = self._inflight.get(url)
+        if task is None:
+            task = asyncio.create_task(self._fetch(url, etag, last_modified))
+            self._inflight[url] = task
+            task.add_done_callback(lambda done: self._forget(url, done))
+        # Shield so one cancelled caller doesn't cancel the fetch for the others,
+        # but stop it once every caller has gone.
+        self._waiters[url] += 1
+        try:
+            with span("fetch", host=urlsplit(url).hostname):
+                return await asyncio.shield(task)
+        finally:
+            self._waiters[url] -= 1
+            if self._waiters[url] <= 0:
+                del self._waiters[url]
+                self._forget(url, task)
+                task.cancel()
+
+    def _forget(self, url: str, task: asyncio.Task) -> None:
+        if self._inflight.get(url) is task:
+            del self._inflight[url]
+
+    async def _fetch(
+        self, url: str, etag: Optional[str], last_modified: Optional[str]
+    ) -> Optional[FetchedPage]:
+        headers = {}
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+        semaphore, bucket = self._host_limits(url)
+        try:
+            async with semaphore:
+                await bucket.acquire()
+                async with self._get_session().get(
+                    url, headers=headers, max_redirects=self.max_redirects
+                ) as response:
+                    if response.status == 304:
+                        return FetchedPage(url=url, body="", etag=etag, last_modified=last_modified, not_modified=True)
+                    if response.status != 200:
+                        return None
+                    body = bytearray()
+                    async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                        body.extend(chunk)
+                        if len(body) >= self.max_bytes:
+                            logger.info(f"Truncated {url} at {self.max_bytes} bytes")
+                            del body[self.max_bytes:]
+                            break
+                    return FetchedPage(
+                        url=url,
+                        body=body.decode(response.charset or "utf-8", errors="replace"),
+                        etag=response.headers.get("ETag"),
+                        last_modified=response.headers.get("Last-Modified"),
+                    )
+        except (ClientError, asyncio.TimeoutError, LookupError) as e:
+            logger.warning(f"Error fetching {url}: {e}")
+        return None
+
+    async def open(self) -> None:
+        """Create the connection pool now rather than on the first fetch."""
+        self._get_session()
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+fetcher = Fetcher()
@@ -0,0 +1,122 @@
+import asyncio
+import hashlib
+import os
+import re
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Protocol
+
+from cachetools import TTLCache
+
+from app.core.metrics import span
+from app.logger import logger
+
+
+def normalize_query(query: str) -> str:
+    """Canonical form of a query, so trivially different phrasings share cache entries."""
+    return re.sub(r"\s+", " ", query).strip().strip("?!.").lower()
+
+
+class SearchProvider(Protocol):
+    async def search(self, query: str, num_results: int) -> list[str]:
+        """Return up to `num_results` URLs relevant to `query`."""
+        ...
+
+
+class GoogleSearchProvider:
+    """Google search via `googlesearch`, which blocks, so it runs on its own threads."""
+
+    def __init__(self, region: str = "my", max_workers: int = int(os.getenv("SEARCH_WORKERS", "4"))):
+        self.region = region
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="search")
+
+    def _search(self, query: str, num_results: int) -> list[str]:
+        from googlesearch import search
+
+        return list(search(query, num_results=num_results, region=self.region))
+
+    async def search(self, query: str, num_results: int) -> list[str]:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._search, query, num_results)
+
+
+class StubSearchProvider:
+    """Offline provider returning URLs from a fixed list, for tests and benchmarks.
+
+    When the list is longer than `num_results`, each query gets a run of
+    consecutive URLs starting at a point picked by hashing it: the same query
+    always gets the same URLs, and different queries spread over the list.
+    """
+
+    def __init__(self, urls: Optional[list[str]] = None):
+        if urls is None:
+            urls = [url for url in os.getenv("SEARCH_STUB_URLS", "").split(",") if url]
+        self.urls = urls
+
+    async def search(self, query: str, num_results: int) -> list[str]:
+        if len(self.urls) <= num_results:
+            return list(self.urls)
+        first = int(hashlib.sha256(query.encode()).hexdigest(), 16) % len(self.urls)
+        return [self.urls[(first + i) % len(self.urls)] for i in range(num_results)]
+
+
+PROVIDERS: dict[str, type] = {
+    "google": GoogleSearchProvider,
+    "stub": StubSearchProvider,
+}
+
+
+class CachedSearch:
+    """Query -> URLs cache with TTL in front of a search provider.
+
+    Concurrent searches for the same normalized query share one provider call.
+    """
+
+    def __init__(
+        self,
+        provider: SearchProvider,
+        maxsize: int = int(os.getenv("SEARCH_CACHE_SIZE", "1024")),
+        ttl: float = float(os.getenv("SEARCH_CACHE_TTL", "900")),
+    ):
+        self.provider = provider
+        self._cache: TTLCache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._inflight: dict[tuple[str, int], asyncio.Task] = {}
+        self.counters: Counter = Counter()
+
+    async def search(self, query: str, num_results: int = 3) -> list[str]:
+        key = (normalize_query(query), num_results)
+        urls = self._cache.get(key)
+        if urls is not None:
+            self.counters["hits"] += 1
+            return list(urls)
+        task = self._inflight.get(key)
+        if task is None:
+            self.counters["misses"] += 1
+            task = asyncio.create_task(self._search(key))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self.counters["shared"] += 1
+        with span("search"):
+            return list(await asyncio.shield(task))
+
+    async def _search(self, key: tuple[str, int]) -> list[str]:
+        query, num_results = key
+        try:
+            urls = await self.provider.search(query, num_results)
+        except Exception as e:
+            logger.warning(f"Search failed for '{query}': {e}")
+            return []
+        self._cache[key] = urls
+        return urls
+
+
+def get_search_provider(name: Optional[str] = None) -> SearchProvider:
+    name = name or os.getenv("SEARCH_PROVIDER", "google")
+    try:
+        return PROVIDERS[name]()
+    except KeyError:
+        raise RuntimeError(f"Unknown search provider '{name}'")
+
+
+searcher = CachedSearch(get_search_provider())
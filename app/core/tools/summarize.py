@@ -0,0 +1,228 @@
+import asyncio
+import math
+import os
+import re
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Optional
+
+import json_repair
+from autogen_core import CancellationToken
+from autogen_core.models import UserMessage
+
+from app.core.agents.prompts import history_prompt, summary_prompt
+from app.core.agents.registry import model_clients
+from app.core.tokens import count_tokens, truncate_to_tokens
+from app.core.metrics import span
+from app.logger import logger
+
+# Words kept by extractive summaries, matching the length asked of the model.
+EXTRACTIVE_WORDS = 300
+
+# Length of the running summary kept for trimmed conversation history.
+HISTORY_SUMMARY_TOKENS = int(os.getenv("HISTORY_SUMMARY_TOKENS", "500"))
+# Tokens kept per message when history is folded locally.
+HISTORY_LINE_TOKENS = 60
+
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "how", "in", "is", "it",
+    "of", "on", "or", "that", "the", "this", "to", "was", "what", "when", "where", "which",
+    "who", "why", "with", "about", "latest", "today", "me", "tell", "please",
+}
+
+
+def _terms(text: str) -> list[str]:
+    return re.findall(r"\w+", text.lower())
+
+
+def extractive_summary(markdown: str, query: str, max_words: int = EXTRACTIVE_WORDS) -> str:
+    """Rank the page's sentences against the query locally and keep the best ones.
+
+    Sentences are scored with BM25 over the page itself and returned in their
+    original order, so no model call is needed.
+    """
+    sentences = [s.strip() for s in re.split(r"(?<=[.!?])\s+|\n+", markdown) if len(s.strip()) > 20]
+    if not sentences:
+        return markdown[: max_words * 8]
+    query_terms = set(_terms(query)) - STOPWORDS
+    documents = [_terms(sentence) for sentence in sentences]
+    average_length = sum(len(d) for d in documents) / len(documents) or 1.0
+    document_frequency = Counter(term for d in documents for term in set(d))
+
+    def score(document: list[str]) -> float:
+        counts = Counter(document)
+        total = 0.0
+        for term in query_terms & counts.keys():
+            idf = math.log(1 + (len(documents) - document_frequency[term] + 0.5) / (document_frequency[term] + 0.5))
+            tf = counts[term]
+            total += idf * tf * 2.2 / (tf + 1.2 * (0.25 + 0.75 * len(document) / average_length))
+        return total
+
+    ranked = sorted(range(len(sentences)), key=lambda i: score(documents[i]), reverse=True)
+    chosen, words = [], 0
+    for i in ranked:
+        if words >= max_words:
+            break
+        chosen.append(i)
+        words += len(documents[i])
+    return " ".join(sentences[i] for i in sorted(chosen))
+
+
+@dataclass
+class _PendingBatch:
+    query: str
+    cancellation_token: Optional[CancellationToken]
+    timer: asyncio.TimerHandle
+    pages: dict[str, str] = field(default_factory=dict)
+    tokens: int = 0
+    # Resolves to url -> summary once the batch's request returns.
+    summaries: asyncio.Future = field(default_factory=lambda: asyncio.get_running_loop().create_future())
+
+
+class Summarizer:
+    """Summarizes extracted pages for a query.
+
+    Modes:
+        batch: pages are packed into requests of at most `batch_tokens` tokens,
+            so a typical search needs a single model call.
+        extractive: ranked snippets computed locally, with no model call.
+
+    `summarize_page` summarizes one page at a time: in batch mode, pages for
+    the same query and turn that arrive within `batch_window` seconds of each
+    other share one request.
+
+    The same mode decides how trimmed conversation history is folded into a
+    session's running summary.
+    """
+
+    def __init__(
+        self,
+        mode: str = os.getenv("SUMMARY_MODE", "batch"),
+        model: str = os.getenv("SUMMARY_MODEL", "gpt-4o-mini"),
+        batch_tokens: int = int(os.getenv("SUMMARY_BATCH_TOKENS", "12000")),
+        batch_window: float = float(os.getenv("SUMMARY_BATCH_WINDOW", "0.2")),
+    ):
+        if mode not in ("batch", "extractive"):
+            raise RuntimeError(f"Unknown summary mode '{mode}'")
+        self.mode = mode
+        self.model = model
+        self.batch_tokens = batch_tokens
+        self.batch_window = batch_window
+        self._pending: dict[tuple[str, int], _PendingBatch] = {}
+
+    async def summarize(
+        self, query: str, pages: dict[str, str], cancellation_token: Optional[CancellationToken] = None
+    ) -> dict[str, str]:
+        """Summarize `pages` (url -> markdown) and return url -> summary."""
+        with span("summarize", pages=len(pages), mode=self.mode):
+            if self.mode == "extractive":
+                return {url: extractive_summary(markdown, query) for url, markdown in pages.items()}
+
+            summaries = {}
+            for batch in self._batches(pages):
+                summaries.update(await self._summarize_batch(query, batch, cancellation_token))
+            return summaries
+
+    async def summarize_page(
+        self, query: str, url: str, markdown: str, cancellation_token: Optional[CancellationToken] = None
+    ) -> Optional[str]:
+        """Summarize one page, sharing a request with pages that arrive close behind it."""
+        if self.mode == "extractive" or self.batch_window <= 0:
+            return (await self.summarize(query, {url: markdown}, cancellation_token)).get(url)
+        key = (query, id(cancellation_token))
+        batch = self._pending.get(key)
+        if batch is None:
+            timer = asyncio.get_running_loop().call_later(self.batch_window, self._flush, key)
+            batch = self._pending[key] = _PendingBatch(query, cancellation_token, timer)
+        batch.pages[url] = markdown
+        batch.tokens += count_tokens(markdown)
+        if batch.tokens >= self.batch_tokens:
+            self._flush(key)
+        # Shielded: one page's caller giving up must not fail the rest of the batch.
+        return (await asyncio.shield(batch.summaries)).get(url)
+
+    def _flush(self, key: tuple[str, int]) -> None:
+        batch = self._pending.pop(key, None)
+        if batch is None:
+            return
+        batch.timer.cancel()
+
+        def settle(task: asyncio.Task) -> None:
+            if task.cancelled():
+                batch.summaries.cancel()
+            elif task.exception() is not None:
+                batch.summaries.set_exception(task.exception())
+            else:
+                batch.summaries.set_result(task.result())
+
+        task = asyncio.ensure_future(self.summarize(batch.query, batch.pages, batch.cancellation_token))
+        task.add_done_callback(settle)
+        batch.summaries.add_done_callback(lambda f: f.cancelled() or f.exception())
+
+    def _batches(self, pages: dict[str, str]) -> list[dict[str, str]]:
+        batches, batch, tokens = [], {}, 0
+        for url, markdown in pages.items():
+            size = count_tokens(markdown)
+            if batch and tokens + size > self.batch_tokens:
+                batches.append(batch)
+                batch, tokens = {}, 0
+            batch[url] = markdown
+            tokens += size
+        if batch:
+            batches.append(batch)
+        return batches
+
+    async def _summarize_batch(
+        self, query: str, batch: dict[str, str], cancellation_token: Optional[CancellationToken]
+    ) -> dict[str, str]:
+        urls = list(batch)
+        rendered = "\n\n".join(
+            f"<page id={i} url={url}>\n{batch[url]}\n</page>" for i, url in enumerate(urls, start=1)
+        )
+        summaries: dict[str, str] = {}
+        try:
+            result = await model_clients.get(self.model).create(
+                [UserMessage(content=summary_prompt.format(query=query, pages=rendered), source="user")],
+                json_output=True,
+                cancellation_token=cancellation_token,
+            )
+            for entry in json_repair.loads(result.content).get("summaries", []):
+                index = int(entry["id"]) - 1
+                if 0 <= index < len(urls) and entry.get("summary"):
+                    summaries[urls[index]] = entry["summary"]
+        except Exception as e:
+            logger.warning(f"Error summarizing content: {e}")
+        # Anything the model dropped still gets a local summary.
+        for url in urls:
+            if url not in summaries:
+                summaries[url] = extractive_summary(batch[url], query)
+        return summaries
+
+    async def fold_history(self, summary: str, transcript: str) -> str:
+        """Extend a conversation's running summary with older messages trimmed from its context."""
+        if self.mode == "batch":
+            try:
+                result = await model_clients.get(self.model).create([
+                    UserMessage(
+                        content=history_prompt.format(
+                            summary=summary or "(none)",
+                            transcript=transcript,
+                            words=HISTORY_SUMMARY_TOKENS * 3 // 4,
+                        ),
+                        source="user",
+                    )
+                ])
+                if isinstance(result.content, str) and result.content.strip():
+                    return truncate_to_tokens(result.content.strip(), HISTORY_SUMMARY_TOKENS)
+            except Exception as e:
+                logger.warning(f"Error summarizing conversation history: {e}")
+        # Locally, keep the start of each message and let the oldest lines fall off.
+        lines = summary.splitlines() + [
+            truncate_to_tokens(line, HISTORY_LINE_TOKENS) for line in transcript.splitlines() if line.strip()
+        ]
+        while len(lines) > 1 and count_tokens("\n".join(lines)) > HISTORY_SUMMARY_TOKENS:
+            lines.pop(0)
+        return "\n".join(lines)
+
+
+summarizer = Summarizer()
@@ -1,116 +1,134 @@
 import re
-import yaml
 import os
-import ssl
 from typing import List, Optional
-from functools import lru_cache
-from googlesearch import search
-import httpx
-from bs4 import BeautifulSoup
-import markdownify
 import asyncio
+import time
+from autogen_core import CancellationToken
 from pydantic import BaseModel
-from openai import AsyncOpenAI
-from aiohttp import ClientSession, TCPConnector
-from cachetools import TTLCache
-from ratelimit import limits, sleep_and_retry
 
-# Cache for URLs, TTL of 1 hour
-url_cache = TTLCache(maxsize=100, ttl=3600)
+from app.core.metrics import metrics
+from app.core.tools.cache import content_cache
+from app.core.tools.channel import publish
+from app.core.tools.extract import extractor
+from app.core.tools.fetcher import fetcher
+from app.core.tools.search import normalize_query, searcher
+from app.core.tools.summarize import summarizer
+from app.logger import logger
+
+# Cached page bodies are served as-is while fresh, then revalidated with
+# ETag/Last-Modified until they expire.
+PAGE_FRESH_TTL = float(os.getenv("PAGE_FRESH_TTL", "600"))
+PAGE_CACHE_TTL = float(os.getenv("PAGE_CACHE_TTL", "86400"))
+SUMMARY_CACHE_TTL = float(os.getenv("SUMMARY_CACHE_TTL", "3600"))
+# Seconds a search may take; pages not summarized by then are left out.
+WEB_SEARCH_DEADLINE = float(os.getenv("WEB_SEARCH_DEADLINE", "8"))
+
+web_pages = metrics.counter(
+    "kijang_web_pages_total", "Search result pages by outcome: cached, summarized, failed or late (past the deadline)."
+)
 
 class WebPage(BaseModel):
     url: str
     content: str
     timestamp: float
 
-# Load config once at module level
-def load_config():
-    with open(os.getenv("MODEL_CONFIG_PATH"), "r") as file:
-        configs = yaml.safe_load(file)
-        return configs["models"]["gpt-4o-mini"]
+async def fetch_url(url: str) -> Optional[str]:
+    cached = await content_cache.get("page", url)
+    if cached is not None and time.time() - cached["fetched_at"] < PAGE_FRESH_TTL:
+        return cached["body"]
 
-model_config = load_config()
-async_client = AsyncOpenAI(api_key=model_config["config"]["api_key"])
+    page = await fetcher.fetch(
+        url,
+        etag=cached["etag"] if cached else None,
+        last_modified=cached["last_modified"] if cached else None,
+    )
+    if page is None:
+        # A stale copy beats no copy.
+        return cached["body"] if cached else None
+    body = cached["body"] if page.not_modified else page.body
+    await content_cache.set("page", url, {
+        "body": body,
+        "etag": page.etag,
+        "last_modified": page.last_modified,
+        "fetched_at": time.time(),
+    }, ttl=PAGE_CACHE_TTL)
+    return body
 
-ssl_context = ssl.create_default_context()
-ssl_context.check_hostname = False
-ssl_context.verify_mode = ssl.CERT_NONE
+def _summary_key(url: str, query: str) -> str:
+    return f"{url}\n{normalize_query(query)}"
 
-# Rate limiting decorator
-@sleep_and_retry
-@limits(calls=10, period=1)  # 10 requests per second
-@lru_cache(maxsize=100)
-async def fetch_url(url: str, session: ClientSession) -> Optional[str]:
-    try:
-        async with session.get(url, timeout=5, ssl=ssl_context) as response:
-            if response.status == 200:
-                return await response.text()
-    except Exception as e:
-        print(f"Error fetching {url}: {e}")
-    return None
-
-async def extract_content(html: str, query: str) -> Optional[str]:
+async def extract_page(url: str) -> Optional[str]:
+    """Fetch a page and return its main content, already cut to the token budget."""
+    html = await fetch_url(url)
     if not html:
         return None
-    
-    soup = BeautifulSoup(html, "lxml")  # lxml is faster than html.parser
-    
-    # Remove unnecessary elements
-    for tag in soup.find_all(['script', 'style', 'nav', 'footer']):
-        tag.decompose()
-    
-    content = str(soup.body) if soup.body else str(soup)
-    markdown = markdownify.markdownify(content, heading_style="ATX")
-    
-    try:
-        completion = await async_client.chat.completions.create(
-            model=model_config["config"]["model"],
-            messages=[{
-                "role": "user", 
-                "content": f"Summarize the following content in 300 words specifically for information related to the '{query}':\n{markdown}"
-            }],
-        )
-        return completion.choices[0].message.content
-    except Exception as e:
-        print(f"Error summarizing content: {e}")
-        return None
+    return await extractor.extract(html)
 
-async def get_relevant_web_pages(query: str) -> List[WebPage]:
+async def get_relevant_web_pages(query: str, cancellation_token: CancellationToken) -> List[WebPage]:
+    # Cancelling the turn cancels the searches, fetches and summaries below;
+    # page fetches shared with other turns carry on for them.
+    work = asyncio.ensure_future(_relevant_web_pages(query, cancellation_token))
+    cancellation_token.link_future(work)
+    return await work
+
+async def _relevant_web_pages(query: str, cancellation_token: CancellationToken) -> List[WebPage]:
+    """Run every result page through fetch, extract and summarize on its own.
+
+    Pages whose extraction finishes close together are summarized in one
+    request. Each page is published to the client as soon as its summary is
+    ready, and the agent gets the pages that were ready by the deadline, in
+    search order.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + WEB_SEARCH_DEADLINE
     url_pattern = re.compile(
         r"^(?:http(s)?:\/\/)?[\w.-]+(?:\.[\w\.-]+)+[\w\-\._~:/?#[\]@!$&'()*+,;=.]+$",
         re.IGNORECASE,
     )
 
-    urls = [query] if bool(url_pattern.match(query)) else list(search(query, num_results=3, region="my"))
-    
-    async with ClientSession(connector=TCPConnector(limit=5, ssl=ssl_context)) as session:
-        tasks = []
-        for url in urls:
-            if url in url_cache:
-                tasks.append(url_cache[url])
-            else:
-                task = asyncio.create_task(fetch_url(url, session))
-                tasks.append(task)
-                
-        htmls = await asyncio.gather(*tasks)
-        
-        content_tasks = [
-            extract_content(html, query) 
-            for html, url in zip(htmls, urls) 
-            if html
-        ]
-        
-        contents = await asyncio.gather(*content_tasks)
-        
-        results = []
-        for url, content in zip(urls, contents):
-            if content:
-                webpage = WebPage(
-                    url=url,
-                    content=content,
-                    timestamp=asyncio.get_event_loop().time()
-                )
-                url_cache[url] = webpage
-                results.append(webpage)
-                
-        return results
\ No newline at end of file
+    urls = [query] if bool(url_pattern.match(query)) else await searcher.search(query, num_results=3)
+    urls = list(dict.fromkeys(urls))
+
+    pending = {asyncio.create_task(_web_page(url, query, cancellation_token)) for url in urls}
+    webpages: dict[str, WebPage] = {}
+    try:
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, timeout=max(0.0, deadline - loop.time()), return_when=asyncio.FIRST_COMPLETED
+            )
+            if not done:
+                break
+            for task in done:
+                webpage = task.result()
+                if webpage is not None:
+                    webpages[webpage.url] = webpage
+                    publish("get_relevant_web_pages", webpage)
+    finally:
+        for task in pending:
+            task.cancel()
+    if pending:
+        web_pages.inc(len(pending), outcome="late")
+    return [webpages[url] for url in urls if url in webpages]
+
+async def _web_page(url: str, query: str, cancellation_token: CancellationToken) -> Optional[WebPage]:
+    # Summaries are query specific, so they are cached per URL and query.
+    cached = await content_cache.get("summary", _summary_key(url, query))
+    if cached is not None:
+        web_pages.inc(outcome="cached")
+        return WebPage(url=url, **cached)
+    try:
+        markdown = await extract_page(url)
+        summary = await summarizer.summarize_page(query, url, markdown, cancellation_token) if markdown else None
+    except Exception as e:
+        logger.warning(f"Error reading {url}: {e}")
+        summary = None
+    if summary is None:
+        web_pages.inc(outcome="failed")
+        return None
+    web_pages.inc(outcome="summarized")
+    now = time.time()
+    await content_cache.set("summary", _summary_key(url, query), {
+        "content": summary,
+        "timestamp": now,
+    }, ttl=SUMMARY_CACHE_TTL)
+    return WebPage(url=url, content=summary, timestamp=now)
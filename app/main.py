@@ -1,28 +1,39 @@
 # app/main.py
+import asyncio
 import os
 import logging
+from contextlib import asynccontextmanager, suppress
 from dotenv import load_dotenv
 
 ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 STATIC_DIR = os.path.join(BASE_DIR, "static")
 
-print(f"ROOT_DIR: {ROOT_DIR}")
-print(f"BASE_DIR: {BASE_DIR}")
-print(f"STATIC_DIR: {STATIC_DIR}")
-
 load_dotenv(os.path.join(ROOT_DIR, '.env'))
 
 from fastapi import FastAPI
 from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, JSONResponse
 from fastapi.staticfiles import StaticFiles
 
-from app.api import chat, history
+from app.api import cache, chat, history, metrics, usage
+from app.core.lifecycle import shut_down, warm_up, warm_up_status
 from app.logger import logger
 
-app = FastAPI(title="Agentic LLM Chatbot API", version="1.0.0")
+logger.debug(f"ROOT_DIR={ROOT_DIR} BASE_DIR={BASE_DIR} STATIC_DIR={STATIC_DIR}")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Warm up in the background, so the worker answers health checks meanwhile.
+    warming = asyncio.create_task(warm_up())
+    yield
+    warming.cancel()
+    with suppress(asyncio.CancelledError):
+        await warming
+    await shut_down()
+
+app = FastAPI(title="Agentic LLM Chatbot API", version="1.0.0", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -34,12 +45,20 @@ app.add_middleware(
 
 app.include_router(chat.router, prefix="/api", tags=["chat"])
 app.include_router(history.router, prefix="/api", tags=["history"])
+app.include_router(cache.router, prefix="/api", tags=["cache"])
+app.include_router(usage.router, prefix="/api", tags=["usage"])
+app.include_router(metrics.router, tags=["metrics"])
 
 app.mount("/static", StaticFiles(directory="."), name="static")
 
 @app.get("/health")
 async def health_check():
-    return {"status": "ok"}
+    """Ready once warm-up has finished; 503 while it runs or if it failed."""
+    if warm_up_status.ready:
+        return {"status": "ok", "warm_up_seconds": warm_up_status.seconds}
+    if warm_up_status.seconds is None:
+        return JSONResponse({"status": "starting"}, status_code=503)
+    return JSONResponse({"status": "failed", "failed": warm_up_status.failed}, status_code=503)
 
 @app.get("/")
 async def root():
@@ -48,4 +67,5 @@ async def root():
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8080)
\ No newline at end of file
+    # Compresses websocket messages for clients that offer permessage-deflate.
+    uvicorn.run(app, host="0.0.0.0", port=8080, ws_per_message_deflate=os.getenv("WS_COMPRESSION", "1") == "1")
\ No newline at end of file
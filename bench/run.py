@@ -0,0 +1,361 @@
+"""Offline load test of the chat websocket.
+
+Runs the real FastAPI app in-process on a local port, with stub models, a
+stub search provider and a local server of canned pages, and drives
+`/api/ws/chat` with 1 up to N simulated users. Reports time to first token,
+end-to-end turn latency, throughput, event loop lag, memory and the time
+spent per traced step, and can save the results as a JSON baseline or
+compare them against one.
+
+    python -m bench.run --clients 1,8,32 --turns 4 --save bench/baseline.json
+    python -m bench.run --clients 1,8,32 --turns 4 --compare bench/baseline.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import socket
+import sys
+import tempfile
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Optional
+
+# Prompts cycled through by the simulated users: greetings routed by the local
+# rules, questions the IntentAgent routes, reasoning turns and web searches.
+PROMPTS = [
+    "hello there",
+    "explain how interest rates affect inflation, case {n}",
+    "what is the latest news about the ringgit, topic {n}",
+    "walk me step by step through compound interest for loan {n}",
+    "what is the current price of palm oil in market {n}",
+]
+
+
+@dataclass
+class TurnResult:
+    outcome: str
+    seconds: float
+    ttft: Optional[float]
+
+
+def percentiles(values: list[float]) -> dict[str, Optional[float]]:
+    """Nearest-rank p50/p95/p99 and max, in seconds."""
+    if not values:
+        return {"p50": None, "p95": None, "p99": None, "max": None}
+    ordered = sorted(values)
+
+    def rank(p: float) -> float:
+        return round(ordered[min(len(ordered) - 1, max(0, int(p * len(ordered) + 0.5) - 1))], 4)
+
+    return {"p50": rank(0.50), "p95": rank(0.95), "p99": rank(0.99), "max": round(ordered[-1], 4)}
+
+
+class LoopLagMonitor:
+    """Samples how late the event loop wakes a sleeping task."""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.lags: list[float] = []
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self) -> None:
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.lags.append(max(0.0, time.perf_counter() - started - self.interval))
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+
+def rss_mb() -> Optional[float]:
+    try:
+        import psutil
+    except ImportError:
+        return None
+    return round(psutil.Process().memory_info().rss / 2**20, 1)
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS.
+    return round(peak / (2**20 if sys.platform == "darwin" else 2**10), 1)
+
+
+def decode(data: str | bytes, protocol: str) -> list[dict[str, Any]]:
+    """The frames in one websocket message, with their type and source."""
+    from app.api.protocol import TYPE_CODES, _msgpack
+
+    if protocol == "kijang.v1":
+        return [json.loads(data)]
+    names = {code: name for name, code in TYPE_CODES.items()}
+    batch = _msgpack().unpackb(data) if isinstance(data, bytes) else json.loads(data)
+    return [{"type": names.get(frame["t"], frame["t"]), "source": frame.get("s")} for frame in batch]
+
+
+async def simulate_user(
+    url: str, prompts: list[str], think: float, answer_sources: set[str], protocol: str
+) -> list[TurnResult]:
+    from websockets.asyncio.client import connect
+
+    results = []
+    subprotocols = None if protocol == "kijang.v1" else [protocol]
+    async with connect(url, max_size=None, subprotocols=subprotocols) as websocket:
+        for prompt in prompts:
+            sent = time.perf_counter()
+            first, outcome, done = None, "ok", False
+            await websocket.send(json.dumps({"content": prompt, "source": "user"}))
+            while not done:
+                for frame in decode(await websocket.recv(), protocol):
+                    kind = frame.get("type")
+                    if first is None and kind in ("delta", "TextMessage") and frame.get("source") in answer_sources:
+                        first = time.perf_counter() - sent
+                    if kind in ("busy", "error"):
+                        outcome = kind
+                    if kind == "UserInputRequestedEvent":
+                        done = True
+            results.append(TurnResult(outcome, time.perf_counter() - sent, first))
+            await asyncio.sleep(think)
+    return results
+
+
+def _span_totals() -> dict[str, tuple[int, float]]:
+    from app.core.metrics import span_seconds
+
+    return {dict(labels)["span"]: totals for labels, totals in span_seconds.totals().items()}
+
+
+def _sent_bytes() -> float:
+    from app.api.protocol import sent_bytes
+
+    return sent_bytes.total()
+
+
+async def run_level(
+    base_url: str, level: str, clients: int, turns: int, think: float, distinct: int, protocol: str
+) -> dict[str, Any]:
+    from app.core.agents.orchestrator import AGENT_MODELS
+
+    spans_before = _span_totals()
+    bytes_before = _sent_bytes()
+    monitor = LoopLagMonitor()
+    monitor.start()
+    started = time.perf_counter()
+    users = []
+    for client in range(clients):
+        prompts = [
+            PROMPTS[(client + turn) % len(PROMPTS)].format(n=(client * turns + turn) % distinct)
+            for turn in range(turns)
+        ]
+        url = f"{base_url}/api/ws/chat?session_id=bench-{level}-{client}"
+        users.append(simulate_user(url, prompts, think, set(AGENT_MODELS), protocol))
+    results = [result for user in await asyncio.gather(*users) for result in user]
+    wall = time.perf_counter() - started
+    await monitor.stop()
+
+    spans = {}
+    for name, (count, total) in _span_totals().items():
+        before_count, before_total = spans_before.get(name, (0, 0.0))
+        if count > before_count:
+            spans[name] = {
+                "count": count - before_count,
+                "mean": round((total - before_total) / (count - before_count), 5),
+            }
+    ok = [result for result in results if result.outcome == "ok"]
+    return {
+        "clients": clients,
+        "turns": len(results),
+        "ok": len(ok),
+        "busy": sum(result.outcome == "busy" for result in results),
+        "errors": sum(result.outcome == "error" for result in results),
+        "seconds": round(wall, 3),
+        "throughput": round(len(ok) / wall, 3),
+        "ttft": percentiles([result.ttft for result in ok if result.ttft is not None]),
+        "latency": percentiles([result.seconds for result in ok]),
+        "loop_lag": percentiles(monitor.lags),
+        "bytes_per_turn": round((_sent_bytes() - bytes_before) / max(1, len(results))),
+        "rss_mb": rss_mb(),
+        "peak_rss_mb": peak_rss_mb(),
+        "spans": spans,
+    }
+
+
+def install_stubs(args: argparse.Namespace, pages_url: str) -> None:
+    from app.core.agents.intent_agent import IntentOutput
+    from app.core.agents.registry import model_clients
+    from app.core.tools.search import StubSearchProvider, searcher
+    from bench.stubs import StubChatCompletionClient
+
+    def stub(latency: float, response_format: Optional[type] = None) -> StubChatCompletionClient:
+        return StubChatCompletionClient(latency, args.tps, args.answer_tokens, response_format)
+
+    model_clients.set("gpt-4o-mini", stub(args.latency))
+    model_clients.set("gpt-4o-mini", stub(args.latency, IntentOutput), response_format=IntentOutput)
+    model_clients.set("o3-mini", stub(args.reasoning_latency))
+    searcher.provider = StubSearchProvider([f"{pages_url}/page/{n}" for n in range(args.pages)])
+
+
+async def benchmark(args: argparse.Namespace) -> dict[str, Any]:
+    import uvicorn
+
+    from app.core.lifecycle import warm_up_status
+    from app.main import app
+    from bench.stubs import page_server
+
+    async with page_server(args.pages, latency=args.page_latency) as pages_url:
+        install_stubs(args, pages_url)
+        sock = socket.socket()
+        sock.bind(("127.0.0.1", 0))
+        base_url = f"ws://127.0.0.1:{sock.getsockname()[1]}"
+        server = uvicorn.Server(uvicorn.Config(app, log_level="warning", ws="websockets-sansio"))
+        serving = asyncio.create_task(server.serve(sockets=[sock]))
+        while not server.started:
+            if serving.done():
+                # Startup failed; raise why.
+                await serving
+                raise RuntimeError("The app server exited during startup")
+            await asyncio.sleep(0.01)
+        # Measure a warm worker, as a load balancer would only route to one after /health passes.
+        while warm_up_status.seconds is None:
+            await asyncio.sleep(0.01)
+        try:
+            if args.warmup:
+                await run_level(base_url, "warmup", 1, args.warmup, 0, args.distinct, args.protocol)
+            levels = []
+            for index, clients in enumerate(args.clients):
+                # Fresh sessions per level, so each starts with cold teams.
+                level = await run_level(
+                    base_url, f"{index}-c{clients}", clients, args.turns, args.think, args.distinct, args.protocol
+                )
+                levels.append(level)
+                print(_format_level(level), flush=True)
+        finally:
+            server.should_exit = True
+            await serving
+    return {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "settings": {key: value for key, value in vars(args).items() if key not in ("save", "compare")},
+        "levels": levels,
+    }
+
+
+def _format_level(level: dict[str, Any]) -> str:
+    def ms(value: Optional[float]) -> str:
+        return "-" if value is None else f"{value * 1000:.0f}ms"
+
+    return (
+        f"clients={level['clients']:<4} ok={level['ok']}/{level['turns']} busy={level['busy']} errors={level['errors']} "
+        f"throughput={level['throughput']:.2f}/s ttft p50={ms(level['ttft']['p50'])} p95={ms(level['ttft']['p95'])} "
+        f"latency p50={ms(level['latency']['p50'])} p95={ms(level['latency']['p95'])} p99={ms(level['latency']['p99'])} "
+        f"loop lag p99={ms(level['loop_lag']['p99'])} max={ms(level['loop_lag']['max'])} peak rss={level['peak_rss_mb']}MB "
+        f"sent={level['bytes_per_turn']}B/turn"
+    )
+
+
+def _comparable(level: dict[str, Any]) -> dict[str, float]:
+    """Metrics where higher is worse, flattened to `group.stat`."""
+    values = {}
+    for group in ("ttft", "latency", "loop_lag"):
+        for stat in ("p50", "p95", "p99"):
+            if level[group][stat] is not None:
+                values[f"{group}.{stat}"] = level[group][stat]
+    for name, span in level["spans"].items():
+        values[f"span.{name}"] = span["mean"]
+    return values
+
+
+def compare(baseline: dict[str, Any], current: dict[str, Any], tolerance: float, min_delta: float) -> list[str]:
+    """Describe every metric that got worse than the baseline by more than `tolerance`.
+
+    Latencies also have to be `min_delta` seconds worse, so noise in
+    millisecond steps isn't reported.
+    """
+    regressions = []
+    baseline_levels = {level["clients"]: level for level in baseline["levels"]}
+    for level in current["levels"]:
+        before = baseline_levels.get(level["clients"])
+        if before is None:
+            continue
+        if level["throughput"] < before["throughput"] * (1 - tolerance):
+            regressions.append(
+                f"clients={level['clients']} throughput {before['throughput']:.2f}/s -> {level['throughput']:.2f}/s"
+            )
+        old, new = _comparable(before), _comparable(level)
+        for name in sorted(old.keys() & new.keys()):
+            if new[name] > old[name] * (1 + tolerance) and new[name] - old[name] > min_delta:
+                regressions.append(
+                    f"clients={level['clients']} {name} {old[name] * 1000:.1f}ms -> {new[name] * 1000:.1f}ms"
+                )
+    return regressions
+
+
+def parse_args(argv: Optional[list[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--clients", type=lambda s: [int(n) for n in s.split(",")], default=[1, 4, 16], help="Concurrent users per level, e.g. 1,4,16")
+    parser.add_argument("--turns", type=int, default=5, help="Turns per user")
+    parser.add_argument("--think", type=float, default=0.0, help="Seconds each user waits between turns")
+    parser.add_argument("--distinct", type=int, default=1000, help="Distinct questions per prompt; lower repeats questions across users")
+    parser.add_argument("--warmup", type=int, default=2, help="Unmeasured turns before the first level")
+    parser.add_argument("--latency", type=float, default=0.3, help="Chat model seconds to first token")
+    parser.add_argument("--reasoning-latency", type=float, default=1.5, help="Reasoning model seconds to first token")
+    parser.add_argument("--tps", type=float, default=100.0, help="Model output tokens per second")
+    parser.add_argument("--answer-tokens", type=int, default=150, help="Tokens per answer")
+    parser.add_argument("--pages", type=int, default=50, help="Canned pages served to the web search tool")
+    parser.add_argument("--page-latency", type=float, default=0.05, help="Seconds the page server takes per page")
+    parser.add_argument(
+        "--protocol",
+        choices=["kijang.v1", "kijang.v2.json", "kijang.v2.msgpack"],
+        default="kijang.v1",
+        help="Websocket protocol the simulated users negotiate",
+    )
+    parser.add_argument("--save", help="Write the results to this JSON file")
+    parser.add_argument("--compare", help="Compare against this JSON baseline; exits 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Relative change reported as a regression")
+    parser.add_argument("--min-delta", type=float, default=0.005, help="Seconds a latency must grow by to be reported")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    args = parse_args(argv)
+    # Everything the app writes goes to a scratch directory; set before the app is imported.
+    workdir = tempfile.mkdtemp(prefix="kijang-bench-")
+    os.environ["DB_PATH"] = os.path.join(workdir, "chat.db")
+    os.environ["CACHE_PATH"] = os.path.join(workdir, "cache.db")
+    os.environ["INTENT_LOG_PATH"] = os.path.join(workdir, "intent_log.jsonl")
+    os.environ["SEARCH_PROVIDER"] = "stub"
+    os.environ.setdefault("SUMMARY_MODE", "extractive")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+    results = asyncio.run(benchmark(args))
+    if args.save:
+        with open(args.save, "w") as file:
+            json.dump(results, file, indent=2)
+        print(f"Saved results to {args.save}")
+    if args.compare:
+        with open(args.compare, "r") as file:
+            baseline = json.load(file)
+        regressions = compare(baseline, results, args.tolerance, args.min_delta)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            return 1
+        print(f"No regressions against {args.compare}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
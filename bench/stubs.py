@@ -0,0 +1,205 @@
+import asyncio
+import json
+import random
+import socket
+from contextlib import asynccontextmanager
+from typing import Any, AsyncGenerator, AsyncIterator, Mapping, Optional, Sequence, Union
+
+from aiohttp import web
+from autogen_core import CancellationToken, FunctionCall
+from autogen_core.models import (
+    ChatCompletionClient,
+    CreateResult,
+    FunctionExecutionResultMessage,
+    LLMMessage,
+    ModelCapabilities,
+    ModelInfo,
+    RequestUsage,
+    UserMessage,
+)
+from autogen_core.tools import Tool, ToolSchema
+
+# Questions with any of these words get a web search first, like the real agents.
+WEB_WORDS = ("latest", "news", "today", "current", "price")
+
+WORDS = (
+    "the central bank kept its policy rate unchanged while inflation eased and growth held up across "
+    "exports services construction and household spending with analysts expecting a steady path for "
+    "interest rates through the rest of the year as global demand recovered"
+).split()
+
+
+def _text(message: LLMMessage) -> str:
+    content = message.content
+    return content if isinstance(content, str) else json.dumps(content, default=str)
+
+
+def _tokens(text: str) -> int:
+    # Rough count; the stub shouldn't spend the benchmark's CPU on tokenizing.
+    return len(text) // 4 + 1
+
+
+class StubChatCompletionClient(ChatCompletionClient):
+    """Offline stand-in for a model, with the latency profile of a real one.
+
+    Replies start after `latency` seconds and stream at `tokens_per_second`.
+    Like the real agents, a question that looks like it needs fresh facts is
+    answered with a `get_relevant_web_pages` call first. Clients built for a
+    structured `response_format` (the IntentAgent's) return a routing
+    decision, and `json_output` calls (batch summaries) return no summaries,
+    so the summarizer falls back to local ones.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.3,
+        tokens_per_second: float = 100.0,
+        answer_tokens: int = 150,
+        response_format: Optional[type] = None,
+        jitter: float = 0.2,
+        seed: int = 0,
+    ):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.answer_tokens = answer_tokens
+        self.response_format = response_format
+        self.jitter = jitter
+        self._random = random.Random(seed)
+        self._total_usage = RequestUsage(prompt_tokens=0, completion_tokens=0)
+        self._actual_usage = RequestUsage(prompt_tokens=0, completion_tokens=0)
+
+    def _reply(
+        self, messages: Sequence[LLMMessage], tools: Sequence[Tool | ToolSchema], json_output: Optional[bool]
+    ) -> Union[str, list[FunctionCall]]:
+        last = messages[-1] if messages else None
+        question = _text(last) if isinstance(last, UserMessage) else ""
+        if self.response_format is not None:
+            model = "reasoning" if "step by step" in question.lower() else "chat"
+            return json.dumps({"intent": "question_answering", "model": model})
+        if json_output:
+            return json.dumps({"summaries": []})
+        if tools and question and any(word in question.lower() for word in WEB_WORDS):
+            return [FunctionCall(id="call_1", name="get_relevant_web_pages", arguments=json.dumps({"query": question}))]
+        # Tool results were just returned, or no search was needed: answer in full.
+        cited = isinstance(last, FunctionExecutionResultMessage)
+        words = [self._random.choice(WORDS) for _ in range(self.answer_tokens)]
+        return " ".join(words) + (" [source](http://example.com)" if cited else "")
+
+    def _usage(self, messages: Sequence[LLMMessage], reply: Union[str, list[FunctionCall]]) -> RequestUsage:
+        usage = RequestUsage(
+            prompt_tokens=sum(_tokens(_text(message)) for message in messages),
+            completion_tokens=_tokens(reply if isinstance(reply, str) else json.dumps([c.arguments for c in reply])),
+        )
+        self._actual_usage = usage
+        self._total_usage = RequestUsage(
+            prompt_tokens=self._total_usage.prompt_tokens + usage.prompt_tokens,
+            completion_tokens=self._total_usage.completion_tokens + usage.completion_tokens,
+        )
+        return usage
+
+    async def _wait(self, seconds: float, cancellation_token: Optional[CancellationToken]) -> None:
+        task = asyncio.ensure_future(asyncio.sleep(seconds))
+        if cancellation_token is not None:
+            cancellation_token.link_future(task)
+        await task
+
+    def _first_token_delay(self) -> float:
+        return self.latency * (1 + self._random.uniform(-self.jitter, self.jitter))
+
+    async def create(
+        self,
+        messages: Sequence[LLMMessage],
+        *,
+        tools: Sequence[Tool | ToolSchema] = [],
+        json_output: Optional[bool] = None,
+        extra_create_args: Mapping[str, Any] = {},
+        cancellation_token: Optional[CancellationToken] = None,
+    ) -> CreateResult:
+        reply = self._reply(messages, tools, json_output)
+        usage = self._usage(messages, reply)
+        await self._wait(self._first_token_delay() + usage.completion_tokens / self.tokens_per_second, cancellation_token)
+        finish_reason = "stop" if isinstance(reply, str) else "function_calls"
+        return CreateResult(finish_reason=finish_reason, content=reply, usage=usage, cached=False)
+
+    async def create_stream(
+        self,
+        messages: Sequence[LLMMessage],
+        *,
+        tools: Sequence[Tool | ToolSchema] = [],
+        json_output: Optional[bool] = None,
+        extra_create_args: Mapping[str, Any] = {},
+        cancellation_token: Optional[CancellationToken] = None,
+    ) -> AsyncGenerator[Union[str, CreateResult], None]:
+        reply = self._reply(messages, tools, json_output)
+        usage = self._usage(messages, reply)
+        await self._wait(self._first_token_delay(), cancellation_token)
+        if isinstance(reply, str):
+            for i, word in enumerate(reply.split(" ")):
+                await self._wait(1 / self.tokens_per_second, cancellation_token)
+                # Chunks add up to exactly the final content, as a real model's do.
+                yield word if i == 0 else " " + word
+        finish_reason = "stop" if isinstance(reply, str) else "function_calls"
+        yield CreateResult(finish_reason=finish_reason, content=reply, usage=usage, cached=False)
+
+    async def close(self) -> None:
+        pass
+
+    def actual_usage(self) -> RequestUsage:
+        return self._actual_usage
+
+    def total_usage(self) -> RequestUsage:
+        return self._total_usage
+
+    def count_tokens(self, messages: Sequence[LLMMessage], *, tools: Sequence[Tool | ToolSchema] = []) -> int:
+        return sum(_tokens(_text(message)) for message in messages)
+
+    def remaining_tokens(self, messages: Sequence[LLMMessage], *, tools: Sequence[Tool | ToolSchema] = []) -> int:
+        return 128000 - self.count_tokens(messages, tools=tools)
+
+    @property
+    def capabilities(self) -> ModelCapabilities:  # type: ignore
+        return ModelCapabilities(vision=False, function_calling=True, json_output=True)  # type: ignore
+
+    @property
+    def model_info(self) -> ModelInfo:
+        return ModelInfo(
+            vision=False, function_calling=True, json_output=True, family="unknown", structured_output=True
+        )
+
+
+def _page(n: int, paragraphs: int) -> str:
+    generator = random.Random(n)
+    body = "\n".join(
+        "<p>" + " ".join(generator.choice(WORDS) for _ in range(60)).capitalize() + ".</p>"
+        for _ in range(paragraphs)
+    )
+    return (
+        f"<html><head><title>Page {n}</title></head><body>"
+        f"<nav><a href='/'>Home</a></nav><article><h1>Report {n}</h1>{body}</article>"
+        f"<footer>Copyright</footer></body></html>"
+    )
+
+
+@asynccontextmanager
+async def page_server(pages: int = 50, paragraphs: int = 20, latency: float = 0.05) -> AsyncIterator[str]:
+    """Serve `pages` canned HTML articles on a free local port; yields the base URL."""
+    html = [_page(n, paragraphs) for n in range(pages)]
+
+    async def handle(request: web.Request) -> web.Response:
+        await asyncio.sleep(latency)
+        n = int(request.match_info["n"])
+        if not 0 <= n < pages:
+            raise web.HTTPNotFound()
+        return web.Response(text=html[n], content_type="text/html")
+
+    app = web.Application()
+    app.router.add_get("/page/{n}", handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    await web.SockSite(runner, sock).start()
+    try:
+        yield f"http://127.0.0.1:{sock.getsockname()[1]}"
+    finally:
+        await runner.cleanup()
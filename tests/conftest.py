@@ -0,0 +1,26 @@
+import os
+import tempfile
+
+MODEL_CONFIG = """\
+models:
+  gpt-4o-mini:
+    provider: autogen_ext.models.openai.OpenAIChatCompletionClient
+    config:
+      model: gpt-4o-mini
+      api_key: test
+  o3-mini:
+    provider: autogen_ext.models.openai.OpenAIChatCompletionClient
+    config:
+      model: o3-mini
+      api_key: test
+"""
+
+# App modules open their databases, logs and model config at import time;
+# point them at a scratch directory before any test imports them.
+_scratch = tempfile.mkdtemp(prefix="chat-tests-")
+os.environ["DB_PATH"] = os.path.join(_scratch, "chat.db")
+os.environ["CACHE_PATH"] = os.path.join(_scratch, "cache.db")
+os.environ["INTENT_LOG_PATH"] = os.path.join(_scratch, "intent_log.jsonl")
+os.environ["MODEL_CONFIG_PATH"] = os.path.join(_scratch, "model_config.yaml")
+with open(os.environ["MODEL_CONFIG_PATH"], "w") as file:
+    file.write(MODEL_CONFIG)
@@ -0,0 +1,108 @@
+import asyncio
+import sqlite3
+
+from app.core.tools import cache as cache_module
+from app.core.tools.cache import ContentCache
+
+
+def page(size: int) -> dict:
+    return {"text": "x" * size}
+
+
+def accessed_at(path, key: str) -> float:
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute("SELECT accessed_at FROM entries WHERE key = ?", (key,)).fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_memory_and_disk_hits_are_counted(tmp_path):
+    async def run():
+        path = str(tmp_path / "cache.db")
+        cache = ContentCache(path)
+        assert await cache.get("page", "a") is None
+        await cache.set("page", "a", page(10), ttl=60)
+        assert await cache.get("page", "a") == page(10)
+
+        # A second worker only shares the disk tier.
+        other = ContentCache(path)
+        assert await other.get("page", "a") == page(10)
+        assert await other.get("page", "a") == page(10)
+        cache.close()
+        other.close()
+        return cache.stats(), other.stats()
+
+    first, second = asyncio.run(run())
+    assert first == {"page_misses": 1, "page_memory_hits": 1}
+    assert second == {"page_disk_hits": 1, "page_memory_hits": 1}
+
+
+def test_expired_entries_miss(tmp_path):
+    async def run():
+        cache = ContentCache(str(tmp_path / "cache.db"))
+        await cache.set("page", "a", page(10), ttl=-1)
+        value = await cache.get("page", "a")
+        cache.close()
+        return value
+
+    assert asyncio.run(run()) is None
+
+
+def test_memory_tier_is_bounded_by_bytes(tmp_path):
+    async def run():
+        cache = ContentCache(str(tmp_path / "cache.db"), memory_bytes=3000)
+        for key in "abc":
+            await cache.set("page", key, page(1000), ttl=60)
+        await cache.set("page", "huge", page(5000), ttl=60)
+        memory = set(key for _, key in cache._memory)
+        # Everything is still served, from disk when no longer in memory.
+        values = [await cache.get("page", key) for key in ("a", "huge")]
+        cache.close()
+        return memory, cache._memory.currsize, values
+
+    memory, currsize, values = asyncio.run(run())
+    assert memory == {"b", "c"}
+    assert currsize <= 3000
+    assert values == [page(1000), page(5000)]
+
+
+def test_disk_tier_evicts_least_recently_used(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache_module, "EVICT_EVERY", 4)
+
+    async def run():
+        cache = ContentCache(str(tmp_path / "cache.db"), max_bytes=3500)
+        for key in "abc":
+            await cache.set("page", key, page(1000), ttl=60)
+            await asyncio.sleep(0.01)
+        # "a" is hot in memory; that must count as a use on disk too.
+        assert await cache.get("page", "a") == page(1000)
+        await cache.set("page", "d", page(1000), ttl=60)
+
+        other = ContentCache(cache._path)
+        values = {key: await other.get("page", key) for key in "abcd"}
+        cache.close()
+        other.close()
+        return cache.stats(), values
+
+    stats, values = asyncio.run(run())
+    assert stats["evictions"] == 1
+    assert values["b"] is None
+    assert values["a"] == values["c"] == values["d"] == page(1000)
+
+
+def test_memory_hits_bump_disk_access_time(tmp_path):
+    async def run():
+        path = str(tmp_path / "cache.db")
+        cache = ContentCache(path)
+        await cache.set("page", "a", page(10), ttl=60)
+        before = accessed_at(path, "a")
+        await asyncio.sleep(0.01)
+        await cache.get("page", "a")
+        await cache.set("page", "b", page(10), ttl=60)
+        after = accessed_at(path, "a")
+        cache.close()
+        return before, after
+
+    before, after = asyncio.run(run())
+    assert after > before
@@ -0,0 +1,65 @@
+import asyncio
+
+from app.core.tools.channel import ToolResultChannel, current_channel, publish
+
+
+async def drain(channel: ToolResultChannel) -> list:
+    results = []
+    while not channel._results.empty():
+        results.append(await channel.get())
+        channel.done()
+    return results
+
+
+def test_results_are_delivered_in_publish_order():
+    async def run():
+        channel = ToolResultChannel()
+        channel.publish("web_search", 1)
+        channel.publish("other", 2)
+        channel.publish("web_search", 3)
+        return await drain(channel)
+
+    assert asyncio.run(run()) == [("web_search", 1), ("other", 2), ("web_search", 3)]
+
+
+def test_join_waits_until_every_result_is_handled():
+    async def run():
+        channel = ToolResultChannel()
+        channel.publish("web_search", 1)
+        joined = asyncio.ensure_future(channel.join())
+        await asyncio.sleep(0)
+        before = joined.done()
+        await channel.get()
+        channel.done()
+        await asyncio.wait_for(joined, 1)
+        return before
+
+    assert asyncio.run(run()) is False
+
+
+def test_publish_without_a_channel_is_a_no_op():
+    assert current_channel.get() is None
+    publish("web_search", 1)
+
+
+def test_tasks_spawned_during_a_turn_publish_to_its_channel():
+    async def tool(name, value):
+        await asyncio.sleep(0.01)
+        publish("web_search", (name, value))
+
+    async def turn(name):
+        channel = ToolResultChannel()
+        token = current_channel.set(channel)
+        try:
+            # Like the team's runtime, tool calls run in tasks of their own.
+            await asyncio.gather(*(asyncio.create_task(tool(name, i)) for i in range(2)))
+        finally:
+            current_channel.reset(token)
+        return [value for _, value in await drain(channel)]
+
+    async def run():
+        return await asyncio.gather(turn("a"), turn("b"))
+
+    a, b = asyncio.run(run())
+    assert sorted(a) == [("a", 0), ("a", 1)]
+    assert sorted(b) == [("b", 0), ("b", 1)]
@@ -0,0 +1,93 @@
+import asyncio
+import time
+
+import pytest
+from autogen_ext.models.replay import ReplayChatCompletionClient
+from fastapi.testclient import TestClient
+
+from app.core.agents.registry import model_clients
+
+MODEL_INFO = {"function_calling": True, "vision": False, "json_output": True, "family": "unknown", "structured_output": True}
+ROUTE_TO_CHAT = '{"intent": "question_answering", "model": "chat"}'
+
+
+class SlowClient(ReplayChatCompletionClient):
+    """Answers only after `delay` seconds, recording whether the call was cancelled first."""
+
+    def __init__(self, delay: float, **kwargs):
+        super().__init__(**kwargs)
+        self.delay = delay
+        self.cancelled = 0
+
+    async def create_stream(self, messages, *, cancellation_token=None, **kwargs):
+        wait = asyncio.ensure_future(asyncio.sleep(self.delay))
+        if cancellation_token is not None:
+            cancellation_token.link_future(wait)
+        try:
+            await wait
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        async for chunk in super().create_stream(messages, cancellation_token=cancellation_token, **kwargs):
+            yield chunk
+
+
+@pytest.fixture
+def chat_model(monkeypatch):
+    chat = SlowClient(delay=5, model_info=MODEL_INFO, chat_completions=["slow answer"] * 3)
+    clients = {
+        ("gpt-4o-mini", "IntentOutput"): ReplayChatCompletionClient(model_info=MODEL_INFO, chat_completions=[ROUTE_TO_CHAT] * 3),
+        ("gpt-4o-mini", None): chat,
+        ("o3-mini", None): ReplayChatCompletionClient(model_info=MODEL_INFO, chat_completions=["reasoned"] * 3),
+    }
+    monkeypatch.setattr(
+        model_clients,
+        "get",
+        lambda model, response_format=None: clients[(model, response_format.__name__ if response_format else None)],
+    )
+    return chat
+
+
+@pytest.fixture
+def client():
+    from app.main import app
+
+    with TestClient(app) as client:
+        yield client
+
+
+def wait_for(condition, timeout: float = 3) -> bool:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.02)
+    return True
+
+
+def test_stop_cancels_the_turn(client, chat_model):
+    with client.websocket_connect("/api/ws/chat?session_id=stop") as ws:
+        ws.send_json({"content": "what is the opr", "source": "user"})
+        assert ws.receive_json()["source"] == "user"
+        time.sleep(0.3)
+        started = time.monotonic()
+        ws.send_json({"type": "stop"})
+        frames = []
+        while not frames or frames[-1]["type"] != "UserInputRequestedEvent":
+            frames.append(ws.receive_json())
+
+    assert time.monotonic() - started < 2
+    assert [frame["type"] for frame in frames if frame["type"] != "TextMessage"] == ["cancelled", "UserInputRequestedEvent"]
+    assert not any(frame.get("content") == "slow answer" for frame in frames)
+    assert wait_for(lambda: chat_model.cancelled == 1)
+    history = client.get("/api/history?session_id=stop").json()["messages"]
+    assert "slow answer" not in [message["content"] for message in history]
+
+
+def test_disconnect_cancels_the_turn(client, chat_model):
+    with client.websocket_connect("/api/ws/chat?session_id=gone") as ws:
+        ws.send_json({"content": "what is the opr", "source": "user"})
+        assert ws.receive_json()["source"] == "user"
+        time.sleep(0.3)
+
+    assert wait_for(lambda: chat_model.cancelled == 1)
@@ -0,0 +1,36 @@
+from autogen_core import FunctionCall
+from autogen_core.models import AssistantMessage, FunctionExecutionResult, FunctionExecutionResultMessage, UserMessage
+
+from app.core.agents.context import _drop_stale_tool_outputs
+
+
+def _tool_round(call_id: str) -> list:
+    return [
+        AssistantMessage(content=[FunctionCall(id=call_id, name="get_relevant_web_pages", arguments="{}")], source="a"),
+        FunctionExecutionResultMessage(
+            content=[FunctionExecutionResult(call_id=call_id, name="get_relevant_web_pages", content="pages")]
+        ),
+    ]
+
+
+def test_drops_tool_round_once_answered():
+    question = UserMessage(content="what is opr", source="user")
+    answer = AssistantMessage(content="3%", source="a")
+    assert _drop_stale_tool_outputs([question, *_tool_round("1"), answer]) == [question, answer]
+
+
+def test_keeps_round_in_progress():
+    messages = [UserMessage(content="what is opr", source="user"), *_tool_round("1")]
+    assert _drop_stale_tool_outputs(messages) == messages
+
+
+def test_keeps_round_not_followed_by_an_answer():
+    messages = [UserMessage(content="what is opr", source="user"), *_tool_round("1"), UserMessage(content="stop", source="user")]
+    assert _drop_stale_tool_outputs(messages) == messages
+
+
+def test_drops_every_answered_round():
+    question = UserMessage(content="q", source="user")
+    first, second = AssistantMessage(content="a1", source="a"), AssistantMessage(content="a2", source="a")
+    messages = [question, *_tool_round("1"), first, question, *_tool_round("2"), second]
+    assert _drop_stale_tool_outputs(messages) == [question, first, question, second]
@@ -0,0 +1,69 @@
+import asyncio
+import time
+
+from app.api.chat import DeltaCoalescer
+
+
+class Recorder:
+    """Stands in for the websocket, recording each frame with when it was sent."""
+
+    def __init__(self):
+        self.start = time.monotonic()
+        self.frames = []
+
+    async def send_json(self, frame):
+        self.frames.append((round(time.monotonic() - self.start, 2), frame["source"], frame["content"]))
+
+
+def test_chunks_within_a_window_share_a_frame():
+    async def run():
+        recorder = Recorder()
+        deltas = DeltaCoalescer(recorder, interval=0.05, max_chars=1000)
+        for word in ("a", "b", "c"):
+            await deltas.add("chat", word)
+        await deltas.flush()
+        return recorder.frames
+
+    assert [frame[1:] for frame in asyncio.run(run())] == [("chat", "abc")]
+
+
+def test_size_and_source_changes_flush_early():
+    async def run():
+        recorder = Recorder()
+        deltas = DeltaCoalescer(recorder, interval=10, max_chars=4)
+        for source, content in (("chat", "ab"), ("chat", "cd"), ("chat", "e"), ("reasoning", "f")):
+            await deltas.add(source, content)
+        await deltas.flush()
+        return recorder.frames
+
+    assert [frame[1:] for frame in asyncio.run(run())] == [("chat", "abcd"), ("chat", "e"), ("reasoning", "f")]
+
+
+def test_stalled_stream_is_flushed_on_time():
+    async def run():
+        recorder = Recorder()
+        deltas = DeltaCoalescer(recorder, interval=0.05, max_chars=1000)
+        await deltas.add("chat", "a")
+        # No further chunk arrives for a while.
+        await asyncio.sleep(0.1)
+        frames = list(recorder.frames)
+        await deltas.add("chat", "b")
+        await deltas.flush()
+        return frames, recorder.frames
+
+    stalled, frames = asyncio.run(run())
+    assert len(stalled) == 1
+    assert stalled[0][0] <= 0.08
+    assert [frame[1:] for frame in frames] == [("chat", "a"), ("chat", "b")]
+
+
+def test_close_drops_the_buffer_and_timer():
+    async def run():
+        recorder = Recorder()
+        deltas = DeltaCoalescer(recorder, interval=0.02, max_chars=1000)
+        await deltas.add("chat", "a")
+        deltas.close()
+        await asyncio.sleep(0.05)
+        return recorder.frames
+
+    assert asyncio.run(run()) == []
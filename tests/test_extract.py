@@ -0,0 +1,56 @@
+import asyncio
+
+from app.core.tools.extract import Extractor, extract_main_content
+
+PARAGRAPH = "<p>" + "The central bank kept rates unchanged, citing inflation, growth and the ringgit. " * 4 + "</p>"
+
+
+def test_keeps_article_inside_a_boilerplate_named_wrapper():
+    html = (
+        '<html><body><div class="site layout--has-sidebar"><header>Site</header>'
+        f"<article><h1>Rates</h1>{PARAGRAPH}<div class=\"share-buttons\"><a href=\"#\">Share</a></div></article>"
+        '<div class="sidebar"><p>Popular posts</p></div></div></body></html>'
+    )
+    markdown = extract_main_content(html, 3000)
+    assert markdown.startswith("# Rates") and "central bank" in markdown
+    assert "Share" not in markdown and "Popular" not in markdown
+
+
+def test_keeps_content_block_with_a_boilerplate_class():
+    html = (
+        '<html><body><div class="menu"><a href="/">Home</a></div>'
+        f'<div id="content" class="post social-enabled">{PARAGRAPH}{PARAGRAPH}'
+        '<div class="related"><p>Related: another story</p></div></div>'
+        '<div class="comments"><p>Nice article, thanks</p></div></body></html>'
+    )
+    markdown = extract_main_content(html, 3000)
+    assert "central bank" in markdown
+    assert not any(text in markdown for text in ("Home", "Related", "Nice article"))
+
+
+def test_short_page_is_not_emptied():
+    html = '<div id="content" class="post social-enabled"><p>Short post.</p></div>'
+    assert extract_main_content(html, 100) == "Short post."
+
+
+def test_picks_the_paragraph_heavy_block_over_link_lists():
+    links = "".join(f'<p><a href="/{i}">A rather long headline linking to story number {i}, read more</a></p>' for i in range(10))
+    html = f'<html><body><div class="list">{links}</div><div class="story">{PARAGRAPH}{PARAGRAPH}</div></body></html>'
+    markdown = extract_main_content(html, 3000)
+    assert "central bank" in markdown and "headline" not in markdown
+
+
+def test_truncates_to_the_token_budget():
+    html = f"<article>{PARAGRAPH * 20}</article>"
+    assert len(extract_main_content(html, 50)) < len(extract_main_content(html, 3000))
+
+
+def test_extracts_in_the_process_pool():
+    async def run():
+        extractor = Extractor(max_workers=1)
+        try:
+            return await extractor.extract(f"<html><body><article>{PARAGRAPH}</article></body></html>")
+        finally:
+            extractor.shutdown()
+
+    assert "central bank" in asyncio.run(run())
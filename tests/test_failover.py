@@ -0,0 +1,51 @@
+import time
+
+from app.core.agents.failover import CircuitBreaker
+
+
+def test_opens_after_consecutive_failures():
+    breaker = CircuitBreaker(failures=3, cooldown=60)
+    for _ in range(2):
+        breaker.record_failure()
+    assert breaker.closed and breaker.allow()
+    breaker.record_failure()
+    assert not breaker.closed
+    assert not breaker.allow()
+
+
+def test_success_resets_the_count():
+    breaker = CircuitBreaker(failures=2, cooldown=60)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.closed
+
+
+def test_lets_one_probe_through_after_cooldown():
+    breaker = CircuitBreaker(failures=1, cooldown=0.01)
+    breaker.record_failure()
+    time.sleep(0.02)
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.closed and breaker.allow()
+
+
+def test_failed_probe_opens_the_circuit_again():
+    breaker = CircuitBreaker(failures=5, cooldown=0.01)
+    for _ in range(5):
+        breaker.record_failure()
+    time.sleep(0.02)
+    assert breaker.allow()
+    breaker.record_failure()
+    assert not breaker.closed
+    assert not breaker.allow()
+
+
+def test_released_probe_can_be_retried():
+    breaker = CircuitBreaker(failures=1, cooldown=0.01)
+    breaker.record_failure()
+    time.sleep(0.02)
+    assert breaker.allow()
+    breaker.release()
+    assert breaker.allow()
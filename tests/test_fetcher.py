@@ -0,0 +1,114 @@
+import asyncio
+
+from aiohttp import web
+
+from app.core.tools.fetcher import Fetcher
+
+
+async def _serve(handler):
+    app = web.Application()
+    app.router.add_get("/{name}", handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}"
+
+
+def test_concurrent_fetches_of_one_url_share_a_request():
+    async def run():
+        hits = []
+
+        async def handler(request):
+            hits.append(request.match_info["name"])
+            await asyncio.sleep(0.05)
+            return web.Response(text="<p>page</p>", content_type="text/html")
+
+        runner, base = await _serve(handler)
+        fetcher = Fetcher()
+        try:
+            bodies = await asyncio.gather(*(fetcher.fetch(f"{base}/a") for _ in range(5)), fetcher.fetch(f"{base}/b"))
+        finally:
+            await fetcher.close()
+            await runner.cleanup()
+        return hits, bodies
+
+    hits, bodies = asyncio.run(run())
+    assert sorted(hits) == ["a", "b"]
+    assert [page.body for page in bodies] == ["<p>page</p>"] * 6
+
+
+def test_one_caller_cancelling_does_not_cancel_the_others():
+    async def run():
+        async def handler(request):
+            await asyncio.sleep(0.05)
+            return web.Response(text="page")
+
+        runner, base = await _serve(handler)
+        fetcher = Fetcher()
+        try:
+            first = asyncio.create_task(fetcher.fetch(f"{base}/a"))
+            second = asyncio.create_task(fetcher.fetch(f"{base}/a"))
+            await asyncio.sleep(0.01)
+            first.cancel()
+            return (await second).body
+        finally:
+            await fetcher.close()
+            await runner.cleanup()
+
+    assert asyncio.run(run()) == "page"
+
+
+def test_body_is_capped():
+    async def run():
+        async def handler(request):
+            return web.Response(text="x" * 100_000)
+
+        runner, base = await _serve(handler)
+        fetcher = Fetcher(max_bytes=1000)
+        try:
+            return (await fetcher.fetch(f"{base}/big")).body
+        finally:
+            await fetcher.close()
+            await runner.cleanup()
+
+    assert asyncio.run(run()) == "x" * 1000
+
+
+def test_conditional_requests_revalidate():
+    async def run():
+        async def handler(request):
+            if request.headers.get("If-None-Match") == '"v1"':
+                return web.Response(status=304)
+            return web.Response(text="page", headers={"ETag": '"v1"'})
+
+        runner, base = await _serve(handler)
+        fetcher = Fetcher()
+        try:
+            fresh = await fetcher.fetch(f"{base}/a")
+            again = await fetcher.fetch(f"{base}/a", etag=fresh.etag)
+        finally:
+            await fetcher.close()
+            await runner.cleanup()
+        return fresh, again
+
+    fresh, again = asyncio.run(run())
+    assert (fresh.body, fresh.etag, fresh.not_modified) == ("page", '"v1"', False)
+    assert (again.body, again.etag, again.not_modified) == ("", '"v1"', True)
+
+
+def test_errors_return_none():
+    async def run():
+        async def handler(request):
+            return web.Response(status=404)
+
+        runner, base = await _serve(handler)
+        fetcher = Fetcher(timeout=1)
+        try:
+            return await fetcher.fetch(f"{base}/missing"), await fetcher.fetch("http://127.0.0.1:1/refused")
+        finally:
+            await fetcher.close()
+            await runner.cleanup()
+
+    assert asyncio.run(run()) == (None, None)
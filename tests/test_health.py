@@ -0,0 +1,53 @@
+import asyncio
+
+from fastapi.testclient import TestClient
+
+from app.core import lifecycle
+from app.core.lifecycle import WarmUpStatus, warm_up
+
+
+def test_warm_up_is_ready_once_every_step_succeeds(monkeypatch):
+    ran = []
+
+    async def step():
+        ran.append(1)
+
+    monkeypatch.setattr(lifecycle, "WARM_UP_STEPS", {"a": step, "b": step})
+    status = WarmUpStatus()
+    asyncio.run(warm_up(status))
+
+    assert len(ran) == 2
+    assert status.ready
+    assert status.seconds is not None
+    assert status.failed == []
+
+
+def test_failed_steps_keep_the_worker_unready(monkeypatch):
+    async def ok():
+        pass
+
+    async def broken():
+        raise RuntimeError("no database")
+
+    monkeypatch.setattr(lifecycle, "WARM_UP_STEPS", {"ok": ok, "databases": broken})
+    status = WarmUpStatus()
+    asyncio.run(warm_up(status))
+
+    assert not status.ready
+    assert status.failed == ["databases"]
+
+
+def test_health_reports_readiness(monkeypatch):
+    import app.main
+
+    with TestClient(app.main.app) as client:
+        monkeypatch.setattr(app.main, "warm_up_status", WarmUpStatus())
+        starting = client.get("/health")
+        monkeypatch.setattr(app.main, "warm_up_status", WarmUpStatus(seconds=1.5, failed=["extractor"]))
+        failed = client.get("/health")
+        monkeypatch.setattr(app.main, "warm_up_status", WarmUpStatus(ready=True, seconds=1.5))
+        ready = client.get("/health")
+
+    assert (starting.status_code, starting.json()) == (503, {"status": "starting"})
+    assert (failed.status_code, failed.json()) == (503, {"status": "failed", "failed": ["extractor"]})
+    assert (ready.status_code, ready.json()) == (200, {"status": "ok", "warm_up_seconds": 1.5})
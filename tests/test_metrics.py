@@ -0,0 +1,77 @@
+from fastapi.testclient import TestClient
+
+from app.core.metrics import MetricsRegistry, Trace, current_trace, span
+
+
+def test_counters_render_with_escaped_labels():
+    registry = MetricsRegistry()
+    tokens = registry.counter("tokens_total", "Tokens used.")
+    tokens.inc(3, client="gpt", kind="prompt")
+    tokens.inc(2, client="gpt", kind="prompt")
+    tokens.inc(client='say "hi"')
+
+    assert registry.render().splitlines() == [
+        "# HELP tokens_total Tokens used.",
+        "# TYPE tokens_total counter",
+        'tokens_total{client="gpt",kind="prompt"} 5.0',
+        'tokens_total{client="say \\"hi\\""} 1.0',
+    ]
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = MetricsRegistry()
+    latency = registry.histogram("latency_seconds", "Latency.", buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 2.0):
+        latency.observe(value, step="fetch")
+
+    assert registry.render().splitlines()[2:] == [
+        'latency_seconds_bucket{step="fetch",le="0.1"} 1',
+        'latency_seconds_bucket{step="fetch",le="1.0"} 2',
+        'latency_seconds_bucket{step="fetch",le="+Inf"} 3',
+        'latency_seconds_sum{step="fetch"} 2.55',
+        'latency_seconds_count{step="fetch"} 3',
+    ]
+
+
+def test_collected_stats_render_as_gauges():
+    registry = MetricsRegistry()
+    stats = {"hits": 1}
+    registry.collect("cache", "Cache stats.", lambda: stats)
+    stats["misses"] = 2
+
+    assert registry.render().splitlines() == [
+        "# HELP cache Cache stats.",
+        "# TYPE cache gauge",
+        'cache{stat="hits"} 1.0',
+        'cache{stat="misses"} 2.0',
+    ]
+
+
+def test_spans_are_recorded_in_the_current_trace():
+    trace = Trace("session")
+    token = current_trace.set(trace)
+    try:
+        with span("fetch", url="a") as attributes:
+            attributes["bytes"] = 10
+        with span("fetch"):
+            pass
+    finally:
+        current_trace.reset(token)
+
+    assert [(name, attributes) for name, _, _, attributes in trace.spans] == [
+        ("fetch", {"url": "a", "bytes": 10}),
+        ("fetch", {}),
+    ]
+    assert list(trace.breakdown()) == ["fetch"]
+
+
+def test_metrics_endpoint():
+    from app.main import app
+
+    with TestClient(app) as client:
+        response = client.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert "# TYPE kijang_turn_seconds histogram" in response.text
+    assert "# TYPE kijang_scheduler gauge" in response.text
@@ -0,0 +1,86 @@
+import asyncio
+import json
+
+import pytest
+
+from app.api.outbox import Outbox, SlowClient
+
+
+class Socket:
+    """Stands in for the websocket; sending blocks while `paused` is clear."""
+
+    def __init__(self):
+        self.sent = []
+        self.paused = asyncio.Event()
+        self.paused.set()
+
+    async def send_text(self, data):
+        await self.paused.wait()
+        self.sent.append(json.loads(data))
+
+
+def delta(content: str, source: str = "chat") -> dict:
+    return {"type": "delta", "source": source, "content": content}
+
+
+def test_frames_go_out_in_order():
+    async def run():
+        socket = Socket()
+        outbox = Outbox(socket)
+        for frame in ({"type": "TextMessage", "content": "q"}, delta("a"), {"type": "TextMessage", "content": "a"}):
+            await outbox.send_json(frame)
+        await outbox.close()
+        return socket.sent
+
+    assert [frame["type"] for frame in asyncio.run(run())] == ["TextMessage", "delta", "TextMessage"]
+
+
+def test_deltas_are_merged_while_the_client_catches_up():
+    async def run():
+        socket = Socket()
+        socket.paused.clear()
+        outbox = Outbox(socket)
+        await outbox.send_json(delta("a"))
+        # The writer has taken "a" and is blocked sending it.
+        await asyncio.sleep(0)
+        for frame in (delta("b"), delta("c"), delta("d", source="reasoning"), {"type": "TextMessage", "content": "x"}):
+            await outbox.send_json(frame)
+        socket.paused.set()
+        await outbox.close()
+        return socket.sent
+
+    assert asyncio.run(run()) == [
+        delta("a"),
+        delta("bc"),
+        delta("d", source="reasoning"),
+        {"type": "TextMessage", "content": "x"},
+    ]
+
+
+def test_slow_client_is_given_up_on():
+    async def run():
+        socket = Socket()
+        socket.paused.clear()
+        outbox = Outbox(socket, max_frames=2, send_timeout=0.05)
+        with pytest.raises(SlowClient):
+            for i in range(5):
+                await outbox.send_json({"type": "TextMessage", "content": str(i)})
+        await outbox.close(timeout=0)
+
+    asyncio.run(run())
+
+
+def test_send_errors_reach_the_sender():
+    class Broken(Socket):
+        async def send_text(self, data):
+            raise RuntimeError("socket closed")
+
+    async def run():
+        outbox = Outbox(Broken())
+        await outbox.send_json({"type": "TextMessage", "content": "a"})
+        await asyncio.sleep(0.01)
+        with pytest.raises(RuntimeError):
+            await outbox.send_json({"type": "TextMessage", "content": "b"})
+        await outbox.close(timeout=0)
+
+    asyncio.run(run())
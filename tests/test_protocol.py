@@ -0,0 +1,52 @@
+import json
+
+from app.api.protocol import CompactWireFormat
+
+
+def test_short_keys_and_empty_fields_left_out():
+    wire = CompactWireFormat(binary=False)
+    assert wire.compact({"type": "TextMessage", "source": "user", "content": "hi", "id": 7, "models_usage": None}) == {
+        "t": "m",
+        "s": "user",
+        "c": "hi",
+        "n": 7,
+    }
+    assert wire.compact({"type": "UserInputRequestedEvent", "source": "user", "content": ""}) == {"t": "i", "s": "user"}
+
+
+def test_final_message_matching_its_deltas_is_elided():
+    wire = CompactWireFormat(binary=False)
+    wire.compact({"type": "delta", "source": "a", "content": "Hello "})
+    wire.compact({"type": "delta", "source": "a", "content": "world"})
+    assert wire.compact({"type": "TextMessage", "source": "a", "content": "Hello world", "id": 3}) == {
+        "t": "m",
+        "s": "a",
+        "d": 1,
+        "n": 3,
+    }
+
+
+def test_final_message_differing_from_its_deltas_is_sent_in_full():
+    wire = CompactWireFormat(binary=False)
+    wire.compact({"type": "delta", "source": "a", "content": "Hello"})
+    assert wire.compact({"type": "TextMessage", "source": "a", "content": "Hello world"})["c"] == "Hello world"
+
+
+def test_other_frames_and_sources_end_the_run():
+    wire = CompactWireFormat(binary=False)
+    wire.compact({"type": "delta", "source": "a", "content": "x"})
+    wire.compact({"type": "WebPageContent", "source": "http://p", "content": "page"})
+    assert "d" not in wire.compact({"type": "TextMessage", "source": "a", "content": "x"})
+    wire.compact({"type": "delta", "source": "a", "content": "y"})
+    wire.compact({"type": "delta", "source": "b", "content": "z"})
+    assert wire.compact({"type": "TextMessage", "source": "b", "content": "z"}).get("d") == 1
+
+
+def test_encode_batches_and_merges_deltas():
+    wire = CompactWireFormat(binary=False)
+    frames = [
+        {"type": "delta", "source": "a", "content": "Hel"},
+        {"type": "delta", "source": "a", "content": "lo"},
+        {"type": "TextMessage", "source": "a", "content": "Hello", "id": 1},
+    ]
+    assert json.loads(wire.encode(frames)) == [{"t": "d", "s": "a", "c": "Hello"}, {"t": "m", "s": "a", "d": 1, "n": 1}]
@@ -0,0 +1,112 @@
+import asyncio
+import time
+
+import pytest
+
+from app.core.ratelimit import QuotaExceeded, TokenBucket, TokenQuotas, current_session
+
+
+def test_bursts_up_to_capacity():
+    async def run():
+        bucket = TokenBucket(rate=10, capacity=5)
+        started = time.monotonic()
+        for _ in range(5):
+            await bucket.acquire()
+        return time.monotonic() - started
+
+    assert asyncio.run(run()) < 0.05
+
+
+def test_waits_for_refill():
+    async def run():
+        bucket = TokenBucket(rate=100, capacity=1)
+        await bucket.acquire()
+        started = time.monotonic()
+        await bucket.acquire()
+        return time.monotonic() - started
+
+    assert 0.005 <= asyncio.run(run()) < 0.1
+
+
+def test_timeout_fails_early():
+    async def run():
+        bucket = TokenBucket(rate=1, capacity=1)
+        await bucket.acquire()
+        started = time.monotonic()
+        with pytest.raises(asyncio.TimeoutError):
+            # A token is a second away; waiting 0.5s can't get it, so don't wait at all.
+            await bucket.acquire(timeout=0.5)
+        return time.monotonic() - started
+
+    assert asyncio.run(run()) < 0.1
+
+
+def test_more_than_capacity_waits_for_a_full_bucket():
+    async def run():
+        bucket = TokenBucket(rate=1000, capacity=2)
+        await bucket.acquire(10, timeout=1)
+        return bucket.available
+
+    assert asyncio.run(run()) < 1
+
+
+def test_debit_goes_into_debt_and_refunds():
+    async def run():
+        bucket = TokenBucket(rate=1, capacity=10)
+        bucket.debit(15)
+        assert bucket.available < -4
+        bucket.debit(-100)
+        # Refunds never fill the bucket past its capacity.
+        assert bucket.available == 10
+
+    asyncio.run(run())
+
+
+def test_zero_timeout_succeeds_when_tokens_are_free():
+    async def run():
+        bucket = TokenBucket(rate=1, capacity=5)
+        taken = await bucket.acquire(2, timeout=0)
+        with pytest.raises(asyncio.TimeoutError):
+            await bucket.acquire(5, timeout=0)
+        return taken
+
+    assert asyncio.run(run()) == 2
+
+
+def test_acquire_returns_what_a_small_bucket_could_take():
+    async def run():
+        bucket = TokenBucket(rate=1000, capacity=2)
+        return await bucket.acquire(10)
+
+    assert asyncio.run(run()) == 2
+
+
+def test_oversized_calls_are_settled_against_what_was_taken():
+    async def run():
+        quotas = TokenQuotas(model_tpm=1000)
+        reserved = await quotas.acquire("gpt", 5000)
+        quotas.record("gpt", reserved, prompt_tokens=5000)
+        return reserved, quotas.model_usage()["gpt"]["available_tokens"]
+
+    reserved, available = asyncio.run(run())
+    assert reserved == {"model": 1000}
+    assert -4001 <= available <= -3990
+
+
+def test_rejected_calls_give_back_what_they_reserved():
+    async def run():
+        quotas = TokenQuotas(session_tpm=1000, model_tpm=100, max_wait=0)
+        token = current_session.set("s")
+        try:
+            reserved = await quotas.acquire("gpt", 80)
+            quotas.record("gpt", reserved, prompt_tokens=80)
+            # The model is now short; the session's share is refunded.
+            with pytest.raises(QuotaExceeded):
+                await quotas.acquire("gpt", 80)
+        finally:
+            current_session.reset(token)
+        return quotas.session_usage("s")["available_tokens"], quotas.stats()["model_rejected"]
+
+    available, rejected = asyncio.run(run())
+    assert 919 <= available <= 921
+    assert rejected == 1
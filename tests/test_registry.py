@@ -0,0 +1,73 @@
+import asyncio
+
+import pytest
+
+from app.core.agents.registry import TeamRegistry
+
+
+def test_reuses_built_team():
+    async def run():
+        built = []
+
+        async def factory(key):
+            built.append(key)
+            return object()
+
+        teams = TeamRegistry(factory)
+        assert await teams.get("s") is await teams.get("s")
+        assert built == ["s"]
+
+    asyncio.run(run())
+
+
+def test_evict_during_build_does_not_start_a_second_build():
+    async def run():
+        building, release = 0, asyncio.Event()
+        concurrent = []
+
+        async def factory(key):
+            nonlocal building
+            building += 1
+            concurrent.append(building)
+            await release.wait()
+            building -= 1
+            return object()
+
+        teams = TeamRegistry(factory)
+        first = asyncio.create_task(teams.get("s"))
+        await asyncio.sleep(0)
+        teams.evict("s")
+        second = asyncio.create_task(teams.get("s"))
+        await asyncio.sleep(0)
+        release.set()
+        await asyncio.gather(first, second)
+        assert max(concurrent) == 1
+
+    asyncio.run(run())
+
+
+def test_failed_build_drops_its_lock():
+    async def run():
+        async def factory(key):
+            raise RuntimeError("no state")
+
+        teams = TeamRegistry(factory)
+        with pytest.raises(RuntimeError):
+            await teams.get("s")
+        assert "s" not in teams._locks and "s" not in teams
+
+    asyncio.run(run())
+
+
+def test_capacity_evicts_least_recently_used():
+    async def run():
+        async def factory(key):
+            return object()
+
+        teams = TeamRegistry(factory, max_teams=2)
+        for key in ["a", "b", "a", "c"]:
+            await teams.get(key)
+        assert "b" not in teams and "a" in teams and "c" in teams and len(teams) == 2
+        assert set(teams._locks) == {"a", "c"}
+
+    asyncio.run(run())
@@ -0,0 +1,102 @@
+import asyncio
+
+import pytest
+
+from app.core import response_cache as response_cache_module
+from app.core.response_cache import ResponseCache, conversation_context
+from app.core.store import ChatStore
+from app.core.tools.cache import ContentCache
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    content_cache = ContentCache(str(tmp_path / "cache.db"))
+    monkeypatch.setattr(response_cache_module, "content_cache", content_cache)
+    yield ResponseCache(enabled=True)
+    content_cache.close()
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = ChatStore(str(tmp_path / "chat.db"))
+    yield store
+    store.close()
+
+
+def answer(content: str) -> dict:
+    return {"source": "chat_agent", "content": content}
+
+
+async def say(store: ChatStore, session_id: str, *contents: str) -> None:
+    for i, content in enumerate(contents):
+        source = "user" if i % 2 == 0 else "chat_agent"
+        await store.append_message(session_id, {"type": "TextMessage", "source": source, "content": content})
+
+
+def test_first_turns_are_shared_across_sessions(cache):
+    async def run():
+        await cache.set("What is the capital of France?", "chat", answer("Paris"))
+        return (
+            await cache.get("what is the capital of  france", "chat"),
+            await cache.get("What is the capital of France?", "reasoning"),
+            await cache.get("What is the capital of France?", None),
+        )
+
+    assert asyncio.run(run()) == (answer("Paris"), None, None)
+    assert cache.stats()["exact_hits"] == 1
+    assert cache.stats()["misses"] == 2
+
+
+def test_follow_up_in_another_session_misses(cache, store):
+    async def run():
+        await say(store, "a", "Should I visit Paris in winter?", "It is cold but quiet.")
+        await say(store, "b", "Is it safe to eat raw eggs?", "Mostly, if they are pasteurized.")
+        context_a = conversation_context(await store.get_messages("a"))
+        context_b = conversation_context(await store.get_messages("b"))
+        await cache.set("yes", "chat", answer("Then pack a warm coat."), context=context_a)
+        return (
+            await cache.get("yes", "chat", context_b),
+            await cache.get("yes", "chat", ""),
+            await cache.get("yes", "chat", context_a),
+        )
+
+    assert asyncio.run(run()) == (None, None, answer("Then pack a warm coat."))
+
+
+def test_same_earlier_turns_share_follow_ups(cache, store):
+    async def run():
+        for session_id in ("a", "b"):
+            await say(store, session_id, "What is 2 + 2?", "4")
+        await cache.set("and times 3?", "chat", answer("12"), context=conversation_context(await store.get_messages("a")))
+        return await cache.get("and times 3?", "chat", conversation_context(await store.get_messages("b")))
+
+    assert asyncio.run(run()) == answer("12")
+
+
+def test_conversation_context():
+    assert conversation_context([]) == ""
+    assert conversation_context([{"type": "ToolCallRequestEvent", "source": "a", "content": [{"id": "1"}]}]) == ""
+    turns = [{"source": "user", "content": "hi"}, {"source": "chat_agent", "content": "hello"}]
+    assert conversation_context(turns) == conversation_context([{"id": 1, **turns[0]}, {"id": 2, **turns[1]}])
+    assert conversation_context(turns) != conversation_context(turns[:1])
+
+
+def test_disabled_cache_is_a_no_op(cache):
+    cache.enabled = False
+
+    async def run():
+        await cache.set("What is the capital of France?", "chat", answer("Paris"))
+        return await cache.get("What is the capital of France?", "chat")
+
+    assert asyncio.run(run()) is None
+    assert cache.stats()["hit_rate"] == 0.0
+
+
+def test_invalidate_drops_first_turn_answers(cache):
+    async def run():
+        await cache.set("What is the capital of France?", "chat", answer("Paris"))
+        await cache.set("What is the capital of France?", "reasoning", answer("Paris."))
+        removed = await cache.invalidate("what is the capital of france")
+        return removed, await cache.get("What is the capital of France?", "chat")
+
+    assert asyncio.run(run()) == (2, None)
@@ -0,0 +1,70 @@
+import asyncio
+import json
+
+from app.core.agents.router import IntentRouter
+
+
+def make_router(tmp_path, **kwargs) -> IntentRouter:
+    return IntentRouter(log_path=str(tmp_path / "intents.jsonl"), **kwargs)
+
+
+def test_rules_route_obvious_turns(tmp_path):
+    async def run(router):
+        return [
+            router.route(text)
+            for text in (
+                "please switch to the reasoning model",
+                "```\nprint(1)\n```",
+                "Import duties on steel went up this year, why?",
+                "translate this into French: good morning",
+                "hello there!",
+            )
+        ]
+
+    decisions = asyncio.run(run(make_router(tmp_path)))
+    assert [(d.model, d.source) if d else None for d in decisions] == [
+        ("reasoning", "rules"),
+        ("reasoning", "rules"),
+        None,
+        ("chat", "rules"),
+        ("chat", "rules"),
+    ]
+
+
+def test_recorded_decisions_are_memoized_and_logged(tmp_path):
+    async def run(router):
+        router.record("What is the capital of France?", "question_answering", "chat")
+        await asyncio.gather(*router._background)
+        return router.route("what is the capital of   france")
+
+    router = make_router(tmp_path)
+    decision = asyncio.run(run(router))
+    assert (decision.intent, decision.model, decision.source) == ("question_answering", "chat", "memo")
+    logged = [json.loads(line) for line in open(router.log_path)]
+    assert logged == [{"text": "What is the capital of France?", "intent": "question_answering", "model": "chat"}]
+
+
+def test_short_and_anaphoric_turns_are_not_memoized(tmp_path):
+    async def run(router):
+        for text in ("yes", "go on", "What about yesterday's weather in Paris?", "explain that in more detail"):
+            router.record(text, "question_answering", "reasoning")
+        await asyncio.gather(*router._background)
+        return [router.route(text) for text in ("yes", "go on", "What about yesterday's weather in Paris?")]
+
+    assert asyncio.run(run(make_router(tmp_path))) == [None, None, None]
+
+
+def test_classifier_routes_once_trained(tmp_path):
+    examples = [("write a poem about the sea number %d" % i, "text_generation", "chat") for i in range(30)]
+    examples += [("prove that the sum of angles is %d degrees" % i, "question_answering", "reasoning") for i in range(30)]
+    with open(tmp_path / "intents.jsonl", "w") as file:
+        for text, intent, model in examples:
+            file.write(json.dumps({"text": text, "intent": intent, "model": model}) + "\n")
+
+    async def run(router):
+        assert router.route("please write a poem about the sea") is None
+        await router._training
+        return router.route("write a poem about the sea at night")
+
+    decision = asyncio.run(run(make_router(tmp_path, threshold=0.6)))
+    assert (decision.model, decision.source) == ("chat", "classifier")
@@ -0,0 +1,93 @@
+import asyncio
+
+import pytest
+
+from app.core.scheduler import ServerBusy, TurnScheduler
+
+
+def make_scheduler(**kwargs) -> TurnScheduler:
+    options = dict(max_turns=2, pool_sizes={"chat": 2, "reasoning": 1}, max_waiting=4, admit_timeout=0.05)
+    options.update(kwargs)
+    return TurnScheduler(**options)
+
+
+def test_admits_up_to_the_pool_size_and_sheds_the_rest():
+    async def run():
+        scheduler = make_scheduler()
+        async with scheduler.admit("reasoning"):
+            assert scheduler.stats()["reasoning_active"] == 1
+            with pytest.raises(ServerBusy):
+                async with scheduler.admit("reasoning"):
+                    pass
+            # The other pool still has room.
+            async with scheduler.admit("chat"):
+                pass
+        return scheduler.stats()
+
+    stats = asyncio.run(run())
+    assert stats["reasoning_admitted"] == 1
+    assert stats["reasoning_shed"] == 1
+    assert stats["chat_admitted"] == 1
+    assert stats["reasoning_active"] == stats["chat_active"] == 0
+
+
+def test_global_cap_applies_across_pools():
+    async def run():
+        scheduler = make_scheduler(max_turns=1)
+        async with scheduler.admit("chat"):
+            with pytest.raises(ServerBusy):
+                async with scheduler.admit("reasoning"):
+                    pass
+        # The shed turn gave its pool slot back.
+        async with scheduler.admit("reasoning"):
+            pass
+
+    asyncio.run(run())
+
+
+def test_waiting_turns_beyond_the_limit_are_shed_at_once():
+    async def run():
+        scheduler = make_scheduler(max_waiting=1, admit_timeout=1)
+        release = asyncio.Event()
+
+        async def turn():
+            async with scheduler.admit("reasoning"):
+                await release.wait()
+
+        holder = asyncio.create_task(turn())
+        await asyncio.sleep(0.01)
+        waiter = asyncio.create_task(turn())
+        await asyncio.sleep(0.01)
+        with pytest.raises(ServerBusy):
+            async with scheduler.admit("reasoning"):
+                pass
+        release.set()
+        await asyncio.gather(holder, waiter)
+        return scheduler.stats()
+
+    stats = asyncio.run(run())
+    assert (stats["reasoning_admitted"], stats["reasoning_shed"]) == (2, 1)
+
+
+def test_enter_moves_a_turn_to_another_pool():
+    async def run():
+        scheduler = make_scheduler()
+        async with scheduler.admit("chat"):
+            await scheduler.enter("reasoning")
+            during = scheduler.stats()
+            # Already there: a no-op.
+            await scheduler.enter("reasoning")
+        return during, scheduler.stats()
+
+    during, after = asyncio.run(run())
+    assert (during["chat_active"], during["reasoning_active"], during["chat_moved"]) == (0, 1, 1)
+    assert (after["chat_active"], after["reasoning_active"]) == (0, 0)
+
+
+def test_enter_outside_a_turn_does_nothing():
+    async def run():
+        scheduler = make_scheduler()
+        await scheduler.enter("reasoning")
+        return scheduler.stats()
+
+    assert asyncio.run(run()) == {"waiting": 0}
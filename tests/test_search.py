@@ -0,0 +1,88 @@
+import asyncio
+
+from app.core.tools.search import CachedSearch, StubSearchProvider, normalize_query
+
+
+class CountingProvider:
+    def __init__(self, fail: bool = False):
+        self.calls = []
+        self.fail = fail
+
+    async def search(self, query: str, num_results: int) -> list[str]:
+        self.calls.append(query)
+        await asyncio.sleep(0.01)
+        if self.fail:
+            raise RuntimeError("search down")
+        return [f"https://example.com/{query.replace(' ', '-')}/{i}" for i in range(num_results)]
+
+
+def test_normalize_query():
+    assert normalize_query("  What is   the OPR?? ") == "what is the opr"
+
+
+def test_repeated_and_concurrent_queries_share_one_call():
+    async def run():
+        provider = CountingProvider()
+        searcher = CachedSearch(provider)
+        results = await asyncio.gather(searcher.search("What is the OPR?"), searcher.search("what is the opr"))
+        results.append(await searcher.search("WHAT IS THE OPR"))
+        return provider.calls, results
+
+    calls, results = asyncio.run(run())
+    assert calls == ["what is the opr"]
+    assert results[0] == results[1] == results[2] and len(results[0]) == 3
+
+
+def test_result_count_is_part_of_the_key():
+    async def run():
+        provider = CountingProvider()
+        searcher = CachedSearch(provider)
+        return len(await searcher.search("opr", 1)), len(await searcher.search("opr", 3)), len(provider.calls)
+
+    assert asyncio.run(run()) == (1, 3, 2)
+
+
+def test_entries_expire():
+    async def run():
+        provider = CountingProvider()
+        searcher = CachedSearch(provider, ttl=0.05)
+        await searcher.search("opr")
+        await asyncio.sleep(0.1)
+        await searcher.search("opr")
+        return len(provider.calls)
+
+    assert asyncio.run(run()) == 2
+
+
+def test_failures_are_not_cached():
+    async def run():
+        provider = CountingProvider(fail=True)
+        searcher = CachedSearch(provider)
+        first = await searcher.search("opr")
+        provider.fail = False
+        return first, await searcher.search("opr")
+
+    first, second = asyncio.run(run())
+    assert first == [] and len(second) == 3
+
+
+def test_callers_get_their_own_copy():
+    async def run():
+        searcher = CachedSearch(StubSearchProvider(["https://a", "https://b"]))
+        (await searcher.search("opr")).clear()
+        return await searcher.search("opr")
+
+    assert asyncio.run(run()) == ["https://a", "https://b"]
+
+
+def test_stub_provider_spreads_queries_over_its_urls():
+    provider = StubSearchProvider([f"http://pages/{n}" for n in range(10)])
+
+    async def run():
+        return [await provider.search(f"query {i}", 3) for i in range(5)] + [await provider.search("query 0", 3)]
+
+    results = asyncio.run(run())
+    assert results[0] == results[-1]
+    assert all(len(urls) == 3 for urls in results)
+    assert len({urls[0] for urls in results}) > 1
+    assert asyncio.run(StubSearchProvider(["http://pages/0"]).search("q", 3)) == ["http://pages/0"]
@@ -0,0 +1,114 @@
+import asyncio
+
+from autogen_core.models import CreateResult, RequestUsage, SystemMessage, UserMessage
+
+from app.core.agents.clients import SpeculativeChatCompletionClient, speculation_counters
+
+
+class StubClient:
+    """Streams the words of a fixed answer with a small delay between chunks."""
+
+    def __init__(self, answer: str = "one two three", delay: float = 0.01):
+        self.words = answer.split()
+        self.delay = delay
+        self.calls = []
+
+    async def create_stream(self, messages, *, tools=[], json_output=None, extra_create_args={}, cancellation_token=None):
+        self.calls.append(messages)
+        for word in self.words:
+            await asyncio.sleep(self.delay)
+            yield word + " "
+        yield CreateResult(
+            finish_reason="stop",
+            content=" ".join(self.words),
+            usage=RequestUsage(prompt_tokens=10, completion_tokens=len(self.words)),
+            cached=False,
+        )
+
+    async def create(self, messages, **kwargs):
+        async for chunk in self.create_stream(messages, **kwargs):
+            result = chunk
+        return result
+
+
+PROMPT = [SystemMessage(content="be brief"), UserMessage(content="hi", source="user")]
+
+
+def prepare(messages):
+    async def _prepare():
+        return messages
+    return _prepare
+
+
+def counts(before):
+    return {key: value - before.get(key, 0) for key, value in speculation_counters.items() if value != before.get(key, 0)}
+
+
+def test_matching_call_replays_the_speculated_stream():
+    async def run():
+        stub = StubClient()
+        client = SpeculativeChatCompletionClient(stub)
+        client.speculate(prepare(PROMPT))
+        # Join while the speculative stream is still in flight.
+        await asyncio.sleep(0.015)
+        chunks = [chunk async for chunk in client.create_stream(list(PROMPT))]
+        return stub, chunks
+
+    before = dict(speculation_counters)
+    stub, chunks = asyncio.run(run())
+    assert len(stub.calls) == 1
+    assert chunks[:-1] == ["one ", "two ", "three "]
+    assert chunks[-1].content == "one two three"
+    assert counts(before) == {"started": 1, "hits": 1}
+
+
+def test_create_is_served_from_the_speculation():
+    async def run():
+        stub = StubClient()
+        client = SpeculativeChatCompletionClient(stub)
+        client.speculate(prepare(PROMPT))
+        return stub, await client.create(list(PROMPT))
+
+    stub, result = asyncio.run(run())
+    assert len(stub.calls) == 1
+    assert result.content == "one two three"
+
+
+def test_different_prompt_misses_and_cancels_the_speculation():
+    async def run():
+        stub = StubClient()
+        client = SpeculativeChatCompletionClient(stub)
+        client.speculate(prepare(PROMPT))
+        await asyncio.sleep(0.015)
+        other = [SystemMessage(content="be brief"), UserMessage(content="bye", source="user")]
+        result = await client.create(other)
+        return stub, result
+
+    before = dict(speculation_counters)
+    stub, result = asyncio.run(run())
+    assert [call[-1].content for call in stub.calls] == ["hi", "bye"]
+    assert result.content == "one two three"
+    delta = counts(before)
+    assert (delta["started"], delta["misses"]) == (1, 1)
+    assert delta["wasted_prompt_tokens"] > 0
+    assert "hits" not in delta
+
+
+def test_cancel_discards_the_speculation():
+    async def run():
+        stub = StubClient()
+        client = SpeculativeChatCompletionClient(stub)
+        client.speculate(prepare(PROMPT))
+        await asyncio.sleep(0.015)
+        task = client._speculation.task
+        client.cancel()
+        await asyncio.sleep(0)
+        result = await client.create(list(PROMPT))
+        return stub, task, result
+
+    before = dict(speculation_counters)
+    stub, task, result = asyncio.run(run())
+    assert task.cancelled()
+    assert len(stub.calls) == 2
+    assert result.content == "one two three"
+    assert counts(before)["cancelled"] == 1
@@ -0,0 +1,109 @@
+import asyncio
+
+import pytest
+
+from app.core.store import ChatStore, _fts_query
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = ChatStore(str(tmp_path / "chat.db"))
+    yield store
+    store.close()
+
+
+def _contents(messages: list) -> list:
+    return [message["content"] for message in messages]
+
+
+def test_appends_messages_in_order(store):
+    async def run():
+        ids = [await store.append_message("s", {"type": "TextMessage", "source": "user", "content": f"m{i}"}) for i in range(3)]
+        assert ids == sorted(ids)
+        return await store.get_messages("s")
+
+    assert _contents(asyncio.run(run())) == ["m0", "m1", "m2"]
+
+
+def test_sessions_are_kept_apart(store):
+    async def run():
+        await store.append_message("a", {"type": "TextMessage", "source": "user", "content": "for a"})
+        await store.append_message("b", {"type": "TextMessage", "source": "user", "content": "for b"})
+        await store.save_state("a", {"turn": "a"}, 0)
+        await store.clear("b")
+        return _contents(await store.get_messages("a")), await store.get_messages("b"), await store.load_state("a")
+
+    assert asyncio.run(run()) == (["for a"], [], ({"turn": "a"}, 1))
+
+
+def test_checkpoint_versions(store):
+    async def run():
+        assert await store.load_state("s") == (None, 0)
+        assert await store.save_state("s", {"turn": 1}, 0) == 1
+        assert await store.save_state("s", {"turn": 2}, 1) == 2
+        assert await store.state_version("s") == 2
+        return await store.load_state("s")
+
+    assert asyncio.run(run()) == ({"turn": 2}, 2)
+
+
+def test_concurrent_checkpoints_do_not_overwrite(store):
+    async def run():
+        await store.save_state("s", {"turn": 1}, 0)
+        # Two workers both loaded version 1; the second to save loses.
+        assert await store.save_state("s", {"turn": "worker a"}, 1) == 2
+        assert await store.save_state("s", {"turn": "worker b"}, 1) is None
+        # So does a worker whose first checkpoint races another's.
+        assert await store.save_state("s", {"turn": "worker c"}, 0) is None
+        return await store.load_state("s")
+
+    assert asyncio.run(run()) == ({"turn": "worker a"}, 2)
+
+
+def test_clear_invalidates_loaded_teams(store):
+    async def run():
+        await store.save_state("s", {"turn": 1}, 0)
+        await store.clear("s")
+        # A team loaded before the reset can't write its old state back.
+        assert await store.save_state("s", {"turn": 2}, 1) is None
+        return await store.get_messages("s"), await store.state_version("s")
+
+    assert asyncio.run(run()) == ([], 2)
+
+
+def test_get_messages_cursors(store):
+    async def run():
+        ids = [await store.append_message("s", {"type": "TextMessage", "source": "user", "content": f"m{i}"}) for i in range(5)]
+        await store.append_message("other", {"type": "TextMessage", "source": "user", "content": "elsewhere"})
+
+        everything = await store.get_messages("s")
+        assert _contents(everything) == ["m0", "m1", "m2", "m3", "m4"]
+        assert [message["id"] for message in everything] == ids
+        # The newest page first, then older pages before its first id; always in order.
+        assert _contents(await store.get_messages("s", limit=2)) == ["m3", "m4"]
+        assert _contents(await store.get_messages("s", before=ids[3], limit=2)) == ["m1", "m2"]
+        assert _contents(await store.get_messages("s", before=ids[1], limit=2)) == ["m0"]
+        assert await store.get_messages("s", before=ids[0]) == []
+        # Resuming after an id returns only what came later.
+        assert _contents(await store.get_messages("s", after=ids[2])) == ["m3", "m4"]
+        assert await store.get_messages("s", after=ids[-1]) == []
+        assert _contents(await store.get_messages("s", before=ids[4], after=ids[1])) == ["m2", "m3"]
+
+    asyncio.run(run())
+
+
+def test_fts_query_quotes_terms():
+    assert _fts_query("bank negara") == '"bank" "negara"'
+    assert _fts_query('say "hi"') == '"say" """hi"""'
+    assert _fts_query("  ") == ""
+
+
+def test_search_treats_query_syntax_as_text(store):
+    async def run():
+        await store.append_message("s", {"type": "TextMessage", "source": "user", "content": "OPR NEAR 3 percent"})
+        await store.append_message("other", {"type": "TextMessage", "source": "user", "content": "OPR elsewhere"})
+        for query in ["NEAR(", "opr OR", 'a"b', "col:umn", "-x*"]:
+            await store.search_messages("s", query)
+        return await store.search_messages("s", "opr near")
+
+    assert _contents(asyncio.run(run())) == ["OPR NEAR 3 percent"]
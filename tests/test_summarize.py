@@ -0,0 +1,92 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+from app.core.tools import summarize
+from app.core.tools.summarize import Summarizer, extractive_summary
+
+PAGE = (
+    "The city council met on Tuesday. "
+    "It approved a new budget for public parks and libraries. "
+    "Rainfall this spring was higher than usual across the region. "
+    "The parks budget grows by ten percent next year."
+)
+
+
+class StubClient:
+    def __init__(self, reply):
+        self.reply = reply
+        self.calls = []
+
+    async def create(self, messages, **kwargs):
+        self.calls.append(messages[0].content)
+        return SimpleNamespace(content=self.reply(messages[0].content))
+
+
+def test_extractive_summary_keeps_relevant_sentences_in_order():
+    summary = extractive_summary(PAGE, "parks budget", max_words=15)
+    assert summary == (
+        "It approved a new budget for public parks and libraries. "
+        "The parks budget grows by ten percent next year."
+    )
+
+
+def test_extractive_mode_makes_no_model_call(monkeypatch):
+    client = StubClient(lambda prompt: "{}")
+    monkeypatch.setattr(summarize.model_clients, "get", lambda model: client)
+    summarizer = Summarizer(mode="extractive")
+
+    summaries = asyncio.run(summarizer.summarize("parks budget", {"u1": PAGE}))
+
+    assert client.calls == []
+    assert "parks" in summaries["u1"]
+
+
+def test_batch_mode_packs_pages_into_one_call(monkeypatch):
+    reply = {"summaries": [{"id": 1, "summary": "first"}, {"id": 2, "summary": "second"}]}
+    client = StubClient(lambda prompt: json.dumps(reply))
+    monkeypatch.setattr(summarize.model_clients, "get", lambda model: client)
+    summarizer = Summarizer(mode="batch", batch_tokens=10_000)
+
+    summaries = asyncio.run(summarizer.summarize("parks", {"u1": PAGE, "u2": PAGE}))
+
+    assert len(client.calls) == 1
+    assert summaries == {"u1": "first", "u2": "second"}
+
+
+def test_batches_respect_the_token_budget(monkeypatch):
+    client = StubClient(lambda prompt: json.dumps({"summaries": [{"id": 1, "summary": "model"}]}))
+    monkeypatch.setattr(summarize.model_clients, "get", lambda model: client)
+    summarizer = Summarizer(mode="batch", batch_tokens=50)
+
+    summaries = asyncio.run(summarizer.summarize("parks", {"u1": PAGE, "u2": PAGE, "u3": PAGE}))
+
+    assert len(client.calls) == 3
+    assert summaries == {"u1": "model", "u2": "model", "u3": "model"}
+
+
+def test_pages_the_model_drops_fall_back_to_extractive(monkeypatch):
+    client = StubClient(lambda prompt: json.dumps({"summaries": [{"id": 2, "summary": "second"}]}))
+    monkeypatch.setattr(summarize.model_clients, "get", lambda model: client)
+    summarizer = Summarizer(mode="batch")
+
+    summaries = asyncio.run(summarizer.summarize("parks budget", {"u1": PAGE, "u2": PAGE}))
+
+    assert summaries["u2"] == "second"
+    assert summaries["u1"] == extractive_summary(PAGE, "parks budget")
+
+
+def test_pages_arriving_together_share_one_call(monkeypatch):
+    reply = {"summaries": [{"id": 1, "summary": "first"}, {"id": 2, "summary": "second"}]}
+    client = StubClient(lambda prompt: json.dumps(reply))
+    monkeypatch.setattr(summarize.model_clients, "get", lambda model: client)
+    summarizer = Summarizer(mode="batch", batch_tokens=10_000, batch_window=0.05)
+
+    async def run():
+        return await asyncio.gather(
+            summarizer.summarize_page("parks", "u1", PAGE),
+            summarizer.summarize_page("parks", "u2", PAGE),
+        )
+
+    assert asyncio.run(run()) == ["first", "second"]
+    assert len(client.calls) == 1
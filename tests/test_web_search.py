@@ -0,0 +1,41 @@
+import asyncio
+from typing import Optional
+
+from autogen_core import CancellationToken
+
+from app.core.tools import web_search
+from app.core.tools.channel import ToolResultChannel, current_channel
+from app.core.tools.web_search import WebPage
+
+
+def test_pages_past_the_deadline_are_left_out(monkeypatch):
+    delays = {"https://a.example": 0.03, "https://b.example": 5, "https://c.example": 0}
+
+    async def search(query, num_results):
+        return list(delays)
+
+    async def web_page(url: str, query: str, cancellation_token) -> Optional[WebPage]:
+        await asyncio.sleep(delays[url])
+        return WebPage(url=url, content=f"summary of {url}", timestamp=0)
+
+    monkeypatch.setattr(web_search.searcher, "search", search)
+    monkeypatch.setattr(web_search, "_web_page", web_page)
+    monkeypatch.setattr(web_search, "WEB_SEARCH_DEADLINE", 0.2)
+
+    async def run():
+        channel = ToolResultChannel()
+        token = current_channel.set(channel)
+        try:
+            pages = await web_search.get_relevant_web_pages("parks budget", CancellationToken())
+        finally:
+            current_channel.reset(token)
+        published = []
+        while not channel._results.empty():
+            published.append((await channel.get())[1].url)
+            channel.done()
+        return [page.url for page in pages], published
+
+    pages, published = asyncio.run(run())
+    # Search order, not completion order; the slow page is dropped.
+    assert pages == ["https://a.example", "https://c.example"]
+    assert published == ["https://c.example", "https://a.example"]